@@ -0,0 +1,75 @@
+"""
+Re-publishing an edited file: how much of it is new, with fixed-size vs.
+content-defined (FastCDC) chunks.
+
+Makes a pseudo-random source file, chunks it, then applies an edit (bytes
+inserted, or overwritten in place) and chunks it again; a chunk whose hash
+the first version lacks is one peers must download again. Chunking speed
+is reported for both modes.
+
+    python benchmarks/bench_cdc.py
+    python benchmarks/bench_cdc.py --size-mb 200 --edit-at 0.1 --edit-bytes 4096 --overwrite
+"""
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+from shared.chunker import write_chunks
+
+
+def chunk(path: Path, out: Path, chunking: str):
+    out.mkdir()
+    start = time.perf_counter()
+    chunks, _ = write_chunks(path, out, "bench", chunking=chunking)
+    elapsed = time.perf_counter() - start
+    shutil.rmtree(out)
+    return chunks, elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--size-mb", type=float, default=50.0)
+    ap.add_argument("--edit-at", type=float, default=0.05, help="position as a fraction of the file")
+    ap.add_argument("--edit-bytes", type=int, default=64 * 1024)
+    ap.add_argument("--overwrite", action="store_true", help="overwrite in place instead of inserting")
+    ap.add_argument("--dir", default=None, help="scratch directory (default: system temp)")
+    args = ap.parse_args()
+
+    scratch = Path(tempfile.mkdtemp(prefix="bench_cdc_", dir=args.dir))
+    try:
+        size = max(1, int(args.size_mb * 1024 ** 2))
+        rng = random.Random(0)
+        original = rng.randbytes(size)
+        at = int(size * args.edit_at)
+        edit = rng.randbytes(args.edit_bytes)
+        tail = original[at + len(edit):] if args.overwrite else original[at:]
+        v1, v2 = scratch / "v1.bin", scratch / "v2.bin"
+        v1.write_bytes(original)
+        v2.write_bytes(original[:at] + edit + tail)
+        print(f"{size / 1024 ** 2:.0f} MB, {args.edit_bytes} bytes "
+              f"{'overwritten' if args.overwrite else 'inserted'} at {at}")
+
+        row = "{:<8}{:>8}{:>12}{:>14}{:>10}"
+        print()
+        print(row.format("mode", "chunks", "new chunks", "new MB", "MB/s"))
+        for mode in ("fixed", "cdc"):
+            old, t1 = chunk(v1, scratch / "out", mode)
+            new, t2 = chunk(v2, scratch / "out", mode)
+            known = {c["hash"] for c in old}
+            fresh = [c for c in new if c["hash"] not in known]
+            rate = (v1.stat().st_size + v2.stat().st_size) / (t1 + t2) / 1e6
+            print(row.format(mode, len(new), len(fresh),
+                             f"{sum(c['size'] for c in fresh) / 1024 ** 2:.2f}", f"{rate:,.0f}"))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Memory / lookup benchmark for the tracker's chunk availability index.
+
+Compares the original Dict[str, Dict[int, Set[str]]] layout with the
+bitset-backed ChunkIndex at class scale (default: 500 peers, one
+10,000-chunk file, every peer holding a random half of the chunks).
+
+    python benchmarks/bench_chunk_index.py
+    python benchmarks/bench_chunk_index.py --peers 500 --chunks 10000 --fill 1.0
+"""
+import argparse
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR / "privileged_peer"))
+
+from chunk_index import ChunkIndex
+
+
+def peer_ids(n):
+    # Same shape as real ids: "peer_" + 16 hex chars
+    return [f"peer_{i:016x}" for i in range(n)]
+
+
+def holdings(peers, chunks, fill, seed=1):
+    rng = random.Random(seed)
+    k = int(chunks * fill)
+    return {pid: rng.sample(range(chunks), k) for pid in peers}
+
+
+def build_dict(held, stem):
+    locations = {}
+    for pid, indices in held.items():
+        file_map = locations.setdefault(stem, {})
+        for idx in indices:
+            file_map.setdefault(idx, set()).add(pid)
+    return locations
+
+
+def build_index(held, stem):
+    index = ChunkIndex()
+    for pid, indices in held.items():
+        index.add(stem, pid, indices)
+    return index
+
+
+def measure(build, *args):
+    """Build once untraced for timing, then again under tracemalloc for memory."""
+    gc.collect()
+    start = time.perf_counter()
+    obj = build(*args)
+    elapsed = time.perf_counter() - start
+    del obj
+    gc.collect()
+    tracemalloc.start()
+    obj = build(*args)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current, elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--peers", type=int, default=500)
+    ap.add_argument("--chunks", type=int, default=10_000)
+    ap.add_argument("--fill", type=float, default=0.5,
+                    help="fraction of chunks each peer holds")
+    ap.add_argument("--lookups", type=int, default=20_000)
+    args = ap.parse_args()
+
+    stem = "course_pack"
+    peers = peer_ids(args.peers)
+    held = holdings(peers, args.chunks, args.fill)
+    pairs = sum(len(v) for v in held.values())
+    print(f"{args.peers} peers x {args.chunks} chunks, fill {args.fill:.0%} "
+          f"-> {pairs:,} (chunk, peer) pairs\n")
+
+    rng = random.Random(2)
+    probe_chunks = [rng.randrange(args.chunks) for _ in range(args.lookups)]
+    probe_peers = [rng.choice(peers) for _ in range(200)]
+
+    locations, dict_mem, dict_build = measure(build_dict, held, stem)
+    start = time.perf_counter()
+    for idx in probe_chunks:
+        list(locations[stem].get(idx, ()))
+    dict_owner = (time.perf_counter() - start) / args.lookups
+    start = time.perf_counter()
+    for pid in probe_peers:
+        [idx for idx, owners in locations[stem].items() if pid in owners]
+    dict_held = (time.perf_counter() - start) / len(probe_peers)
+    del locations
+
+    index, idx_mem, idx_build = measure(build_index, held, stem)
+    start = time.perf_counter()
+    for idx in probe_chunks:
+        index.chunk_owners(stem, idx)
+    idx_owner = (time.perf_counter() - start) / args.lookups
+    start = time.perf_counter()
+    for pid in probe_peers:
+        index.chunks_of(stem, pid)
+    idx_held = (time.perf_counter() - start) / len(probe_peers)
+
+    row = "{:<22}{:>14}{:>12}{:>18}{:>18}"
+    print(row.format("layout", "memory", "build", "owners(chunk)", "chunks(peer)"))
+    print(row.format("dict of sets", f"{dict_mem / 2**20:.1f} MiB", f"{dict_build:.2f} s",
+                     f"{dict_owner * 1e6:.1f} us", f"{dict_held * 1e3:.2f} ms"))
+    print(row.format("ChunkIndex", f"{idx_mem / 2**20:.1f} MiB", f"{idx_build:.2f} s",
+                     f"{idx_owner * 1e6:.1f} us", f"{idx_held * 1e3:.2f} ms"))
+    print(f"\nmemory ratio: {dict_mem / max(idx_mem, 1):.0f}x smaller")
+
+
+if __name__ == "__main__":
+    main()
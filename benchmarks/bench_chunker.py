@@ -0,0 +1,100 @@
+"""
+Publishing throughput: the old serial read/hash/write chunker vs. the
+mmap-based chunker with its chunks hashed on 1..N threads.
+
+Writes one multi-GB source file to a scratch directory and chunks it once
+per configuration into a fresh output directory; the digests of every run
+are checked against the serial one. The page cache is warm after the first
+run; pass --drop-caches (root, Linux) to start every run cold.
+
+    python benchmarks/bench_chunker.py
+    python benchmarks/bench_chunker.py --size-gb 10 --workers 1 2 4 8 --dir /mnt/scratch
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+from shared.config import CHUNK_SIZE
+from shared.chunker import chunk_file
+
+
+def make_source(path: Path, size: int):
+    """Pseudo-random data (one random block, re-keyed per chunk)."""
+    block = os.urandom(CHUNK_SIZE)
+    with open(path, "wb") as f:
+        for i in range(0, size, CHUNK_SIZE):
+            f.write((i.to_bytes(8, "little") + block[8:])[:size - i])
+
+
+def legacy(file_path: Path, out_dir: Path):
+    """What chunk_file used to do: read, hash and write each chunk in turn."""
+    hashes = []
+    with open(file_path, "rb") as f:
+        index = 0
+        while True:
+            data = f.read(CHUNK_SIZE)
+            if not data:
+                break
+            hashes.append(hashlib.sha256(data).hexdigest())
+            with open(out_dir / f"{file_path.stem}_chunk_{index}", "wb") as cf:
+                cf.write(data)
+            index += 1
+    return hashes
+
+
+def drop_caches():
+    subprocess.run(["sync"])
+    Path("/proc/sys/vm/drop_caches").write_text("3\n")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--size-gb", type=float, default=2.0)
+    ap.add_argument("--workers", type=int, nargs="+",
+                    default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    ap.add_argument("--dir", default=None, help="scratch directory (default: system temp)")
+    ap.add_argument("--drop-caches", action="store_true")
+    args = ap.parse_args()
+
+    scratch = Path(tempfile.mkdtemp(prefix="bench_chunker_", dir=args.dir))
+    try:
+        size = max(1, int(args.size_gb * 1024 ** 3))
+        source = scratch / "source.bin"
+        print(f"Writing {size / 1024 ** 3:.1f} GB to {source} ({os.cpu_count()} CPUs) ...")
+        make_source(source, size)
+
+        runs = [("serial read loop", None)] + [(f"mmap, {n} threads", n) for n in args.workers]
+        row = "{:<20}{:>10}{:>10}"
+        print()
+        print(row.format("chunker", "seconds", "MB/s"))
+        expected = None
+        for name, workers in runs:
+            out = scratch / "chunks"
+            out.mkdir()
+            if args.drop_caches:
+                drop_caches()
+            start = time.perf_counter()
+            if workers is None:
+                hashes = legacy(source, out)
+            else:
+                hashes = [c["hash"] for c in chunk_file(source, out, workers=workers)["chunks"]]
+            elapsed = time.perf_counter() - start
+            expected = expected or hashes
+            note = "" if hashes == expected else "  DIGEST MISMATCH"
+            print(row.format(name, f"{elapsed:.2f}", f"{size / elapsed / 1e6:,.0f}") + note)
+            shutil.rmtree(out)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Chunk fetch throughput over loopback with and without keep-alive pooling.
+
+Serves throwaway chunks from a local peer server (peer_node/peer_server.py
+under uvicorn) and fetches them four ways: one blocking request per new
+connection, the blocking HTTPPool, and the AsyncHTTPPool used by downloads
+with keep-alive disabled and enabled. The chunks are written to
+storage/chunks and removed afterwards.
+
+    python benchmarks/bench_connection_pool.py
+    python benchmarks/bench_connection_pool.py --chunks 400 --concurrency 8
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+sys.path.append(str(BASE_DIR / "peer_node"))
+
+from shared.config import CHUNK_SIZE, HTTP_KEEPALIVE_TIMEOUT
+from http_pool import HTTPPool, AsyncHTTPPool
+
+FILE_STEM = "bench_pool"
+CHUNK_DIR = BASE_DIR / "storage" / "chunks"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int) -> subprocess.Popen:
+    env = dict(os.environ, PYTHONPATH=str(BASE_DIR))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "peer_server:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning",
+         "--timeout-keep-alive", str(HTTP_KEEPALIVE_TIMEOUT),
+         "--app-dir", str(BASE_DIR / "peer_node")],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return proc
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("peer server did not start")
+
+
+def fetch_unpooled(port: int, count: int, chunks: int) -> int:
+    ok = 0
+    for n in range(count):
+        r = requests.get(f"http://127.0.0.1:{port}/chunk/{FILE_STEM}/{n % chunks}")
+        ok += r.status_code == 200
+    return ok
+
+
+def fetch_pooled(port: int, count: int, chunks: int) -> int:
+    pool = HTTPPool()
+    ok = 0
+    for n in range(count):
+        r = pool.get(f"http://127.0.0.1:{port}/chunk/{FILE_STEM}/{n % chunks}")
+        ok += r.status_code == 200
+    pool.close()
+    return ok
+
+
+def fetch_async(port: int, count: int, chunks: int, concurrency: int, keepalive: bool) -> int:
+    async def run():
+        pool = AsyncHTTPPool(max_per_host=concurrency, keepalive=keepalive)
+        todo = iter(range(count))
+        ok = 0
+
+        async def worker():
+            nonlocal ok
+            for n in todo:
+                r = await pool.get("127.0.0.1", port, f"/chunk/{FILE_STEM}/{n % chunks}")
+                ok += r.status_code == 200
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        await pool.aclose()
+        return ok
+    return asyncio.run(run())
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    ok = fn(*args)
+    elapsed = time.perf_counter() - start
+    return ok / elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--chunks", type=int, default=200, help="requests per mode")
+    ap.add_argument("--distinct", type=int, default=16, help="distinct chunks on disk")
+    ap.add_argument("--concurrency", type=int, default=8, help="requests in flight (async modes)")
+    args = ap.parse_args()
+
+    CHUNK_DIR.mkdir(parents=True, exist_ok=True)
+    paths = [CHUNK_DIR / f"{FILE_STEM}_chunk_{i}" for i in range(args.distinct)]
+    for p in paths:
+        p.write_bytes(os.urandom(CHUNK_SIZE))
+
+    port = free_port()
+    proc = start_server(port)
+    try:
+        modes = [
+            ("new connection per chunk", fetch_unpooled, ()),
+            ("HTTPPool", fetch_pooled, ()),
+            (f"async x{args.concurrency}, no keep-alive", fetch_async, (args.concurrency, False)),
+            (f"async x{args.concurrency}, AsyncHTTPPool", fetch_async, (args.concurrency, True)),
+        ]
+        print(f"{args.chunks} fetches of {CHUNK_SIZE // 1024} KB per mode, "
+              f"{os.cpu_count()} CPUs\n")
+        row = "{:<36}{:>12}{:>12}"
+        print(row.format("mode", "chunks/s", "MB/s"))
+        for name, fn, extra in modes:
+            rate = timed(fn, port, args.chunks, args.distinct, *extra)
+            print(row.format(name, f"{rate:,.0f}", f"{rate * CHUNK_SIZE / 1e6:,.1f}"))
+    finally:
+        proc.terminate()
+        proc.wait(10)
+        for p in paths:
+            p.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
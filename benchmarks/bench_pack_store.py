@@ -0,0 +1,92 @@
+"""
+Chunk storage: one file per chunk vs. pack files with an offset index.
+
+Stores the same pseudo-random chunks both ways in a scratch directory, then
+reads them all back in random order (whole chunks, as the /chunk endpoints
+do) and times both. Reads hit the page cache after the writes; pass
+--drop-caches (root, Linux) to read cold.
+
+    python benchmarks/bench_pack_store.py
+    python benchmarks/bench_pack_store.py --chunks 40000 --chunk-kb 512 --dir /mnt/scratch
+"""
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+from shared.pack_store import PackStore
+
+
+def drop_caches():
+    subprocess.run(["sync"])
+    Path("/proc/sys/vm/drop_caches").write_text("3\n")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--chunks", type=int, default=4000)
+    ap.add_argument("--chunk-kb", type=int, default=64)
+    ap.add_argument("--dir", default=None, help="scratch directory (default: system temp)")
+    ap.add_argument("--drop-caches", action="store_true")
+    args = ap.parse_args()
+
+    scratch = Path(tempfile.mkdtemp(prefix="bench_pack_store_", dir=args.dir))
+    try:
+        block = os.urandom(args.chunk_kb * 1024)
+        chunks = [i.to_bytes(8, "little") + block[8:] for i in range(args.chunks)]
+        hashes = [hashlib.sha256(c).hexdigest() for c in chunks]
+        order = list(range(args.chunks))
+        random.Random(0).shuffle(order)
+        print(f"{args.chunks} chunks of {args.chunk_kb} KB")
+
+        files = scratch / "chunks"
+        files.mkdir()
+        packs = PackStore(scratch / "packs")
+
+        def write_files():
+            for i, c in enumerate(chunks):
+                (files / f"bench_chunk_{i}").write_bytes(c)
+
+        def write_packs():
+            for h, c in zip(hashes, chunks):
+                packs.put(h, c)
+            packs.close()
+
+        def read_files():
+            return [(files / f"bench_chunk_{i}").read_bytes() for i in order]
+
+        def read_packs():
+            reader = PackStore(scratch / "packs")   # a fresh process's view: index loaded on first miss
+            return [reader.read(hashes[i]) for i in order]
+
+        row = "{:<16}{:>12}{:>12}{:>10}"
+        print()
+        print(row.format("layout", "write s", "read s", "files"))
+        for name, write, read, where in (("file per chunk", write_files, read_files, files),
+                                         ("pack files", write_packs, read_packs, scratch / "packs")):
+            start = time.perf_counter()
+            write()
+            written = time.perf_counter() - start
+            if args.drop_caches:
+                drop_caches()
+            start = time.perf_counter()
+            data = read()
+            elapsed = time.perf_counter() - start
+            note = "" if all(data[k] == chunks[i] for k, i in enumerate(order)) else "  MISMATCH"
+            print(row.format(name, f"{written:.2f}", f"{elapsed:.2f}",
+                             sum(1 for _ in where.iterdir())) + note)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Reassembly throughput and peak memory: the old read()/write() loop vs. the
+reassembly engine with each copy method, with and without hash checks.
+
+Writes a multi-GB set of CHUNK_SIZE chunk files to a scratch directory, then
+reassembles them once per method, each in a fresh process so its peak RSS is
+its own. The page cache is warm after the first run; pass --drop-caches
+(root, Linux) to start every run cold.
+
+    python benchmarks/bench_reassembly.py
+    python benchmarks/bench_reassembly.py --size-gb 4 --dir /mnt/scratch
+"""
+import argparse
+import hashlib
+import multiprocessing as mp
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+sys.path.append(str(BASE_DIR / "peer_node"))
+
+from shared.config import CHUNK_SIZE
+from reassemble import reassemble_file
+
+
+def make_chunks(chunk_dir: Path, count: int):
+    """Chunk files of pseudo-random data (one random block, re-keyed per chunk)."""
+    block = os.urandom(CHUNK_SIZE)
+    hashes = []
+    for i in range(count):
+        data = i.to_bytes(8, "little") + block[8:]
+        (chunk_dir / f"bench_chunk_{i}").write_bytes(data)
+        hashes.append(hashlib.sha256(data).hexdigest())
+    return hashes
+
+
+def legacy(paths, out: Path):
+    """What PeerClient.reassemble used to do (minus the per-chunk prints)."""
+    with open(out, "wb") as outfile:
+        for p in paths:
+            with open(p, "rb") as infile:
+                outfile.write(infile.read())
+
+
+def run_one(method: str, verify: bool, paths, hashes, out: Path, results):
+    start = time.perf_counter()
+    if method == "read/write loop":
+        legacy(paths, out)
+    else:
+        reassemble_file(paths, out, chunk_hashes=hashes if verify else None,
+                        method=None if method == "auto" else method)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((elapsed, rss * (1 if sys.platform == "darwin" else 1024)))
+
+
+def drop_caches():
+    subprocess.run(["sync"])
+    Path("/proc/sys/vm/drop_caches").write_text("3\n")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--size-gb", type=float, default=2.0)
+    ap.add_argument("--dir", default=None, help="scratch directory (default: system temp)")
+    ap.add_argument("--drop-caches", action="store_true")
+    args = ap.parse_args()
+
+    methods = ["read/write loop", "buffered"]
+    methods += [m for m in ("sendfile", "copy_file_range") if hasattr(os, m)]
+    methods.append("auto")
+
+    scratch = Path(tempfile.mkdtemp(prefix="bench_reassembly_", dir=args.dir))
+    try:
+        count = max(1, int(args.size_gb * 1024 ** 3 // CHUNK_SIZE))
+        print(f"Writing {count} chunks ({count * CHUNK_SIZE / 1024 ** 3:.1f} GB) to {scratch} ...")
+        hashes = make_chunks(scratch, count)
+        paths = [scratch / f"bench_chunk_{i}" for i in range(count)]
+        out = scratch / "reassembled.bin"
+        total = count * CHUNK_SIZE
+
+        row = "{:<18}{:>8}{:>10}{:>10}{:>14}"
+        print()
+        print(row.format("method", "verify", "seconds", "MB/s", "peak RSS MB"))
+        ctx = mp.get_context("spawn")
+        runs = [(m, False) for m in methods] + [(m, True) for m in methods[1:]]
+        for method, verify in runs:
+            if args.drop_caches:
+                drop_caches()
+            results = ctx.Queue()
+            proc = ctx.Process(target=run_one,
+                               args=(method, verify, paths, hashes, out, results))
+            proc.start()
+            elapsed, rss = results.get()
+            proc.join()
+            print(row.format(method, "yes" if verify else "no", f"{elapsed:.2f}",
+                             f"{total / elapsed / 1e6:,.0f}", f"{rss / 1e6:,.1f}"))
+            out.unlink(missing_ok=True)
+        print("\nverify = every chunk's SHA-256 checked against the metadata while copying.")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Load test for the tracker: announce and owner-lookup throughput vs. worker count.
+
+Starts the tracker under uvicorn with the SQLite state backend (a throwaway
+database) and 1, 2, 4 ... workers, then drives it from several client
+processes, each acting as one joined peer. The tracker's side effects are
+the usual ones (storage/, TCP port 8001, UDP presence broadcast).
+
+    python benchmarks/bench_tracker_load.py
+    python benchmarks/bench_tracker_load.py --workers 1 2 4 8 --clients 16 --seconds 10
+"""
+import argparse
+import multiprocessing as mp
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+FILE_STEM = "bench_load"
+TOTAL_CHUNKS = 2000
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_tracker(workers: int, port: int, db: Path) -> subprocess.Popen:
+    env = dict(os.environ, TRACKER_STATE_BACKEND="sqlite", TRACKER_STATE_DB=str(db))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+         "--app-dir", str(BASE_DIR / "privileged_peer")],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/files", timeout=1)
+            return proc
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("tracker did not start")
+
+
+def client(url: str, n: int, mode: str, seconds: float, start_at: float, results):
+    session = requests.Session()
+    peer_id = f"bench_{mode}_{n}_{os.getpid()}"
+    token = session.post(f"{url}/join", json={"peer_id": peer_id, "host": "127.0.0.1",
+                                             "port": 1}).json()["token"]
+    auth = {"peer_id": peer_id, "token": token}
+    rng = random.Random(n)
+    time.sleep(max(0.0, start_at - time.time()))
+    done, end = 0, start_at + seconds
+    while time.time() < end:
+        if mode == "announce":
+            first = rng.randrange(TOTAL_CHUNKS - 8)
+            r = session.post(f"{url}/announce_chunks", params=auth,
+                             json={"file_stem": FILE_STEM, "ranges": [[first, first + 8]]})
+        else:
+            r = session.get(f"{url}/peers/{FILE_STEM}/{rng.randrange(TOTAL_CHUNKS)}", params=auth)
+        if r.status_code == 200:
+            done += 1
+    results.put(done)
+
+
+def run(url: str, mode: str, clients: int, seconds: float) -> float:
+    results = mp.Queue()
+    start_at = time.time() + 2   # let every client join first
+    procs = [mp.Process(target=client, args=(url, n, mode, seconds, start_at, results))
+             for n in range(clients)]
+    for p in procs:
+        p.start()
+    total = sum(results.get() for _ in procs)
+    for p in procs:
+        p.join()
+    return total / seconds
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--clients", type=int, default=8)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    args = ap.parse_args()
+
+    print(f"{args.clients} client processes, {args.seconds:.0f} s per phase, "
+          f"{os.cpu_count()} CPUs\n")
+    row = "{:>8}{:>16}{:>16}"
+    print(row.format("workers", "announce/s", "lookup/s"))
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            port = free_port()
+            proc = start_tracker(workers, port, Path(tmp) / "tracker.db")
+            try:
+                url = f"http://127.0.0.1:{port}"
+                announce = run(url, "announce", args.clients, args.seconds)
+                lookup = run(url, "lookup", args.clients, args.seconds)
+            finally:
+                proc.terminate()
+                proc.wait(10)
+        print(row.format(workers, f"{announce:,.0f}", f"{lookup:,.0f}"))
+
+
+if __name__ == "__main__":
+    main()
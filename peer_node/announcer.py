@@ -0,0 +1,97 @@
+import threading
+import time
+import logging
+from typing import Callable, Dict, Set
+
+from shared.bitfield import indices_to_ranges
+from shared.config import ANNOUNCE_WINDOW, ANNOUNCE_BACKOFF_MAX
+
+# What send() made of a batch
+SENT = "sent"
+RETRY = "retry"     # tracker unreachable or failing: send it again later
+DROP = "drop"       # tracker refused it (unknown file, bad ranges): retrying won't help
+
+
+class ChunkAnnouncer:
+    """
+    Coalesces chunk announcements before they reach the tracker.
+
+    Chunks verified within ANNOUNCE_WINDOW seconds of each other are sent as a
+    single POST /announce_chunks carrying index ranges. A peer that holds a
+    whole file registers once as a seed instead of listing every chunk.
+
+    `send(file_stem, payload)` performs the actual request and returns SENT,
+    RETRY or DROP. Batches to retry are re-queued and sent again after a
+    delay that doubles with each failed flush, up to ANNOUNCE_BACKOFF_MAX;
+    dropped ones are logged and forgotten.
+    """
+
+    def __init__(self, send: Callable[[str, dict], str], window: float = ANNOUNCE_WINDOW):
+        self.send = send
+        self.window = window
+        self.pending: Dict[str, Set[int]] = {}
+        self.complete: Set[str] = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def announce(self, file_stem: str, chunk_index: int):
+        with self.lock:
+            if file_stem in self.complete:
+                return
+            self.pending.setdefault(file_stem, set()).add(chunk_index)
+        self.wakeup.set()
+
+    def announce_complete(self, file_stem: str):
+        with self.lock:
+            self.complete.add(file_stem)
+            self.pending.pop(file_stem, None)
+        self.wakeup.set()
+
+    def flush(self) -> bool:
+        """Send everything queued right now; False if some of it must be retried."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            complete, self.complete = self.complete, set()
+
+        failed = False
+        for file_stem in complete:
+            result = self.send(file_stem, {"file_stem": file_stem, "complete": True})
+            if result == RETRY:
+                failed = True
+                with self.lock:
+                    self.complete.add(file_stem)
+            elif result == DROP:
+                logging.warning(f"Tracker refused the announcement of {file_stem}; dropped")
+
+        for file_stem, indices in pending.items():
+            payload = {"file_stem": file_stem, "ranges": indices_to_ranges(indices)}
+            result = self.send(file_stem, payload)
+            if result == RETRY:
+                failed = True
+                with self.lock:
+                    if file_stem not in self.complete:
+                        self.pending.setdefault(file_stem, set()).update(indices)
+            elif result == DROP:
+                logging.warning(f"Tracker refused {len(indices)} chunk announcements "
+                                f"of {file_stem}; dropped")
+        return not failed
+
+    def _run(self):
+        delay = self.window
+        while True:
+            self.wakeup.wait()
+            # Let further announcements pile up for one window, then send them together
+            self.wakeup.clear()
+            time.sleep(delay)
+            try:
+                ok = self.flush()
+            except Exception as e:
+                logging.error(f"Announcer flush failed: {e}")
+                ok = True   # the batch is gone; nothing to retry
+            if ok:
+                delay = self.window
+            else:
+                # Retry what failed, backing off while the tracker stays down
+                delay = min(delay * 2, ANNOUNCE_BACKOFF_MAX)
+                self.wakeup.set()
@@ -12,6 +12,8 @@ from pydantic import BaseModel
 from typing import List, Dict, Optional
 
 from peer_client import PeerClient
+import piece_file
+import piece_state
 
 # Hack to allow importing from parent dir if run directly
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -19,7 +21,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 from shared.config import (
     CHUNK_SIZE, DEFAULT_TRACKER_PORT, get_lan_ip,
     find_available_port, sanitize_stem,
-    PeerInfo, ChunkLocation, FileMetadata, ChunkData
+    PeerInfo, ChunkLocation, FileMetadata, ChunkData,
+    CATALOG_PAGE_SIZE, CATALOG_MIME_FILTERS, CATALOG_SORTS
 )
 
 
@@ -81,6 +84,9 @@ if not client.token:
         if client.join_network():
             st.toast("Connected!")
             st.rerun()
+elif st.sidebar.button("Leave Network", help="Stop advertising local chunks to other peers"):
+    client.leave_network()
+    st.rerun()
 
 st.sidebar.divider()
 bootstrap_input = st.sidebar.text_input(
@@ -144,21 +150,29 @@ if st.sidebar.button("🔄 Refresh Cluster"):
 st.header("Network Library")
 
 with st.expander("Browse & Download", expanded=True):
-    # Search
-    search_query = st.text_input("🔍 Search Files", placeholder="Type name to filter...")
+    # Search, filter and sort run on the tracker; we only fetch one page
+    c_search, c_type, c_sort = st.columns([3, 2, 2])
+    with c_search:
+        search_query = st.text_input("🔍 Search Files", placeholder="Type name to filter...")
+    with c_type:
+        mime_label = st.selectbox("Type", list(CATALOG_MIME_FILTERS))
+    with c_sort:
+        sort_label = st.selectbox("Sort by", list(CATALOG_SORTS))
+    filters = {"q": search_query, "mime": CATALOG_MIME_FILTERS[mime_label],
+               "sort": CATALOG_SORTS[sort_label]}
+
+    # Cursor of every page visited so far; new filters start again at page 1
+    if st.session_state.get("lib_filters") != filters:
+        st.session_state.lib_filters = filters
+        st.session_state.lib_cursors = [""]
+    cursors = st.session_state.lib_cursors
 
     if st.button("Refresh Library"):
         st.rerun()
         
-    network_files = client.list_files()
-    if network_files:
-        # Filter
-        filtered = [f for f in network_files if search_query.lower() in f['name'].lower()]
-        
-        if not filtered:
-            st.info("No files match your search.")
-            
-        for f in filtered:
+    page = client.list_files_page(cursor=cursors[-1], **filters)
+    if page and page["items"]:
+        for f in page["items"]:
             with st.container(border=True):
                 c1, c2, c3 = st.columns([3, 2, 2])
                 with c1:
@@ -198,6 +212,21 @@ with st.expander("Browse & Download", expanded=True):
                                     st.success("Sent!")
                                 else:
                                     st.error(msg)
+
+        p_prev, p_info, p_next = st.columns([1, 2, 1])
+        with p_prev:
+            if st.button("◀ Previous", key="lib_prev", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+        with p_info:
+            pages = max(1, -(-page["total"] // CATALOG_PAGE_SIZE))
+            st.caption(f"Page {len(cursors)} of {pages} · {page['total']} files")
+        with p_next:
+            if st.button("Next ▶", key="lib_next", disabled=not page["next_cursor"]):
+                cursors.append(page["next_cursor"])
+                st.rerun()
+    elif page and (search_query or filters["mime"]):
+        st.info("No files match your search.")
     else:
         st.info("Library is empty. (Check connection or wait for uploads)")
 
@@ -318,8 +347,12 @@ if meta_dir.exists():
                  chunk_dir = BASE_DIR / "storage" / "received_chunks"
                  have_count = 0
                  for i in range(total):
-                     if (chunk_dir / f"{stem}_chunk_{i}").exists():
+                     if client.has_chunk(stem, i):
                          have_count += 1
+                 # Downloads written in place keep no chunk files
+                 piece = piece_file.lookup(stem)
+                 if piece is not None:
+                     have_count = max(have_count, len(piece.have))
                  
                  # Check if final download exists
                  download_dir = BASE_DIR / "storage" / "downloads"
@@ -344,6 +377,14 @@ if meta_dir.exists():
                          else:
                              st.warning(f"Incomplete ({have_count}/{total})")
                      with c3:
+                         if st.button("Recheck", key=f"chk_{stem}",
+                                      help="Re-hash every local chunk and fetch any that are damaged"):
+                             with st.spinner("Rechecking..."):
+                                 res_check = client.recheck_file(stem)
+                             if "complete" in res_check:
+                                 st.toast(f"{original_name}: all chunks verified")
+                             else:
+                                 st.warning(res_check)
                          if st.button("Delete", key=f"del_{stem}", type="primary"):
                              # Delete all traces
                              try:
@@ -352,9 +393,16 @@ if meta_dir.exists():
                                  # 2. Received Chunks
                                  for p in chunk_dir.glob(f"{stem}_chunk_*"):
                                      p.unlink()
+                                 # Stored chunks no other file uses
+                                 client.chunk_store.release(stem)
                                  # 3. Final File (Optional? Let's do it to clean up)
+                                 piece_file.discard(stem)
+                                 piece_state.remove(stem)
                                  if final_path.exists():
                                      final_path.unlink()
+                                 part_path = final_path.with_name(final_path.name + piece_file.PART_SUFFIX)
+                                 if part_path.exists():
+                                     part_path.unlink()
                                  # 4. Standard Chunks (if we acted as uploader?)
                                  # Careful, maybe we shouldn't delete if we are the uploader of this file?
                                  # For this task, we assume 'My Received Files' targets things we downloaded/received.
@@ -375,13 +423,15 @@ else:
 
 st.divider()
 st.subheader("My Received Chunks (Raw)")
-# Just scan directory to show what we have
+# Downloaded chunks live in the chunk store's pack files
+packs = client.chunk_store.packs.stats()
+st.write(f"Total Chunks Stored: {packs['objects']} in {packs['packs']} pack file(s), "
+         f"{packs['live_bytes'] / 1024 ** 2:.1f} of {packs['total_bytes'] / 1024 ** 2:.1f} MB live")
+# Chunk files pushed over TCP or not yet migrated (shared/migrate_chunks.py)
 chunk_dir = BASE_DIR / "storage" / "received_chunks"
 if chunk_dir.exists():
     chunks = list(chunk_dir.glob("*_chunk_*"))
-    st.write(f"Total Chunks Stored: {len(chunks)}")
     if chunks:
+        st.write(f"Loose chunk files: {len(chunks)}")
         with st.expander("View Chunks"):
             st.write([c.name for c in chunks])
-else:
-    st.write("No chunks received yet.")
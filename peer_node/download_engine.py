@@ -0,0 +1,772 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from shared.config import (
+    AVAILABILITY_TTL, DOWNLOAD_CONCURRENCY, CHUNK_STREAM_BUFFER, CHUNK_BLOCK_SIZE,
+    ENDGAME_CHUNKS, ENDGAME_FANOUT
+)
+from shared.chunk_store import ChunkStore
+from piece_file import PieceFile
+from piece_state import PieceState, fingerprint
+from scheduler import PeerScheduler, SchedulerTunables
+
+CHUNK_ATTEMPTS = 2   # a chunk whose owners all fail is retried once after an availability refresh
+TMP_SUFFIX = ".tmp"
+
+
+class _TempChunk:
+    """
+    A chunk being received into a temp file. Writes run in the thread pool;
+    the file is only closed once every write issued has returned, even if
+    the request that issued it was cancelled meanwhile.
+    """
+
+    def __init__(self, directory: Path, prefix: str):
+        fd, name = tempfile.mkstemp(prefix=prefix, suffix=TMP_SUFFIX, dir=directory)
+        self.fd = fd
+        self.path = Path(name)
+        self._writes: Set[asyncio.Future] = set()
+        # Only used where os.pwrite doesn't exist (Windows)
+        self._seek_lock = threading.Lock()
+
+    def write(self, data: bytes, offset: int, digest=None) -> asyncio.Future:
+        fut = asyncio.get_running_loop().run_in_executor(None, self._write, data, offset, digest)
+        self._writes.add(fut)
+        fut.add_done_callback(self._writes.discard)
+        return fut
+
+    def _write(self, data: bytes, offset: int, digest):
+        if digest is not None:
+            digest.update(data)
+        view = memoryview(data)
+        while view:
+            if hasattr(os, "pwrite"):
+                n = os.pwrite(self.fd, view, offset)
+            else:
+                with self._seek_lock:
+                    os.lseek(self.fd, offset, os.SEEK_SET)
+                    n = os.write(self.fd, view)
+            view, offset = view[n:], offset + n
+
+    async def flush(self):
+        """Wait for the writes issued so far (without cancelling them if we are)."""
+        if self._writes:
+            await asyncio.wait(set(self._writes))
+
+    def close(self, keep: bool):
+        """Close once idle; the file is deleted unless `keep`."""
+        def _close(_=None):
+            os.close(self.fd)
+            if not keep:
+                self.path.unlink(missing_ok=True)
+        if self._writes:
+            asyncio.gather(*self._writes, return_exceptions=True).add_done_callback(_close)
+        else:
+            _close()
+
+
+def _hash_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class _InFlight:
+    """Requests racing for one chunk."""
+    __slots__ = ("racers", "asking", "exhausted", "whole")
+
+    def __init__(self):
+        self.racers: Set[asyncio.Task] = set()
+        self.asking: Set[str] = set()    # peers currently being asked for it
+        self.exhausted = False           # a racer found no owner left to ask
+        self.whole = False               # blocks from several peers failed the hash
+
+
+class DownloadEngine:
+    """
+    asyncio downloader for the chunks of one file.
+
+    A fixed set of worker tasks on one event loop pull chunk indices (rarest
+    first) from a queue, so hundreds of requests can be in flight without a
+    thread each; tracker lookups and disk writes run in the default thread
+    pool. Verified chunks are committed to `chunk_dir`, or to an open
+    `piece_file` or `chunk_store` when given.
+
+    `client` is the PeerClient: its identity, latency cluster, availability
+    cache, announcer and keep-alive peer connections (`client.peer_pool`,
+    which must belong to the loop running the engine) are reused. cancel()
+    may be called from any thread.
+    """
+
+    def __init__(self, client, file_stem: str, metadata: dict, chunk_dir: Path,
+                 concurrency: int = DOWNLOAD_CONCURRENCY,
+                 tunables: Optional[SchedulerTunables] = None,
+                 piece_file: Optional[PieceFile] = None,
+                 piece_state: Optional[PieceState] = None,
+                 recheck: bool = False,
+                 block_size: int = CHUNK_BLOCK_SIZE,
+                 endgame_chunks: int = ENDGAME_CHUNKS,
+                 endgame_fanout: int = ENDGAME_FANOUT,
+                 chunk_store: Optional[ChunkStore] = None):
+        self.client = client
+        self.file_stem = file_stem
+        self.metadata = metadata
+        self.chunk_dir = chunk_dir
+        self.chunk_store = chunk_store
+        self.concurrency = concurrency
+        self.scheduler = PeerScheduler(tunables)
+        self.piece_file = piece_file
+        self.piece_state = piece_state
+        self.recheck = recheck
+        self.block_size = block_size
+        self.endgame_chunks = endgame_chunks
+        self.endgame_fanout = endgame_fanout
+        self.missing: List[int] = []
+        self.done = 0
+        self.duplicate_requests = 0   # end-game requests for chunks already in flight
+        self.local_copies = 0         # chunks copied from data already held, not fetched
+        self.total = metadata.get("total_chunks", 0)
+        self.started_at = self.finished_at = 0.0
+        self._in_flight: Dict[int, _InFlight] = {}
+        self._completed: Set[int] = set()
+        self._committing: Set[int] = set()   # claimed by the racer committing it
+        self._changed: Optional[asyncio.Event] = None
+        self._dead: Set[str] = set()
+        self._no_ranges: Set[str] = set()
+        self._refresh_lock: Optional[asyncio.Lock] = None
+        self._refreshed_at = 0.0
+        self._have_map = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._main: Optional[asyncio.Task] = None
+
+    # ── Control ───────────────────────────────────────────────
+    def cancel(self):
+        """Stop the download; chunks already stored are kept."""
+        if self._loop and self._main:
+            self._loop.call_soon_threadsafe(self._main.cancel)
+
+    async def run(self) -> List[int]:
+        """Fetch every chunk not already on disk; returns the indices still missing."""
+        self._loop = asyncio.get_running_loop()
+        self._main = asyncio.current_task()
+        self._refresh_lock = asyncio.Lock()
+        self._changed = asyncio.Event()
+        self.started_at = time.time()
+
+        total = self.metadata["total_chunks"]
+        await asyncio.to_thread(self._remove_stale_temps)
+        have = await asyncio.to_thread(self._verify_local, range(total))
+        for i in have:
+            self.client.announce_chunk(self.file_stem, i)
+        todo = [i for i in range(total) if i not in have]
+        self.done = len(have)
+        duplicates: List[int] = []
+        if self.chunk_store is not None and todo:
+            # Chunks held for other files need no transfer
+            copied = await asyncio.to_thread(self._copy_local, todo)
+            todo = [i for i in todo if i not in copied]
+            # Fetch one chunk per hash; the others are copied from it afterwards
+            first: Dict[str, int] = {}
+            chunks = self.metadata.get("chunks", [])
+            for i in todo:
+                if i < len(chunks) and first.setdefault(chunks[i]["hash"], i) != i:
+                    duplicates.append(i)
+            todo = [i for i in todo if i not in set(duplicates)]
+        await asyncio.to_thread(self._save_state)
+        if not todo:
+            await asyncio.to_thread(self._drop_stale_refs)
+            return []
+
+        # Prime the owner map once; workers read it from the client's cache
+        await self._refresh_availability(force=True)
+        order = await asyncio.to_thread(self.client.rarest_first, self.file_stem, todo)
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in order:
+            queue.put_nowait(i)
+
+        workers = [asyncio.create_task(self._worker(queue))
+                   for _ in range(min(self.concurrency, len(order)))]
+        try:
+            await asyncio.gather(*workers)
+            if duplicates:
+                copied = await asyncio.to_thread(self._copy_local, duplicates)
+                self.missing.extend(i for i in duplicates if i not in copied)
+        except asyncio.CancelledError:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            # Everything not fetched yet counts as missing
+            self.missing.extend(i for i in self._in_flight if i not in self._completed)
+            while not queue.empty():
+                self.missing.append(queue.get_nowait())
+            self.missing.extend(i for i in duplicates if i not in self._completed)
+            raise
+        finally:
+            self.finished_at = time.time()
+            self._save_state()
+            self._log_summary()
+        if not self.missing:
+            await asyncio.to_thread(self._drop_stale_refs)
+        return sorted(self.missing)
+
+    def stats(self) -> dict:
+        """Progress and per-peer scheduler state; callable from any thread."""
+        peers = self.scheduler.snapshot()
+        received = sum(p["bytes"] for p in peers.values())
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+        return {"file_stem": self.file_stem, "done": self.done, "total": self.total,
+                "missing": len(self.missing), "duplicate_requests": self.duplicate_requests,
+                "local_copies": self.local_copies,
+                "bytes": received, "elapsed": round(elapsed, 3),
+                "throughput_bps": round(received / elapsed) if elapsed > 0 else 0,
+                "peers": peers}
+
+    def _log_summary(self):
+        s = self.stats()
+        logging.info(f"{self.file_stem}: {s['done']}/{s['total']} chunks, "
+                     f"{s['bytes'] / 1e6:.1f} MB in {s['elapsed']:.1f} s "
+                     f"({s['throughput_bps'] / 1e6:.2f} MB/s) from {len(s['peers'])} peers, "
+                     f"{s['duplicate_requests']} end-game duplicates, "
+                     f"{s['local_copies']} chunks copied locally")
+        for pid, p in s["peers"].items():
+            logging.debug(f"  {pid}: {p}")
+
+    # ── Workers ───────────────────────────────────────────────
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            if not queue.empty():
+                await self._attempt(queue.get_nowait())
+                continue
+            if not self._in_flight:
+                return
+            i = self._endgame_pick()
+            if i is None:
+                # Nothing worth duplicating yet; wait for a chunk to finish
+                changed = self._changed
+                await changed.wait()
+                continue
+            self.duplicate_requests += 1
+            await self._attempt(i)
+
+    def _endgame_pick(self) -> Optional[int]:
+        """The in-flight chunk with the fewest racers, once the end game has begun."""
+        if len(self._in_flight) > self.endgame_chunks:
+            return None
+        candidates = [(len(f.racers), i) for i, f in self._in_flight.items()
+                      if not f.exhausted and len(f.racers) < self.endgame_fanout]
+        return min(candidates)[1] if candidates else None
+
+    async def _attempt(self, i: int):
+        """
+        One request for chunk i, racing any others for the same chunk. In the
+        end game (queue empty, at most `endgame_chunks` in flight) idle workers
+        race chunks still in flight from other owners, up to `endgame_fanout`
+        requests each; the first verified copy wins and the rest are
+        cancelled, so one stalled peer can't hold up the end of a download.
+        """
+        flight = self._in_flight.get(i)
+        if flight is None:
+            flight = self._in_flight[i] = _InFlight()
+        task = asyncio.create_task(self._fetch_chunk(i, flight))
+        flight.racers.add(task)
+        try:
+            # wait() rather than await: a racer cancelled because another won
+            # must not look like this worker being cancelled
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            flight.racers.discard(task)
+
+        ok = False
+        if not task.cancelled():
+            try:
+                ok = task.result()
+            except Exception as e:
+                logging.error(f"Chunk {i} of {self.file_stem} failed: {e}")
+        if ok and i not in self._completed:
+            self._completed.add(i)
+            self._committing.discard(i)
+            self.done += 1
+            for loser in flight.racers:
+                loser.cancel()
+        if i in self._completed or not flight.racers:
+            # Settled: won, or every request for it has failed
+            if self._in_flight.pop(i, None) is not None and i not in self._completed:
+                self.missing.append(i)
+        # Wake idle workers: the end game may have begun or freed a racer slot
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _fetch_chunk(self, i: int, flight: _InFlight) -> bool:
+        """
+        Fetch chunk i from its owners in the scheduler's order (best expected
+        completion time first; see scheduler.py), as parallel Range blocks
+        where it can and whole otherwise. A peer that refuses a connection or
+        times out is dropped for the rest of the download rather than retried
+        per chunk. True once the chunk is done.
+        """
+        if i >= len(self.metadata.get("chunks", [])):
+            logging.error(f"Chunk index {i} out of bounds for metadata chunks array.")
+            return False
+        expected = self.metadata["chunks"][i]["hash"]
+        blocks = self._blocks(i)
+        asked = 0
+        for attempt in range(CHUNK_ATTEMPTS):
+            if attempt:
+                # New owners may have announced since the map was fetched
+                await self._refresh_availability()
+            # Peers another racer is already waiting on are left to it
+            peers = [p for p in await self._sources(i) if p["peer_id"] not in flight.asking]
+            ranged = [p for p in peers if p["peer_id"] not in self._no_ranges]
+            if blocks and not flight.whole and len(ranged) >= 2:
+                asked += 1
+                tmp = await self._get_blocks(ranged[:len(blocks)], i, blocks, expected, flight)
+                if await self._settle(i, tmp):
+                    return True
+                # Fall back to whole chunks, one peer at a time
+                peers = [p for p in await self._sources(i) if p["peer_id"] not in flight.asking]
+            for peer in peers:
+                pid = peer["peer_id"]
+                if pid in flight.asking:
+                    continue
+                asked += 1
+                flight.asking.add(pid)
+                try:
+                    tmp = await self._request(peer, i, lambda r: self._receive(r, i, expected))
+                finally:
+                    flight.asking.discard(pid)
+                if await self._settle(i, tmp):
+                    return True
+        if not asked:
+            flight.exhausted = True
+        return False
+
+    async def _settle(self, i: int, tmp: Optional[Path]) -> bool:
+        """
+        Commit a verified chunk unless another racer has; True once chunk i is
+        done. The commit renames the temp file into `chunk_dir` or copies it
+        into the piece file, records the chunk in the chunk store's refs and
+        the piece state when given, and announces it.
+        """
+        try:
+            while i in self._committing and i not in self._completed:
+                # Another racer is committing it; wait to see if that lands
+                changed = self._changed
+                await changed.wait()
+            if i in self._completed:
+                return True
+            if tmp is None:
+                return False
+            # Claimed before the first await, so only one racer commits
+            self._committing.add(i)
+            verified, tmp = tmp, None   # _commit's now, even if cancelled mid-way
+            try:
+                await asyncio.to_thread(self._commit, i, verified)
+            except BaseException:
+                self._committing.discard(i)
+                raise
+            self.client.announce_chunk(self.file_stem, i)
+            return True
+        finally:
+            if tmp is not None:
+                tmp.unlink(missing_ok=True)
+
+    async def _get_blocks(self, peers: List[dict], i: int, blocks: List[Tuple[int, int]],
+                          expected: str, flight: _InFlight) -> Optional[Path]:
+        """
+        Fetch chunk i as byte ranges spread over `peers` into one temp file;
+        the temp file if the assembled chunk matches its hash. Each peer takes
+        the next unclaimed block as soon as it finishes one, so fast peers do
+        most of the work. A failed block goes back to the others; once none
+        is unclaimed, idle peers duplicate one still in flight, so a slow
+        peer holds up one block at most. A bad block shows only in the chunk
+        hash; the chunk is then fetched whole, as it is from peers that don't
+        answer Range requests.
+        """
+        todo = deque(blocks)
+        running: Dict[Tuple[int, int], Set[asyncio.Task]] = {}
+        received: Set[Tuple[int, int]] = set()
+        tmp = _TempChunk(self._tmp_dir(), self._tmp_prefix(i))
+        ok = False
+
+        async def pull(peer: dict):
+            while len(received) < len(blocks):
+                if todo:
+                    block = todo.popleft()
+                else:
+                    spare = [b for b, tasks in running.items() if len(tasks) == 1]
+                    if not spare:
+                        return
+                    block = spare[0]
+                task = asyncio.create_task(self._request(
+                    peer, i, lambda r, block=block: self._receive_block(r, block, tmp), block))
+                running.setdefault(block, set()).add(task)
+                try:
+                    await asyncio.wait({task})
+                except asyncio.CancelledError:
+                    task.cancel()
+                    raise
+                finally:
+                    running.get(block, set()).discard(task)
+                if not task.cancelled() and task.exception() is None and task.result():
+                    received.add(block)
+                    for other in running.pop(block, set()):
+                        other.cancel()
+                    continue
+                if block in received:
+                    continue   # lost a duplicate race
+                if not running.get(block):
+                    running.pop(block, None)
+                    todo.append(block)
+                return   # this peer failed a block; leave the rest to the others
+
+        for p in peers:
+            flight.asking.add(p["peer_id"])
+        workers = [asyncio.create_task(pull(p)) for p in peers]
+        try:
+            await asyncio.gather(*workers)
+            if len(received) == len(blocks):
+                await tmp.flush()
+                ok = await asyncio.to_thread(_hash_file, tmp.path) == expected
+                if not ok:
+                    # Some peer sent a bad block; find out which one whole chunks at a time
+                    flight.whole = True
+                    logging.warning(f"Chunk {i} of {self.file_stem}: blocks from "
+                                    f"{len(peers)} peers don't match its hash")
+            return tmp.path if ok else None
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            for p in peers:
+                flight.asking.discard(p["peer_id"])
+            tmp.close(keep=ok)
+
+    async def _sources(self, i: int) -> List[dict]:
+        """Owners of chunk i, best expected completion time first."""
+        if self._have_map:
+            owners = self.client.find_chunk_owners(self.file_stem, i, refresh=False)
+        else:
+            # Tracker without /availability: one blocking lookup per chunk
+            owners = await asyncio.to_thread(self.client.find_chunk_owners, self.file_stem, i)
+        peers = [p for p in owners
+                 if p["peer_id"] != self.client.peer_id and p["peer_id"] not in self._dead]
+        with self.client.cluster_lock:
+            latency = dict(self.client.cluster)
+        return self.scheduler.rank(peers, tiebreak=latency)
+
+    async def _request(self, peer: dict, i: int,
+                       handle: Callable[[httpx.Response], Awaitable[Tuple[int, object]]],
+                       block: Optional[Tuple[int, int]] = None):
+        """
+        GET chunk i, or the `block` byte range of it, from one peer within its
+        scheduler window. `handle` consumes the response and returns (bytes
+        received, result); a None result counts against the peer.
+        """
+        pid = peer["peer_id"]
+        path = f"/chunk/{self.file_stem}/{i}"
+        params = {"peer_id": self.client.peer_id, "token": self.client.token} \
+            if peer.get("type") == "tracker" else {}
+        headers = {"Range": f"bytes={block[0]}-{block[1] - 1}"} if block else None
+        await self.scheduler.acquire(pid)
+        outcome = (0, 0.0, None)
+        try:
+            if pid in self._dead:
+                return None
+            start = time.monotonic()
+            try:
+                async with self.client.peer_pool.stream("GET", peer["host"], peer["port"], path,
+                                                        params=params, headers=headers) as r:
+                    if block and r.status_code == 200:
+                        # Ignored the Range header (a peer from before ranges):
+                        # not its fault, but ask it for whole chunks from now on
+                        self._no_ranges.add(pid)
+                        return None
+                    received, result = await handle(r)
+            except (httpx.ConnectError, httpx.TimeoutException):
+                outcome = (0, 0.0, False)
+                if pid not in self._dead:
+                    self._dead.add(pid)
+                    if peer.get("type") != "tracker":
+                        self.client.report_unreachable(pid)
+                return None
+            except httpx.HTTPError:
+                outcome = (0, 0.0, False)
+                return None
+            # A corrupt or oversized body counts against the peer like an error
+            outcome = (received, time.monotonic() - start, result is not None)
+            return result
+        finally:
+            # An end-game loser cancelled mid-request leaves no sample
+            self.scheduler.release(pid, *outcome)
+
+    async def _receive(self, r: httpx.Response, i: int,
+                       expected: str) -> Tuple[int, Optional[Path]]:
+        """
+        Stream a whole-chunk response into a new temp file, hashing it as it
+        arrives, so at most two CHUNK_STREAM_BUFFER blocks are held whatever
+        the chunk size; a body running past the chunk's size is cut off.
+        Returns the bytes received and the temp file if the body is chunk i,
+        else None.
+        """
+        if r.status_code != 200:
+            return 0, None
+        size = self.metadata["chunks"][i].get("size")
+        declared = r.headers.get("content-length")
+        if declared is not None and declared.isdigit():
+            if size is None:
+                size = int(declared)
+            elif int(declared) != size:
+                logging.warning(f"Chunk {i} of {self.file_stem}: peer sent {declared} bytes "
+                                f"for a {size} byte chunk")
+                return 0, None
+
+        tmp = _TempChunk(self._tmp_dir(), self._tmp_prefix(i))
+        digest = hashlib.sha256()
+        ok = False
+        try:
+            received = await self._stream_into(r, tmp, 0, size, digest)
+            if received is None:
+                logging.warning(f"Chunk {i} of {self.file_stem}: body runs past its "
+                                f"{size} bytes; aborted")
+                return size, None
+            ok = (size is None or received == size) and digest.hexdigest() == expected
+            return received, tmp.path if ok else None
+        finally:
+            tmp.close(keep=ok)
+
+    async def _receive_block(self, r: httpx.Response, block: Tuple[int, int],
+                             tmp: _TempChunk) -> Tuple[int, Optional[bool]]:
+        """Stream a Range response into its place in `tmp`; True if it is exactly the block."""
+        start, stop = block
+        if r.status_code != 206 or \
+                not r.headers.get("content-range", "").startswith(f"bytes {start}-{stop - 1}/"):
+            return 0, None
+        received = await self._stream_into(r, tmp, start, stop - start)
+        if received != stop - start:
+            return received or 0, None
+        return received, True
+
+    async def _stream_into(self, r: httpx.Response, tmp: _TempChunk, offset: int,
+                           limit: Optional[int], digest=None) -> Optional[int]:
+        """
+        Write a response body into `tmp` from `offset`, one CHUNK_STREAM_BUFFER
+        block in the thread pool while the next arrives. Returns the bytes
+        received, or None as soon as the body runs past `limit`.
+        """
+        received = 0
+        pending: Optional[asyncio.Future] = None
+        async for data in r.aiter_bytes(CHUNK_STREAM_BUFFER):
+            if limit is not None and received + len(data) > limit:
+                return None
+            if pending is not None:
+                # shield: if we are cancelled, the write carries on and tmp waits for it
+                await asyncio.shield(pending)
+            pending = tmp.write(data, offset + received, digest)
+            received += len(data)
+        if pending is not None:
+            await asyncio.shield(pending)
+        return received
+
+    # ── Helpers ───────────────────────────────────────────────
+    async def _refresh_availability(self, force: bool = False):
+        async with self._refresh_lock:
+            # Concurrent failures share one refresh
+            if not force and time.time() - self._refreshed_at < AVAILABILITY_TTL / 2:
+                return
+            avail = await asyncio.to_thread(self.client.get_availability, self.file_stem, 0)
+            self._have_map = avail is not None
+            self._refreshed_at = time.time()
+
+    def _chunk_path(self, i: int) -> Path:
+        return self.chunk_dir / f"{self.file_stem}_chunk_{i}"
+
+    def _verify_local(self, indices) -> Set[int]:
+        """Chunks already on disk: trusted from the piece state where it allows, else hashed."""
+        chunks = self.metadata.get("chunks", [])
+        indices = [i for i in indices if i < len(chunks)]
+        state = self.piece_state
+        if state is not None and self.recheck:
+            state.reset()
+        if self.piece_file is not None:
+            pf = self.piece_file
+            if self.recheck:
+                have = {i for i in indices if pf.verify(i, chunks[i]["hash"])}
+                if pf.complete and len(have) < len(indices):
+                    # Damaged after it was finished: back to a .part to repair
+                    pf.reopen()
+            elif pf.resumed:
+                # Only a .part left by an earlier run can hold chunks we don't know about
+                trusted = state.trusted_file(pf.part_path) if state is not None else None
+                if trusted is not None:
+                    pf.have |= trusted
+                    have = {i for i in indices if i in trusted}
+                else:
+                    have = {i for i in indices if i in pf.have or pf.verify(i, chunks[i]["hash"])}
+            else:
+                have = {i for i in indices if i in pf.have}
+            pf.resumed = False
+            if state is not None:
+                for i in have:
+                    state.mark(i)
+            self._add_refs(have)
+            return have
+
+        if self.chunk_store is not None:
+            # Content-addressed: an object stored for any file will do. Objects
+            # were verified when stored; a recheck reads them back.
+            have = set()
+            for i in indices:
+                expected = chunks[i]["hash"]
+                if not self.chunk_store.has(expected):
+                    continue
+                if self.recheck:
+                    data = self.chunk_store.read(expected)
+                    if data is None or hashlib.sha256(data).hexdigest() != expected:
+                        self.chunk_store.discard(expected)
+                        continue
+                have.add(i)
+                if state is not None:
+                    state.mark(i)
+            self._add_refs(have)
+            return have
+
+        have = set()
+        trusted = state.trusted_chunks(self._chunk_path) \
+            if state is not None and not self.recheck else set()
+        for i in indices:
+            if i in trusted:
+                have.add(i)
+                continue
+            path = self._chunk_path(i)
+            if not path.exists():
+                continue
+            fp = fingerprint(path)
+            with open(path, "rb") as f:
+                if hashlib.sha256(f.read()).hexdigest() == chunks[i]["hash"]:
+                    have.add(i)
+                    if state is not None:
+                        state.mark(i, fp)
+        self._add_refs(have)
+        return have
+
+    def _add_refs(self, indices):
+        if self.chunk_store is not None:
+            chunks = self.metadata["chunks"]
+            for i in indices:
+                self.chunk_store.add_ref(self.file_stem, i, chunks[i]["hash"])
+
+    def _drop_stale_refs(self):
+        """Once every chunk is held, refs left by an earlier version of the file go."""
+        if self.chunk_store is not None:
+            self.chunk_store.set_refs(self.file_stem, {i: c["hash"] for i, c
+                                                       in enumerate(self.metadata["chunks"])})
+
+    def _copy_local(self, indices) -> Set[int]:
+        """Commit the chunks whose bytes the peer already holds; returns those copied."""
+        chunks = self.metadata.get("chunks", [])
+        copied = set()
+        for i in indices:
+            expected = chunks[i]["hash"]
+            committed = self.piece_file is None and self._commit(i, None)
+            if not committed:
+                data = self.client.read_local_chunk(expected)
+                if data is None or hashlib.sha256(data).hexdigest() != expected:
+                    continue
+                fd, name = tempfile.mkstemp(prefix=self._tmp_prefix(i), suffix=TMP_SUFFIX,
+                                            dir=self._tmp_dir())
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                committed = self._commit(i, Path(name))
+            if not committed:
+                continue
+            copied.add(i)
+            self._completed.add(i)
+            self.done += 1
+            self.local_copies += 1
+            self.client.announce_chunk(self.file_stem, i)
+        return copied
+
+    def _save_state(self, periodic: bool = False):
+        if self.piece_state is None:
+            return
+        pf = self.piece_file
+        part = pf.part_path if pf is not None and not pf.complete else None
+        try:
+            if periodic:
+                self.piece_state.save_if_due(part)
+            else:
+                self.piece_state.save(part)
+        except OSError as e:
+            logging.warning(f"Could not save piece state of {self.file_stem}: {e}")
+
+    def _commit(self, i: int, tmp: Optional[Path]) -> bool:
+        """
+        Move a verified chunk from its temp file into place. With a chunk
+        store and no piece file, tmp=None adopts the object already stored,
+        if it still is; False if not.
+        """
+        if tmp is None:
+            # Ref it only along with finding it stored, so no ref outlives it
+            if not self.chunk_store.adopt(self.file_stem, i, self.metadata["chunks"][i]["hash"]):
+                return False
+        else:
+            # Ref first, so a concurrent release() can't free the object under it
+            self._add_refs((i,))
+        if self.piece_file is not None:
+            try:
+                self.piece_file.write_file(i, tmp)
+            finally:
+                tmp.unlink(missing_ok=True)
+            fp = None
+        elif self.chunk_store is not None:
+            if tmp is not None:
+                self.chunk_store.put_file(self.metadata["chunks"][i]["hash"], tmp)
+            fp = None
+        else:
+            path = self._chunk_path(i)
+            os.replace(tmp, path)
+            fp = fingerprint(path)
+        if self.piece_state is not None:
+            self.piece_state.mark(i, fp)
+            self._save_state(periodic=True)
+        return True
+
+    def _blocks(self, i: int) -> Optional[List[Tuple[int, int]]]:
+        """The byte ranges chunk i is fetched in from several peers; None: one request."""
+        size = self.metadata["chunks"][i].get("size")
+        if not self.block_size or not isinstance(size, int) or size <= self.block_size:
+            return None
+        return [(start, min(start + self.block_size, size))
+                for start in range(0, size, self.block_size)]
+
+    def _tmp_prefix(self, i: int) -> str:
+        return f".{self.file_stem}_chunk_{i}."
+
+    def _tmp_dir(self) -> Path:
+        # Same filesystem as the destination, so the commit is a rename or in-kernel copy
+        if self.piece_file is not None:
+            return self.piece_file.part_path.parent
+        if self.chunk_store is not None:
+            self.chunk_store.incoming.mkdir(parents=True, exist_ok=True)
+            return self.chunk_store.incoming
+        return self.chunk_dir
+
+    def _remove_stale_temps(self):
+        """Temp files of an earlier run that was killed mid-chunk."""
+        for p in self._tmp_dir().glob(f"{self._tmp_prefix('*')}*{TMP_SUFFIX}"):
+            p.unlink(missing_ok=True)
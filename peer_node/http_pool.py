@@ -0,0 +1,246 @@
+import asyncio
+import contextlib
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from shared.config import (
+    PER_PEER_CONNECTIONS, POOL_IDLE_TIMEOUT, POOL_MAX_HOSTS,
+    CHUNK_CONNECT_TIMEOUT, CHUNK_READ_TIMEOUT
+)
+
+# httpx logs every request at INFO; one line per chunk drowns the peer's log
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# A request on a kept-alive connection can fail because the server closed it
+# while it sat idle; these are retried once on a fresh connection.
+_STALE_ERRORS = (httpx.RemoteProtocolError, httpx.ReadError, httpx.WriteError)
+
+
+class _Entry:
+    __slots__ = ("client", "last_used", "in_flight", "fresh", "retired")
+
+    def __init__(self, client):
+        self.client = client
+        self.last_used = time.monotonic()
+        self.in_flight = 0
+        self.fresh = True
+        self.retired = False   # out of the pool; closed when its last request ends
+
+
+class HTTPPool:
+    """
+    Blocking keep-alive connections, one requests.Session per origin with at
+    most `max_per_host` pooled connections. Safe to share between threads.
+
+    Origins idle for `idle_timeout` are closed, as are the least recently used
+    ones beyond `max_hosts`. A connection error on a reused origin is retried
+    once on a new Session; on a new origin it is raised as usual. The old
+    Session is closed only once the other threads' requests on it are done.
+    """
+
+    def __init__(self, max_per_host: int = PER_PEER_CONNECTIONS,
+                 idle_timeout: float = POOL_IDLE_TIMEOUT, max_hosts: int = POOL_MAX_HOSTS):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.max_hosts = max_hosts
+        self._entries: Dict[Tuple[str, str], _Entry] = {}
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        parts = urlsplit(url)
+        origin = (parts.scheme, parts.netloc)
+        entry = self._acquire(origin)
+        try:
+            try:
+                return entry.client.request(method, url, **kwargs)
+            except requests.ConnectionError as e:
+                if entry.fresh or isinstance(e, requests.ConnectTimeout):
+                    raise
+                self._retire(origin, entry)
+                retry = self._acquire(origin)
+                try:
+                    return retry.client.request(method, url, **kwargs)
+                finally:
+                    self._release(retry)
+        finally:
+            entry.fresh = False
+            self._release(entry)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def discard(self, origin: Tuple[str, str]):
+        """
+        Drop an origin's connections (e.g. after the server went away); the
+        next request opens new ones. Requests still running finish first.
+        """
+        with self._lock:
+            entry = self._entries.get(origin)
+        if entry:
+            self._retire(origin, entry)
+
+    def close(self):
+        with self._lock:
+            entries, self._entries = list(self._entries.values()), {}
+        for entry in entries:
+            entry.client.close()
+
+    def _acquire(self, origin) -> _Entry:
+        now = time.monotonic()
+        with self._lock:
+            closed = self._evict(now)
+            entry = self._entries.get(origin)
+            if entry is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_per_host)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                entry = self._entries[origin] = _Entry(session)
+            entry.in_flight += 1
+            entry.last_used = now
+        for old in closed:
+            old.close()
+        return entry
+
+    def _release(self, entry: _Entry):
+        with self._lock:
+            entry.in_flight -= 1
+            entry.last_used = time.monotonic()
+            done = entry.retired and entry.in_flight == 0
+        if done:
+            entry.client.close()
+
+    def _retire(self, origin, entry: _Entry):
+        """Take `entry` out of the pool, closing its Session once nothing uses it."""
+        with self._lock:
+            if self._entries.get(origin) is entry:
+                del self._entries[origin]
+            entry.retired = True
+            done = entry.in_flight == 0
+        if done:
+            entry.client.close()
+
+    def _evict(self, now: float) -> list:
+        """Drop idle and surplus origins (lock held); returns sessions to close."""
+        idle = sorted((e.last_used, origin) for origin, e in self._entries.items()
+                      if e.in_flight == 0)
+        surplus = len(self._entries) - self.max_hosts + 1
+        closed = []
+        for n, (last_used, origin) in enumerate(idle):
+            if now - last_used < self.idle_timeout and n >= surplus:
+                break
+            closed.append(self._entries.pop(origin).client)
+        return closed
+
+
+class AsyncHTTPPool:
+    """
+    Non-blocking keep-alive connections to peers: one httpx.AsyncClient per
+    (host, port), capped at `max_per_host` connections. Eviction and the
+    stale-connection retry work as in HTTPPool.
+
+    Clients are bound to the event loop that first used them, so a pool must
+    only be used from one long-lived loop. keepalive=False opens a new
+    connection per request (for comparison in benchmarks).
+    """
+
+    SWEEP_INTERVAL = 5.0   # seconds between idle scans
+
+    def __init__(self, max_per_host: int = PER_PEER_CONNECTIONS,
+                 idle_timeout: float = POOL_IDLE_TIMEOUT, max_hosts: int = POOL_MAX_HOSTS,
+                 keepalive: bool = True,
+                 timeout: Optional[httpx.Timeout] = None):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.max_hosts = max_hosts
+        self.keepalive = keepalive
+        self.timeout = timeout or httpx.Timeout(CHUNK_READ_TIMEOUT, connect=CHUNK_CONNECT_TIMEOUT)
+        self._entries: Dict[Tuple[str, int], _Entry] = {}
+        self._swept = time.monotonic()
+
+    async def get(self, host: str, port: int, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", host, port, path, **kwargs)
+
+    async def request(self, method: str, host: str, port: int, path: str,
+                      **kwargs) -> httpx.Response:
+        key = (host, int(port))
+        entry = self._acquire(key)
+        url = f"http://{host}:{port}{path}"
+        try:
+            try:
+                return await entry.client.request(method, url, **kwargs)
+            except _STALE_ERRORS:
+                if entry.fresh:
+                    raise
+                # httpx has already dropped the broken connection
+                return await entry.client.request(method, url, **kwargs)
+        finally:
+            entry.fresh = False
+            entry.in_flight -= 1
+            entry.last_used = time.monotonic()
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method: str, host: str, port: int, path: str, **kwargs):
+        """
+        Like request(), but the body is not read up front: iterate it with
+        `aiter_bytes()` inside the block. It is closed on exit.
+        """
+        key = (host, int(port))
+        entry = self._acquire(key)
+        url = f"http://{host}:{port}{path}"
+        try:
+            req = entry.client.build_request(method, url, **kwargs)
+            try:
+                response = await entry.client.send(req, stream=True)
+            except _STALE_ERRORS:
+                if entry.fresh:
+                    raise
+                response = await entry.client.send(req, stream=True)
+            try:
+                yield response
+            finally:
+                await response.aclose()
+        finally:
+            entry.fresh = False
+            entry.in_flight -= 1
+            entry.last_used = time.monotonic()
+
+    async def aclose(self):
+        entries, self._entries = list(self._entries.values()), {}
+        await asyncio.gather(*(e.client.aclose() for e in entries), return_exceptions=True)
+
+    def _acquire(self, key) -> _Entry:
+        now = time.monotonic()
+        if now - self._swept >= self.SWEEP_INTERVAL or len(self._entries) >= self.max_hosts:
+            self._swept = now
+            self._evict(now)
+        entry = self._entries.get(key)
+        if entry is None:
+            limits = httpx.Limits(
+                max_connections=self.max_per_host,
+                max_keepalive_connections=self.max_per_host if self.keepalive else 0,
+                keepalive_expiry=self.idle_timeout)
+            entry = self._entries[key] = _Entry(
+                httpx.AsyncClient(limits=limits, timeout=self.timeout))
+        entry.in_flight += 1
+        entry.last_used = now
+        return entry
+
+    def _evict(self, now: float):
+        idle = sorted((e.last_used, key) for key, e in self._entries.items()
+                      if e.in_flight == 0)
+        surplus = len(self._entries) - self.max_hosts + 1
+        for n, (last_used, key) in enumerate(idle):
+            if now - last_used < self.idle_timeout and n >= surplus:
+                break
+            asyncio.ensure_future(self._entries.pop(key).client.aclose())
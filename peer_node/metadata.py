@@ -14,6 +14,9 @@ def save_metadata(chunk_info: dict):
             - chunks: List of chunk dictionaries
             - total_chunks: Total number of chunks
             - mime_type: MIME type of the file
+            - file_size, file_hash, merkle_root: whole-file size and SHA-256,
+              and the Merkle root over the chunk hashes (optional)
+            - chunking: "fixed" or "cdc" (content-defined chunk sizes; optional)
     """
     meta = {
         "original_name": chunk_info["original_name"],
@@ -23,6 +26,9 @@ def save_metadata(chunk_info: dict):
         "total_chunks": chunk_info["total_chunks"],
         "chunks": chunk_info["chunks"]
     }
+    for key in ("file_size", "file_hash", "merkle_root", "chunking"):
+        if key in chunk_info:
+            meta[key] = chunk_info[key]
     
     Path("storage/metadata").mkdir(parents=True, exist_ok=True)
     
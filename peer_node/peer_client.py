@@ -1,8 +1,8 @@
 # peer_node/peer_client.py — top of file
-import requests, threading, time, hashlib, json, random, socket, logging, sys
+import requests, threading, time, json, random, socket, logging, sys, atexit, asyncio
+import concurrent.futures
 from pathlib import Path
 from typing import List, Dict, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 sys.path.append(str(BASE_DIR))
@@ -11,16 +11,32 @@ from security.hashing import sha256
 from security.crypto import load_or_generate_keys
 from shared.config import (
     CHUNK_SIZE, DEFAULT_TRACKER_PORT, MAX_CLUSTER_SIZE, PEER_SAMPLE_SIZE,
-    get_lan_ip, find_available_port, sanitize_stem,
+    AVAILABILITY_TTL, CATALOG_PAGE_SIZE, DIRECT_DOWNLOADS, get_lan_ip, find_available_port, sanitize_stem,
     PeerInfo, ChunkLocation, FileMetadata, ChunkData
 )
+from shared.metrics import Counter, Gauge, Histogram, TimedLock, RATE_BUCKETS
+from shared.merkle import merkle_root, verify_proof
 
 STORAGE_PATH = BASE_DIR / "storage"
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-from peer_server import start_peer_server
+from peer_server import start_peer_server, chunk_store
 from tcp_handler import TCPServer, send_tcp_packet
+from announcer import ChunkAnnouncer, SENT, RETRY, DROP
+from download_engine import DownloadEngine
+from http_pool import HTTPPool, AsyncHTTPPool
+import piece_file
+import piece_state
+from reassemble import reassemble_file
+from scheduler import SchedulerTunables
+
+# Exposed on the peer server's /metrics
+DOWNLOADS = Counter("downloads_total", "download_file() runs by outcome", ["outcome"])
+DOWNLOADS_ACTIVE = Gauge("downloads_active", "Downloads in progress")
+DOWNLOAD_BYTES = Counter("download_bytes_total", "Chunk bytes received by downloads")
+DOWNLOAD_THROUGHPUT = Histogram("download_throughput_bytes_per_second",
+                                "Average throughput of each download", buckets=RATE_BUCKETS)
 
 class PeerClient:
     def __init__(self, tracker_url: str = f"http://localhost:{DEFAULT_TRACKER_PORT}"):
@@ -74,10 +90,54 @@ class PeerClient:
 
         self.token = None
         self.active_peers = []
+
+        # Keep-alive connections: blocking ones for the tracker, async ones for
+        # peers. Downloads and latency probes run on one long-lived event loop
+        # so peer connections outlive a single download.
+        self.http = HTTPPool()
+        self.peer_pool = AsyncHTTPPool()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
         
         # cluster: dict mapping peer_id -> latency (ms)
         self.cluster = {}
-        self.cluster_lock = threading.Lock()
+        self.cluster_lock = TimedLock("cluster")
+
+        # availability: file_stem -> cached owner map from /availability
+        # {"epoch", "version", "fetched_at", "chunks": {idx: [peer_id]},
+        #  "seeds": [peer_id], "peers": {peer_id: dict}}
+        self.availability = {}
+        self.availability_lock = threading.Lock()
+
+        # local copy of the tracker's file catalog, synced by version (see list_files)
+        self.catalog = {"version": 0, "epoch": "", "files": {}}
+        self.catalog_lock = threading.Lock()
+
+        # Chunk announcements are batched and sent by a background thread
+        self.announcer = ChunkAnnouncer(self._send_announcement)
+
+        # Write downloads in place (see piece_file.py) rather than as chunk
+        # files that are reassembled afterwards
+        self.direct_downloads = DIRECT_DOWNLOADS
+
+        # Chunks by hash, shared with the chunk server (see shared/chunk_store.py)
+        self.chunk_store = chunk_store
+        # file_stem -> (finished earlier version, {chunk hash: index}) while a
+        # re-published file downloads beside it (see read_local_chunk)
+        self.previous_versions = {}
+
+        # Per-peer request windows for downloads; may be changed at runtime
+        # and apply from the next download (see scheduler.py)
+        self.scheduler_tunables = SchedulerTunables()
+
+        # file_stem -> DownloadEngine of downloads in progress (see cancel_download)
+        self.downloads = {}
+        # file_stem -> stats of its last finished download (see download_stats)
+        self.download_history = {}
+        self.downloads_lock = TimedLock("downloads")
+
+        # peer_id -> time we last reported it unreachable to the tracker
+        self.reported_unreachable = {}
         
         # Start background threads
         # Start the UDP broadcaster listener thread
@@ -89,6 +149,9 @@ class PeerClient:
         
         # Start heartbeat loop to keep peer active on tracker
         threading.Thread(target=self._heartbeat_loop, daemon=True).start()
+
+        # Best-effort /leave so our chunks stop being advertised once we exit
+        atexit.register(self.leave_network)
         
         logging.info(f"Initialized Peer {self.peer_id} at {self.host}:{self.port}")
         
@@ -102,11 +165,17 @@ class PeerClient:
                 logging.error(f"Failed to update cluster: {e}")
 
     def measure_latency(self, host: str, port: int) -> float:
-        """Measure latency to a peer (tcp handshake time approximation)"""
+        """Measure latency to a peer (round trip of its health check)"""
+        return asyncio.run_coroutine_threadsafe(self._probe(host, port), self.loop).result()
+
+    async def _probe(self, host: str, port: int) -> float:
+        # Goes through the peer pool, so probing a cluster member also keeps
+        # a warm connection ready for chunk requests to it
         start = time.time()
         try:
-            with socket.create_connection((host, int(port)), timeout=2.0) as s:
-                pass
+            r = await self.peer_pool.get(host, port, "/", timeout=2.0)
+            if r.status_code != 200:
+                return float('inf')
             return (time.time() - start) * 1000 # ms
         except Exception:
             return float('inf')
@@ -114,7 +183,7 @@ class PeerClient:
     def _request_with_reconnect(self, method: str, url: str, **kwargs):
         """Wrapper that auto-rejoins if tracker is unreachable or returns 403."""
         try:
-            r = requests.request(method, url, **kwargs)
+            r = self.http.request(method, url, **kwargs)
             if r.status_code == 403:
                 logging.warning("Token rejected — rejoining network...")
                 self.join_network()
@@ -122,7 +191,7 @@ class PeerClient:
                 # Update token in params if present
                 if 'params' in kwargs and 'token' in kwargs['params']:
                     kwargs['params']['token'] = self.token
-                r = requests.request(method, url, **kwargs)
+                r = self.http.request(method, url, **kwargs)
             return r
         except requests.ConnectionError:
             logging.warning("Tracker unreachable — waiting for UDP rediscovery...")
@@ -130,7 +199,7 @@ class PeerClient:
             for _ in range(15):
                 time.sleep(1)
                 try:
-                    r = requests.request(method, url, **kwargs)
+                    r = self.http.request(method, url, **kwargs)
                     return r
                 except requests.ConnectionError:
                     continue
@@ -142,11 +211,14 @@ class PeerClient:
             time.sleep(30)
             if self.token:
                 try:
-                    self._request_with_reconnect("POST",
+                    r = self._request_with_reconnect("POST",
                         f"{self.tracker_url}/heartbeat",
                         params={"peer_id": self.peer_id, "token": self.token},
                         timeout=5
                     )
+                    if r.status_code == 200 and r.json().get("reannounce"):
+                        logging.info("Tracker dropped our chunks — re-announcing local files")
+                        self.reannounce_local_chunks()
                 except Exception:
                     pass
 
@@ -173,14 +245,15 @@ class PeerClient:
             sample_size = min(PEER_SAMPLE_SIZE, len(available))
             candidates.update(random.sample(available, sample_size))
             
-        new_cluster_latencies = {}
-        
-        for pid in candidates:
-            if pid in network_peers:
-                p_info = network_peers[pid]
-                lat = self.measure_latency(p_info['host'], p_info['port'])
-                if lat < float('inf'):
-                    new_cluster_latencies[pid] = lat
+        # Probe every candidate concurrently
+        probed = [pid for pid in candidates if pid in network_peers]
+        async def _probe_all():
+            return await asyncio.gather(*(
+                self._probe(network_peers[pid]['host'], network_peers[pid]['port'])
+                for pid in probed))
+        latencies = asyncio.run_coroutine_threadsafe(_probe_all(), self.loop).result()
+        new_cluster_latencies = {pid: lat for pid, lat in zip(probed, latencies)
+                                 if lat < float('inf')}
                     
         # 3. Sort and keep top ones
         sorted_peers = sorted(new_cluster_latencies.items(), key=lambda x: x[1])
@@ -233,7 +306,7 @@ class PeerClient:
                         # Cache the key for future verification
                         if not tracker_pub_key_path.exists():
                             try:
-                                r = requests.get(f"{new_url}/tracker_pubkey", timeout=3)
+                                r = self.http.get(f"{new_url}/tracker_pubkey", timeout=3)
                                 if r.status_code == 200:
                                     tracker_pub_key_path.write_text(r.json()["public_key"])
                             except Exception:
@@ -263,10 +336,12 @@ class PeerClient:
         for url in candidates:
             self.tracker_url = url
             try:
-                response = requests.post(f"{url}/join", json=data, timeout=5)
+                response = self.http.post(f"{url}/join", json=data, timeout=5)
                 if response.status_code == 200:
                     self.token = response.json().get("token")
                     logging.info(f"Joined via {url}. Configured port: {self.port}")
+                    # The tracker may not know what we hold (first join or tracker restart)
+                    threading.Thread(target=self.reannounce_local_chunks, daemon=True).start()
                     return True
             except requests.RequestException:
                 continue
@@ -274,19 +349,148 @@ class PeerClient:
         logging.error("Could not join any tracker.")
         return False
 
+    def leave_network(self):
+        """Tell the tracker we are going away so our chunks vanish from owner lists."""
+        if not self.token:
+            return
+        try:
+            self.announcer.flush()
+            self.http.post(f"{self.tracker_url}/leave",
+                           params={"peer_id": self.peer_id, "token": self.token},
+                           timeout=5)
+        except requests.RequestException:
+            pass
+        self.token = None
+
+    def report_unreachable(self, peer_id: str):
+        """
+        Stop using a peer locally and tell the tracker about it (at most once a
+        minute per peer). The tracker verifies with its own probe.
+        """
+        with self.availability_lock:
+            for entry in self.availability.values():
+                entry["peers"].pop(peer_id, None)
+
+        now = time.time()
+        if now - self.reported_unreachable.get(peer_id, 0) < 60:
+            return
+        self.reported_unreachable[peer_id] = now
+
+        def _send():
+            try:
+                self._request_with_reconnect("POST",
+                    f"{self.tracker_url}/report_unreachable",
+                    params={"peer_id": self.peer_id, "token": self.token},
+                    json={"peer_id": peer_id}, timeout=5
+                )
+            except Exception:
+                pass
+        threading.Thread(target=_send, daemon=True).start()
+
+    def reannounce_local_chunks(self):
+        """Announce every locally held file: complete ones as seeds, partial ones by range."""
+        meta_dir = STORAGE_PATH / "metadata"
+        if not meta_dir.exists():
+            return
+        for meta_path in meta_dir.glob("*.json"):
+            file_stem = meta_path.stem
+            meta = self.load_local_metadata(file_stem)
+            if not meta:
+                continue
+            total = meta.get("total_chunks", 0)
+            piece = self._open_piece_file(file_stem, meta)
+            if piece is not None and piece.have:
+                # Written in place: everything verified in this process, or a finished file
+                if len(piece.have) == total:
+                    self.announce_complete(file_stem)
+                else:
+                    for i in piece.have:
+                        self.announce_chunk(file_stem, i)
+                continue
+            held = [i for i in range(total)
+                    if self.has_chunk(file_stem, i)
+                    or (STORAGE_PATH / "chunks" / f"{file_stem}_chunk_{i}").exists()]
+            if total and len(held) == total:
+                self.announce_complete(file_stem)
+            else:
+                for i in held:
+                    self.announce_chunk(file_stem, i)
+
     def get_metadata(self, file_stem: str) -> Optional[dict]:
+        """
+        Fetch metadata from the tracker, revalidating any local copy in
+        storage/metadata with If-None-Match. A 304 reuses the local file;
+        a 200 replaces it with the exact bytes served (so the tags match next time).
+        """
+        from shared.metadata import metadata_etag
+        local_path = STORAGE_PATH / "metadata" / f"{sanitize_stem(file_stem)}.json"
+        local_raw = None
+        headers = {}
+        try:
+            local_raw = local_path.read_bytes()
+            headers["If-None-Match"] = metadata_etag(local_raw)
+        except OSError:
+            pass
+
         try:
             from urllib.parse import quote
             safe_stem = quote(file_stem, safe='')
             params = {"peer_id": self.peer_id, "token": self.token}
             # Use safe_stem in URL path
-            res = self._request_with_reconnect("GET", f"{self.tracker_url}/metadata/{safe_stem}", params=params)
+            res = self._request_with_reconnect("GET", f"{self.tracker_url}/metadata/{safe_stem}",
+                                               params=params, headers=headers)
+            if res.status_code == 304 and local_raw is not None:
+                return self._check_metadata(file_stem, json.loads(local_raw))
             if res.status_code == 200:
-                return res.json()
+                metadata = self._check_metadata(file_stem, res.json())
+                if metadata is None:
+                    return None
+                try:
+                    local_path.parent.mkdir(parents=True, exist_ok=True)
+                    local_path.write_bytes(res.content)
+                except OSError as e:
+                    logging.warning(f"Failed to save metadata locally: {e}")
+                return metadata
             return None
         except Exception:
             return None
 
+    def _check_metadata(self, file_stem: str, metadata: dict) -> Optional[dict]:
+        """
+        Hold a metadata document to its merkle_root. A full chunk list must
+        hash to the root; a partial one is replaced by chunk hashes paged
+        from the tracker's /proofs, each page kept only if its proof holds.
+        Legacy metadata without a root is returned as is.
+        """
+        root = metadata.get("merkle_root")
+        if not root:
+            return metadata
+        total = metadata.get("total_chunks", 0)
+        chunks = metadata.get("chunks") or []
+        if len(chunks) == total and all("hash" in c for c in chunks):
+            if merkle_root([c["hash"] for c in chunks]) != root:
+                logging.error(f"Metadata for {file_stem} does not match its Merkle root")
+                return None
+            return metadata
+
+        from urllib.parse import quote
+        fetched = []
+        while len(fetched) < total:
+            start = len(fetched)
+            res = self._request_with_reconnect("GET",
+                f"{self.tracker_url}/proofs/{quote(file_stem, safe='')}",
+                params={"peer_id": self.peer_id, "token": self.token, "start": start})
+            if res.status_code != 200:
+                return None
+            page = res.json()
+            hashes = [c["hash"] for c in page["chunks"]]
+            if [c["index"] for c in page["chunks"]] != list(range(start, start + len(hashes))) \
+                    or not verify_proof(hashes, start, total, page["proof"], root):
+                logging.error(f"Bad Merkle proof for {file_stem} chunks {start}+{len(hashes)}")
+                return None
+            fetched.extend(page["chunks"])
+        return dict(metadata, chunks=fetched)
+
     def get_active_peers(self) -> List[dict]:
         try:
             res = self._request_with_reconnect("GET", 
@@ -301,17 +505,154 @@ class PeerClient:
             logging.error(f"Error fetching peers: {e}")
             return []
 
-    def list_files(self) -> List[dict]:
-        """Fetch list of available files from tracker"""
+    def list_files_page(self, limit: int = CATALOG_PAGE_SIZE, cursor: str = "",
+                        **filters) -> Optional[dict]:
+        """
+        One page of the tracker's catalog. `filters` are passed through to
+        GET /files (q, prefix, mime, sort, since_version, epoch).
+        """
         try:
-            res = self._request_with_reconnect("GET", f"{self.tracker_url}/files")
+            res = self._request_with_reconnect(
+                "GET", f"{self.tracker_url}/files",
+                params={"limit": limit, "cursor": cursor, **filters})
             if res.status_code == 200:
                 return res.json()
-            return []
+            return None
         except Exception:
-            return []
+            return None
+
+    def list_files(self) -> List[dict]:
+        """
+        Every file on the network, from a local copy of the catalog that is
+        brought up to date with only the changes since the last call.
+        """
+        with self.catalog_lock:
+            since, epoch = self.catalog["version"], self.catalog["epoch"]
+        changed, deleted, cursor, first = [], [], "", None
+        while True:
+            page = self.list_files_page(limit=500, cursor=cursor, sort="updated",
+                                        since_version=since, epoch=epoch)
+            if page is None:
+                # Tracker unreachable or too old for paging: serve what we have
+                with self.catalog_lock:
+                    return list(self.catalog["files"].values())
+            # Resume from the first page's version: anything deleted while we
+            # paged shows up next time instead of being skipped
+            first = first or page
+            changed += page["items"]
+            deleted += page["deleted"]
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        with self.catalog_lock:
+            if first["full"]:
+                self.catalog["files"] = {}
+            files = self.catalog["files"]
+            for stem in deleted:
+                files.pop(stem, None)
+            for f in changed:
+                files[f["stem"]] = f
+            self.catalog["version"], self.catalog["epoch"] = first["version"], first["epoch"]
+            return list(files.values())
+
+    def get_availability(self, file_stem: str, max_age: float = AVAILABILITY_TTL) -> Optional[dict]:
+        """
+        Return the cached owner map for a file, refreshing it from the tracker
+        once it is older than `max_age`. Refreshes are incremental: only chunks
+        whose owners changed since the cached version are transferred.
+        Returns None if the tracker does not offer /availability.
+        The lock is not held during the request, so a slow tracker does not
+        stall owner lookups for other files.
+        """
+        with self.availability_lock:
+            cached = self.availability.get(file_stem)
+            if cached and time.time() - cached["fetched_at"] < max_age:
+                return cached
+            base = (cached["epoch"], cached["version"]) if cached else None
 
-    def find_chunk_owners(self, file_stem: str, chunk_index: int) -> List[dict]:
+        from urllib.parse import quote
+        params = {"peer_id": self.peer_id, "token": self.token}
+        if base:
+            params["epoch"], params["since"] = base
+        try:
+            res = self._request_with_reconnect("GET",
+                f"{self.tracker_url}/availability/{quote(file_stem, safe='')}",
+                params=params, timeout=10
+            )
+        except Exception as e:
+            logging.warning(f"Availability refresh failed for {file_stem}: {e}")
+            with self.availability_lock:
+                return self.availability.get(file_stem)
+        data = res.json() if res.status_code == 200 else None
+
+        with self.availability_lock:
+            cached = self.availability.get(file_stem)
+            if data is None:
+                return cached
+            chunks = {int(k): v for k, v in data.get("chunks", {}).items()}
+            if cached and cached["epoch"] == data.get("epoch", "") \
+                    and cached["version"] > data.get("version", 0):
+                # A concurrent refresh already brought a newer map
+                return cached
+            if not data.get("full"):
+                # Changes since `base` only apply to a map at least that new
+                if cached is None or base is None or cached["epoch"] != base[0] \
+                        or cached["version"] < base[1]:
+                    return cached
+                cached["chunks"].update(chunks)
+                cached["peers"].update(data.get("peers", {}))
+                cached.update(version=data["version"], fetched_at=time.time(),
+                              seeds=data.get("seeds", []))
+                return cached
+
+            entry = {
+                "epoch": data.get("epoch", ""),
+                "version": data.get("version", 0),
+                "fetched_at": time.time(),
+                "chunks": chunks,
+                "seeds": data.get("seeds", []),
+                "peers": data.get("peers", {}),
+            }
+            self.availability[file_stem] = entry
+            return entry
+
+    def rarest_first(self, file_stem: str, indices) -> List[int]:
+        """
+        Order chunk indices by how many peers hold them, fewest first, with
+        random tie-breaking so peers starting together fetch different chunks.
+        Chunks nobody announces yet go last (their owners may appear later).
+        """
+        avail = self.get_availability(file_stem)
+        if avail is None:
+            indices = list(indices)
+            random.shuffle(indices)
+            return indices
+
+        seeds = set(avail["seeds"])
+        chunks = avail["chunks"]
+
+        def replicas(i):
+            n = len(seeds.union(chunks.get(i, ())))
+            return n if n else float("inf")
+
+        return sorted(indices, key=lambda i: (replicas(i), random.random()))
+
+    def invalidate_availability(self, file_stem: str):
+        """Force the next lookup for this file to go back to the tracker."""
+        with self.availability_lock:
+            cached = self.availability.get(file_stem)
+            if cached:
+                cached["fetched_at"] = 0.0
+
+    def find_chunk_owners(self, file_stem: str, chunk_index: int, refresh: bool = True) -> List[dict]:
+        """Owners of a chunk. With refresh=False a cached owner map is used however old."""
+        avail = self.get_availability(file_stem, AVAILABILITY_TTL if refresh else float("inf"))
+        if avail is not None:
+            peers = avail["peers"]
+            owners = avail["chunks"].get(chunk_index, []) + avail["seeds"]
+            return [dict(peers[pid]) for pid in dict.fromkeys(owners) if pid in peers]
+
+        # Older trackers without /availability: ask per chunk
         try:
             from urllib.parse import quote
             safe_stem = quote(file_stem, safe='')
@@ -326,76 +667,71 @@ class PeerClient:
         except Exception:
             return []
 
-    def download_file(self, file_stem: str):
+    def download_file(self, file_stem: str, recheck: bool = False):
+        """
+        Fetch every chunk of a file not held yet. Chunks recorded as verified
+        in its piece state are skipped without reading them; recheck=True
+        re-hashes everything on disk first (including a finished file).
+        """
         file_stem = sanitize_stem(file_stem)
+        previous = self.load_local_metadata(file_stem)
         metadata = self.get_metadata(file_stem)
         if not metadata:
             return "Metadata not found"
 
-        local_storage = STORAGE_PATH / "received_chunks"
-        local_storage.mkdir(parents=True, exist_ok=True)
+        piece = None
+        replaced = self._keep_previous_version(file_stem, previous, metadata)
+        if self.direct_downloads and piece_file.chunk_layout(metadata) is not None:
+            piece = self._open_piece_file(file_stem, metadata, create=True, fresh=replaced)
+            if piece.complete and not recheck:
+                self.announce_complete(file_stem)
+                return "Download complete"
+            local_storage = None
+        else:
+            local_storage = STORAGE_PATH / "received_chunks"
+            local_storage.mkdir(parents=True, exist_ok=True)
 
-        meta_dir = STORAGE_PATH / "metadata"
-        meta_dir.mkdir(parents=True, exist_ok=True)
+        # Rarest chunks first, many requests in flight on one event loop
+        engine = DownloadEngine(self, file_stem, metadata, local_storage, piece_file=piece,
+                                piece_state=piece_state.PieceState.load(file_stem, metadata),
+                                recheck=recheck, tunables=self.scheduler_tunables,
+                                chunk_store=self.chunk_store)
+        with self.downloads_lock:
+            self.downloads[file_stem] = engine
+        DOWNLOADS_ACTIVE.inc()
+        outcome = "failed"
         try:
-            with open(meta_dir / f"{file_stem}.json", "w") as f:
-                json.dump(metadata, f, indent=2)
-        except Exception as e:
-            logging.warning(f"Failed to save metadata locally: {e}")
-
-        missing = []
-
-        def fetch_chunk(i: int) -> bool:
-            if i >= len(metadata.get("chunks", [])):
-                logging.error(f"Chunk index {i} out of bounds for metadata chunks array.")
-                return False
-
-            chunk_name = f"{file_stem}_chunk_{i}"
-            chunk_path = local_storage / chunk_name
-
-            # Already have it locally?
-            if chunk_path.exists():
-                with open(chunk_path, "rb") as f:
-                    data = f.read()
-                if hashlib.sha256(data).hexdigest() == metadata["chunks"][i]["hash"]:
-                    self.announce_chunk(file_stem, i)
-                return True
-
-            peers = self.find_chunk_owners(file_stem, i)
-            with self.cluster_lock:
-                peers.sort(key=lambda p: self.cluster.get(p["peer_id"], 9999))
-
-            for peer in peers:
-                if peer["peer_id"] == self.peer_id:
-                    continue
-                url = f"http://{peer['host']}:{peer['port']}/chunk/{file_stem}/{i}"
-                try:
-                    params = {"peer_id": self.peer_id, "token": self.token} \
-                            if peer.get("type") == "tracker" else {}
-                    r = requests.get(url, params=params, timeout=10)
-                    if r.status_code == 200:
-                        chunk_data = r.content
-                        if hashlib.sha256(chunk_data).hexdigest() == metadata["chunks"][i]["hash"]:
-                            with open(chunk_path, "wb") as f:
-                                f.write(chunk_data)
-                            self.announce_chunk(file_stem, i)
-                            return True
-                except Exception:
-                    continue
-            return False
-
-        # ── Parallel download ──────────────────────────────────
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            futures = {executor.submit(fetch_chunk, i): i
-                    for i in range(metadata["total_chunks"])}
-            for future in as_completed(futures):
-                i = futures[future]
-                if not future.result():
-                    missing.append(i)
+            missing = asyncio.run_coroutine_threadsafe(engine.run(), self.loop).result()
+            outcome = "partial" if missing else "complete"
+        except (asyncio.CancelledError, concurrent.futures.CancelledError):
+            outcome = "cancelled"
+            return "Download cancelled"
+        finally:
+            with self.downloads_lock:
+                self.downloads.pop(file_stem, None)
+                stats = self.download_history[file_stem] = engine.stats()
+                old = self.previous_versions.pop(file_stem, None)
+            if old is not None:
+                old[0].close()
+            DOWNLOADS_ACTIVE.dec()
+            DOWNLOADS.labels(outcome).inc()
+            DOWNLOAD_BYTES.inc(stats["bytes"])
+            if stats["bytes"]:
+                DOWNLOAD_THROUGHPUT.observe(stats["throughput_bps"])
 
         if missing:
             return f"Partial Download. Missing chunks: {sorted(missing)}"
 
+        # Every chunk is verified on disk: register once as a seed
+        if piece is not None:
+            # Already in place; the finished file is what we seed from
+            if not piece.complete:
+                piece.finish()
+            piece_state.remove(file_stem)
+            self.announce_complete(file_stem)
+            return "Download complete"
+        self.announce_complete(file_stem)
+
         downloaded = [{"index": i,
                     "filename": f"{file_stem}_chunk_{i}"}
                     for i in range(metadata["total_chunks"])]
@@ -403,19 +739,193 @@ class PeerClient:
             return "Download complete"
         return "Reassembly failed"
 
-    def repair_file(self, file_stem: str):
+    def _open_piece_file(self, file_stem: str, metadata: dict,
+                         create: bool = False, fresh: bool = False) -> Optional[piece_file.PieceFile]:
+        """
+        The in-place download of a file: the one already open in this
+        process, else its finished file in storage/downloads, else (with
+        create=True) a new or resumed .part. None if there is none or the
+        metadata lacks chunk sizes. fresh=True ignores a finished file (an
+        earlier version of this one).
+        """
+        with self.downloads_lock:
+            piece = piece_file.lookup(file_stem)
+            if piece is not None:
+                return piece
+            sizes = piece_file.chunk_layout(metadata)
+            if sizes is None:
+                return None
+            fname = metadata.get("original_name", f"{file_stem}.out")
+            piece = piece_file.PieceFile(STORAGE_PATH / "downloads" / fname, sizes)
+            # A .part beside a finished file is a newer version under way
+            fresh = fresh or (create and piece.part_path.exists())
+            if fresh or not piece.open_complete():
+                if not create:
+                    return None
+                piece.open()
+            piece_file.register(file_stem, piece)
+            return piece
+
+    def _keep_previous_version(self, file_stem: str, previous: Optional[dict],
+                               metadata: dict) -> bool:
+        """
+        If the chunks this peer holds of a file (its refs in the chunk
+        store) are not those of `metadata`, the file was re-published: stop
+        seeding the old version and keep its finished file open as a source
+        of the chunks both versions share. True if so: the new version must
+        not reuse the old file. `previous` is the local metadata from before
+        this download, for the old chunk sizes; whatever is read from the
+        old file is verified against the new hashes anyway.
+        """
+        held = self.chunk_store.refs(file_stem)
+        new = {i: c.get("hash") for i, c in enumerate(metadata.get("chunks", []))}
+        if all(new.get(i) == h for i, h in held.items()):
+            return False
+        registered = piece_file.lookup(file_stem)
+        if registered is not None:
+            path, sizes = registered.path, registered.sizes
+        else:
+            previous = previous or {}
+            fname = previous.get("original_name", metadata.get("original_name", f"{file_stem}.out"))
+            path, sizes = STORAGE_PATH / "downloads" / fname, piece_file.chunk_layout(previous)
+        piece_file.discard(file_stem)
+        if sizes is not None:
+            old = piece_file.PieceFile(path, sizes)
+            if old.open_complete():
+                with self.downloads_lock:
+                    self.previous_versions[file_stem] = (old, {h: i for i, h in held.items()})
+        return True
+
+    def chunk_source(self, file_stem: str, chunk_index: int):
+        """
+        Where chunk i of a file downloaded as chunks is: (pack file, offset,
+        length) in the chunk store, else its file in received_chunks.
+        """
+        chunk_hash = self.chunk_store.lookup(file_stem, chunk_index)
+        span = self.chunk_store.span(chunk_hash) if chunk_hash is not None else None
+        return span or STORAGE_PATH / "received_chunks" / f"{file_stem}_chunk_{chunk_index}"
+
+    def has_chunk(self, file_stem: str, chunk_index: int) -> bool:
+        return (self.chunk_store.lookup(file_stem, chunk_index) is not None
+                or (STORAGE_PATH / "received_chunks" / f"{file_stem}_chunk_{chunk_index}").exists())
+
+    def read_local_chunk(self, chunk_hash: str) -> Optional[bytes]:
+        """
+        The bytes of a chunk with this hash if this peer holds one, for any
+        file: a store object, else a chunk of the previous version of a file
+        being re-downloaded, else a verified chunk of a download written in
+        place. Unverified; the caller checks the hash.
+        """
+        try:
+            data = self.chunk_store.read(chunk_hash) if self.chunk_store.has(chunk_hash) else None
+            if data is not None:
+                return data
+            with self.downloads_lock:
+                previous = list(self.previous_versions.values())
+            for old, hashes in previous:
+                if chunk_hash in hashes:
+                    return old.read(hashes[chunk_hash])
+            for file_stem, i in self.chunk_store.locate(chunk_hash):
+                meta = self.load_local_metadata(file_stem)
+                piece = self._open_piece_file(file_stem, meta) if meta else None
+                if piece is not None and i in piece.have:
+                    return piece.read(i)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read local copy of chunk {chunk_hash[:12]}: {e}")
+        return None
+
+    def download_stats(self, file_stem: str) -> Optional[dict]:
+        """
+        Progress, throughput and per-peer scheduler state (window, goodput,
+        error rate) of the running download of a file, else of its last one.
+        """
+        file_stem = sanitize_stem(file_stem)
+        with self.downloads_lock:
+            engine = self.downloads.get(file_stem)
+            if engine is None:
+                return self.download_history.get(file_stem)
+        return engine.stats()
+
+    def cancel_download(self, file_stem: str) -> bool:
+        """Stop a running download_file() for this file (from any thread)."""
+        with self.downloads_lock:
+            engine = self.downloads.get(sanitize_stem(file_stem))
+        if engine:
+            engine.cancel()
+        return engine is not None
+
+    def repair_file(self, file_stem: str, recheck: bool = False):
         """Attempt to download missing chunks for a file"""
-        return self.download_file(file_stem)
+        return self.download_file(file_stem, recheck=recheck)
+
+    def recheck_file(self, file_stem: str):
+        """Re-hash every local chunk of a file, ignoring its saved state, and fetch any bad ones."""
+        return self.repair_file(file_stem, recheck=True)
 
     def announce_chunk(self, file_stem: str, chunk_index: int):
+        """Queue a chunk announcement; the announcer batches them per window."""
+        self.announcer.announce(file_stem, chunk_index)
+
+    def announce_complete(self, file_stem: str):
+        """Register as a seed holding every chunk of the file."""
+        self.announcer.announce_complete(file_stem)
+
+    def _send_announcement(self, file_stem: str, payload: dict) -> str:
+        """POST one announcer batch; SENT, RETRY or DROP (see announcer.py)."""
+        if not self.token:
+            return RETRY
         try:
-            self._request_with_reconnect("POST", 
-                f"{self.tracker_url}/announce_chunk",
+            res = self._request_with_reconnect("POST",
+                f"{self.tracker_url}/announce_chunks",
                 params={"peer_id": self.peer_id, "token": self.token},
-                json={"file_stem": file_stem, "chunk_index": chunk_index}
+                json=payload, timeout=10
             )
+            if res.status_code == 404 and res.json().get("detail") == "Not Found":
+                # No such route: a tracker from before batch announcements
+                return self._send_announcement_legacy(file_stem, payload)
         except Exception:
-            pass
+            return RETRY
+        return self._announce_result(res.status_code)
+
+    @staticmethod
+    def _announce_result(status_code: int) -> str:
+        if status_code == 200:
+            return SENT
+        if status_code == 403:
+            # Still rejected after _request_with_reconnect re-joined: try again later
+            return RETRY
+        return DROP if 400 <= status_code < 500 else RETRY
+
+    def _send_announcement_legacy(self, file_stem: str, payload: dict) -> str:
+        """Trackers without /announce_chunks: one POST per chunk."""
+        from shared.bitfield import ranges_to_indices
+        meta = self.load_local_metadata(file_stem)
+        total = meta.get("total_chunks", 0) if meta else 0
+        if payload.get("complete") or total <= 0:
+            indices = range(total)
+        else:
+            indices = sorted(ranges_to_indices(payload.get("ranges", []), total))
+        for i in indices:
+            try:
+                res = self._request_with_reconnect("POST",
+                    f"{self.tracker_url}/announce_chunk",
+                    params={"peer_id": self.peer_id, "token": self.token},
+                    json={"file_stem": file_stem, "chunk_index": i}
+                )
+            except Exception:
+                return RETRY
+            result = self._announce_result(res.status_code)
+            if result != SENT:
+                return result
+        return SENT
+
+    def load_local_metadata(self, file_stem: str) -> Optional[dict]:
+        meta_path = STORAGE_PATH / "metadata" / f"{file_stem}.json"
+        try:
+            with open(meta_path, "r") as f:
+                return json.load(f)
+        except Exception:
+            return None
 
     def reassemble(self, file_stem: str, metadata: dict, chunks: list):
         out_dir = STORAGE_PATH / "downloads"
@@ -424,19 +934,20 @@ class PeerClient:
         out_path = out_dir / fname
         
         chunks.sort(key=lambda x: x['index'])
-        
+        meta_chunks = metadata.get("chunks", [])
+        hashes = None
+        if len(meta_chunks) == len(chunks) and all("hash" in m for m in meta_chunks):
+            hashes = [meta_chunks[c['index']]["hash"] for c in chunks]
+
         try:
-            print(f"[DEBUG] Reassembling to: {out_path}")
-            with open(out_path, "wb") as outfile:
-                for c in chunks:
-                    chunk_path = STORAGE_PATH / "received_chunks" / c['filename']
-                    print(f"[DEBUG] Reading chunk: {chunk_path}")
-                    with open(chunk_path, "rb") as infile:
-                        outfile.write(infile.read())
-            print(f"[DEBUG] Reassembly success: {out_path}")
+            # Kernel-side copy, every chunk checked against its hash on the way
+            reassemble_file([self.chunk_source(file_stem, c['index']) for c in chunks],
+                            out_path, chunk_hashes=hashes,
+                            file_hash=metadata.get("file_hash"))
+            logging.info(f"Reassembled {out_path}")
             return True
         except Exception as e:
-            print(f"[ERROR] Reassembly failed: {e}")
+            logging.error(f"Reassembly of {out_path} failed: {e}")
             return False
 
     def push_file_tcp(self, target_ip, target_port, file_stem):
@@ -467,17 +978,19 @@ class PeerClient:
         for i in range(total_chunks):
             chunk_name = f"{file_stem}_chunk_{i}"
 
-            # Check storage/chunks first, then fall back to storage/received_chunks
-            chunk_path = BASE_DIR / "storage" / "chunks" / chunk_name
+            # Check storage/chunks first, then fall back to downloaded chunks
+            chunk_path, span = BASE_DIR / "storage" / "chunks" / chunk_name, None
             if not chunk_path.exists():
-                chunk_path = BASE_DIR / "storage" / "received_chunks" / chunk_name
+                chunk_path = self.chunk_source(file_stem, i)
+                if isinstance(chunk_path, tuple):
+                    chunk_path, span = chunk_path[0], chunk_path[1:]
 
             chunk_header = {
                 "packet_type": "chunk",
                 "file_stem": file_stem,
                 "chunk_index": i
             }
-            c_success, c_msg = send_tcp_packet(target_ip, target_port, chunk_header, chunk_path)
+            c_success, c_msg = send_tcp_packet(target_ip, target_port, chunk_header, chunk_path, span=span)
             if not c_success:
                 return False, f"Failed to send chunk {i}: {c_msg}"
                 
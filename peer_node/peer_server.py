@@ -1,40 +1,87 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 import uvicorn
+from functools import partial
 from pathlib import Path
 
+import piece_file
+
 # Local import
 from shared.config import (
-    CHUNK_SIZE, DEFAULT_TRACKER_PORT, get_lan_ip,
+    CHUNK_SIZE, DEFAULT_TRACKER_PORT, HTTP_KEEPALIVE_TIMEOUT, get_lan_ip,
     find_available_port, sanitize_stem,
     PeerInfo, ChunkLocation, FileMetadata, ChunkData
 )
+from shared.byte_range import (
+    RangeNotSatisfiable, parse_range, content_range, unsatisfied_range, read_span
+)
+from shared.metrics import (
+    MetricsMiddleware, CHUNKS_SERVED, CHUNK_BYTES_SERVED, CONTENT_TYPE, render
+)
+from shared.chunk_store import ChunkStore
 
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 STORAGE_PATH = BASE_DIR / "storage"
 
+# Downloaded chunks, one object per distinct hash in pack files; PeerClient writes it
+chunk_store = ChunkStore(STORAGE_PATH / "chunk_store", holder="peer")
+
 app = FastAPI(title="Peer Node Server")
+app.add_middleware(MetricsMiddleware)
 
 @app.get("/chunk/{file_stem}/{chunk_index}")
-async def upload_chunk(file_stem: str, chunk_index: int):
+async def upload_chunk(file_stem: str, chunk_index: int, request: Request):
     # Verify we actually have this chunk
     file_stem = sanitize_stem(file_stem)
     chunk_name = f"{file_stem}_chunk_{chunk_index}"
-    # Default storage for received chunks
-    chunk_path = STORAGE_PATH / "received_chunks" / chunk_name
-    
-    if not chunk_path.exists():
-        chunk_path = STORAGE_PATH / "chunks" / chunk_name
+    # Default storage for received chunks: the chunk store's packs
+    chunk_hash = chunk_store.lookup(file_stem, chunk_index)
+    size = chunk_store.size(chunk_hash) if chunk_hash is not None else None
+    read = partial(chunk_store.read, chunk_hash) if size is not None else None
 
-    if not chunk_path.exists():
+    # Chunk files pushed over TCP or not yet migrated
+    for chunk_path in (STORAGE_PATH / "received_chunks" / chunk_name, STORAGE_PATH / "chunks" / chunk_name):
+        if read is None and chunk_path.exists():
+            size = chunk_path.stat().st_size
+            read = partial(read_span, chunk_path)
+
+    if read is None:
+        # Downloads written in place are served from the file itself
+        piece = piece_file.lookup(file_stem)
+        if piece is None or chunk_index not in piece.have:
+            raise HTTPException(status_code=404, detail="Chunk not found")
+        size = piece.sizes[chunk_index]
+        read = partial(piece.read, chunk_index)
+
+    # Downloaders split chunks into blocks fetched from several peers at once
+    try:
+        span = parse_range(request.headers.get("range"), size)
+    except RangeNotSatisfiable:
+        raise HTTPException(status_code=416, headers={"Content-Range": unsatisfied_range(size)})
+    start, stop = span or (0, size)
+    CHUNKS_SERVED.labels("range" if span else "whole").inc()
+    CHUNK_BYTES_SERVED.observe(stop - start)
+    data = await run_in_threadpool(read, start, stop)
+    if data is None:
+        # Compacted or released since the lookup
         raise HTTPException(status_code=404, detail="Chunk not found")
-        
-    return FileResponse(chunk_path)
+    if span is None:
+        return Response(content=data, media_type="application/octet-stream")
+    return Response(content=data, status_code=206, media_type="application/octet-stream",
+                    headers={"Content-Range": content_range(start, stop, size)})
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition of this peer's counters."""
+    return Response(content=render(), media_type=CONTENT_TYPE)
 
 @app.get("/")
 def health_check():
     return {"status": "online", "role": "peer_node"}
 
 def start_peer_server(host, port):
-    uvicorn.run(app, host=host, port=port, log_level="error")
+    # Outlive the clients' pooled connections so they are reused, not cut
+    uvicorn.run(app, host=host, port=port, log_level="error",
+                timeout_keep_alive=HTTP_KEEPALIVE_TIMEOUT)
@@ -0,0 +1,207 @@
+import errno
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+PART_SUFFIX = ".part"
+COPY_BUFFER = 1024 * 1024   # bytes per read/write when the kernel can't copy
+
+
+def chunk_layout(metadata: dict) -> Optional[List[int]]:
+    """Chunk sizes from the metadata, or None if any chunk's size is missing."""
+    chunks = metadata.get("chunks", [])
+    if len(chunks) != metadata.get("total_chunks", 0):
+        return None
+    sizes = [c.get("size") for c in chunks]
+    if any(not isinstance(s, int) or s < 0 for s in sizes):
+        return None
+    return sizes
+
+
+class PieceFile:
+    """
+    A download written in place: chunk i occupies `sizes[i]` bytes at
+    `offsets[i]` of one preallocated file, so no per-chunk copies are kept
+    and the finished file is also what we seed from.
+
+    While incomplete the file is `<path>.part`; finish() renames it. `have`
+    lists the chunks verified in this process, i.e. the ones safe to serve.
+    Writes and reads are positional, so any number of threads may share one
+    open PieceFile.
+    """
+
+    def __init__(self, path: Path, sizes: List[int]):
+        self.path = path
+        self.sizes = sizes
+        self.offsets = [0] * len(sizes)
+        for i in range(1, len(sizes)):
+            self.offsets[i] = self.offsets[i - 1] + sizes[i - 1]
+        self.total_size = sum(sizes)
+        self.have: Set[int] = set()
+        self.complete = False
+        self.resumed = False   # open() found an earlier .part
+        self._fd: Optional[int] = None
+        # Only used where os.pread/os.pwrite don't exist (Windows)
+        self._seek_lock = threading.Lock()
+
+    @property
+    def part_path(self) -> Path:
+        return self.path.with_name(self.path.name + PART_SUFFIX)
+
+    # ── Lifecycle ─────────────────────────────────────────────
+    def open(self):
+        """Open (and preallocate) the .part file, keeping anything already in it."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.resumed = self.part_path.exists()
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        self._fd = os.open(self.part_path, flags, 0o644)
+        if os.fstat(self._fd).st_size != self.total_size:
+            try:
+                # Reserve the blocks up front so writes can't fail with ENOSPC halfway
+                os.posix_fallocate(self._fd, 0, self.total_size)
+            except (AttributeError, OSError):
+                pass
+            os.ftruncate(self._fd, self.total_size)
+
+    def open_complete(self) -> bool:
+        """Seed an already finished file; False if it is missing or the wrong size."""
+        try:
+            if self.path.stat().st_size != self.total_size:
+                return False
+            self._fd = os.open(self.path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        except OSError:
+            return False
+        self.complete = True
+        self.have = set(range(len(self.sizes)))
+        return True
+
+    def finish(self):
+        """Flush the finished download and move it to its final name."""
+        os.fsync(self._fd)
+        if os.name == "nt":
+            # Windows can't rename an open file
+            os.close(self._fd)
+            os.replace(self.part_path, self.path)
+            self._fd = os.open(self.path, os.O_RDONLY | os.O_BINARY)
+        else:
+            # The descriptor follows the rename, so concurrent uploads carry on
+            os.replace(self.part_path, self.path)
+        self.complete = True
+
+    def reopen(self):
+        """Turn a finished file back into a writable .part (to repair damaged chunks)."""
+        flags = os.O_RDWR | getattr(os, "O_BINARY", 0)
+        if os.name == "nt":
+            os.close(self._fd)
+            os.replace(self.path, self.part_path)
+            self._fd = os.open(self.part_path, flags)
+        else:
+            os.replace(self.path, self.part_path)
+            # Swap descriptors so concurrent uploads never see a closed one
+            old, self._fd = self._fd, os.open(self.part_path, flags)
+            os.close(old)
+        self.complete = False
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    # ── Chunk I/O ─────────────────────────────────────────────
+    def read(self, i: int, start: int = 0, stop: Optional[int] = None) -> bytes:
+        """Chunk i, or bytes [start, stop) of it."""
+        stop = self.sizes[i] if stop is None else min(stop, self.sizes[i])
+        return self._pread(max(stop - start, 0), self.offsets[i] + start)
+
+    def write(self, i: int, data: bytes):
+        if len(data) != self.sizes[i]:
+            raise ValueError(f"chunk {i} is {len(data)} bytes, expected {self.sizes[i]}")
+        self._pwrite(data, self.offsets[i])
+        self.have.add(i)
+
+    def write_file(self, i: int, src: Path):
+        """Copy chunk i into place from a file holding exactly its bytes."""
+        size = self.sizes[i]
+        fd = os.open(src, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            if os.fstat(fd).st_size != size:
+                raise ValueError(f"{src} is not the {size} bytes of chunk {i}")
+            copied = 0
+            if hasattr(os, "copy_file_range"):
+                try:
+                    while copied < size:
+                        n = os.copy_file_range(fd, self._fd, size - copied,
+                                               copied, self.offsets[i] + copied)
+                        if n == 0:
+                            break
+                        copied += n
+                except OSError as e:
+                    if copied or e.errno not in (errno.EXDEV, errno.EINVAL,
+                                                 errno.ENOSYS, errno.EOPNOTSUPP):
+                        raise
+            # fd is private to this call, so plain reads are fine here
+            os.lseek(fd, copied, os.SEEK_SET)
+            while copied < size:
+                block = os.read(fd, min(COPY_BUFFER, size - copied))
+                if not block:
+                    raise ValueError(f"{src} shrank while copying chunk {i}")
+                self._pwrite(block, self.offsets[i] + copied)
+                copied += len(block)
+        finally:
+            os.close(fd)
+        self.have.add(i)
+
+    def verify(self, i: int, expected: str) -> bool:
+        """Hash chunk i as it is on disk; marks it held if it matches, else not held."""
+        if hashlib.sha256(self.read(i)).hexdigest() != expected:
+            self.have.discard(i)
+            return False
+        self.have.add(i)
+        return True
+
+    def _pread(self, size: int, offset: int) -> bytes:
+        if hasattr(os, "pread"):
+            return os.pread(self._fd, size, offset)
+        with self._seek_lock:
+            os.lseek(self._fd, offset, os.SEEK_SET)
+            return os.read(self._fd, size)
+
+    def _pwrite(self, data: bytes, offset: int):
+        view = memoryview(data)
+        while view:
+            if hasattr(os, "pwrite"):
+                n = os.pwrite(self._fd, view, offset)
+            else:
+                with self._seek_lock:
+                    os.lseek(self._fd, offset, os.SEEK_SET)
+                    n = os.write(self._fd, view)
+            view, offset = view[n:], offset + n
+
+
+# file_stem -> PieceFile being downloaded or seeded by this process; the
+# peer server looks chunks up here when no per-chunk file exists
+_open: Dict[str, PieceFile] = {}
+_open_lock = threading.Lock()
+
+
+def register(file_stem: str, piece_file: PieceFile):
+    with _open_lock:
+        old = _open.get(file_stem)
+        _open[file_stem] = piece_file
+    if old is not None and old is not piece_file:
+        old.close()
+
+
+def lookup(file_stem: str) -> Optional[PieceFile]:
+    with _open_lock:
+        return _open.get(file_stem)
+
+
+def discard(file_stem: str):
+    """Stop serving a file (e.g. before deleting it)."""
+    with _open_lock:
+        piece_file = _open.pop(file_stem, None)
+    if piece_file is not None:
+        piece_file.close()
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from shared.bitfield import encode_bitfield, decode_bitfield
+from shared.config import PIECE_STATE_INTERVAL
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+STATE_DIR = BASE_DIR / "storage" / "piece_state"
+
+Fingerprint = Tuple[int, int]   # (size, mtime_ns)
+
+
+def fingerprint(path: Path) -> Optional[Fingerprint]:
+    """Size and modification time of a file, or None if it doesn't exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+def _chunks_digest(metadata: dict) -> str:
+    h = hashlib.sha256()
+    for c in metadata.get("chunks", []):
+        h.update(c.get("hash", "").encode())
+    return h.hexdigest()
+
+
+class PieceState:
+    """
+    The chunks of one download known to be good, kept across runs in
+    storage/piece_state/<file_stem>.json so a resume or repair does not
+    re-hash data it has already checked.
+
+    A verified chunk is trusted again only while what holds it is unchanged:
+    its chunk file's size and mtime, or for downloads written in place those
+    of the whole .part (any write after the last save means it is re-hashed).
+    The record is tied to the metadata's chunk hashes, so a different file
+    published under the same stem starts from scratch. Thread-safe.
+    """
+
+    def __init__(self, file_stem: str, metadata: dict, state_dir: Path = STATE_DIR):
+        self.path = state_dir / f"{file_stem}.json"
+        self.total = metadata.get("total_chunks", 0)
+        self.digest = _chunks_digest(metadata)
+        self.verified: Set[int] = set()
+        self.chunk_fingerprints: Dict[int, Fingerprint] = {}
+        self.file_fingerprint: Optional[Fingerprint] = None
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+
+    @classmethod
+    def load(cls, file_stem: str, metadata: dict, state_dir: Path = STATE_DIR) -> "PieceState":
+        """The saved state of a download; empty if there is none or it is stale."""
+        state = cls(file_stem, metadata, state_dir)
+        try:
+            raw = json.loads(state.path.read_text(encoding="utf-8"))
+            if raw.get("chunks_digest") != state.digest or raw.get("total") != state.total:
+                return state
+            if state.total:
+                state.verified = decode_bitfield(raw.get("bitfield", ""), state.total)
+            state.chunk_fingerprints = {int(i): tuple(fp) for i, fp
+                                        in raw.get("chunk_fingerprints", {}).items()}
+            fp = raw.get("file_fingerprint")
+            state.file_fingerprint = tuple(fp) if fp else None
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logging.warning(f"Ignoring unreadable piece state {state.path.name}: {e}")
+            state.reset()
+        return state
+
+    # ── Trust ─────────────────────────────────────────────────
+    def trusted_chunks(self, path_of: Callable[[int], Path]) -> Set[int]:
+        """Verified chunks whose chunk file is unchanged since it was hashed."""
+        with self._lock:
+            recorded = {i: self.chunk_fingerprints.get(i) for i in self.verified}
+        return {i for i, fp in recorded.items() if fp is not None and fingerprint(path_of(i)) == fp}
+
+    def trusted_file(self, path: Path) -> Optional[Set[int]]:
+        """
+        The verified chunks of a download written in place, if `path` is
+        unchanged since the last save (then no other chunk in it is good);
+        None if it has changed and must be re-hashed.
+        """
+        with self._lock:
+            if self.file_fingerprint is None or fingerprint(path) != self.file_fingerprint:
+                return None
+            return set(self.verified)
+
+    # ── Updates ───────────────────────────────────────────────
+    def mark(self, i: int, fp: Optional[Fingerprint] = None):
+        """Chunk i was verified; `fp` is its chunk file's fingerprint, if it has one."""
+        with self._lock:
+            self.verified.add(i)
+            if fp is not None:
+                self.chunk_fingerprints[i] = fp
+
+    def reset(self):
+        with self._lock:
+            self.verified.clear()
+            self.chunk_fingerprints.clear()
+            self.file_fingerprint = None
+
+    def save(self, file_path: Optional[Path] = None):
+        """
+        Write the state atomically. `file_path` is the .part of a download
+        written in place; it is fingerprinted after the bitfield is taken, so
+        every chunk in the bitfield was on disk before that stat.
+        """
+        with self._lock:
+            record = {
+                "total": self.total,
+                "chunks_digest": self.digest,
+                "bitfield": encode_bitfield(self.verified, self.total),
+                "chunk_fingerprints": {str(i): list(fp) for i, fp in self.chunk_fingerprints.items()
+                                       if i in self.verified},
+            }
+            self.file_fingerprint = fingerprint(file_path) if file_path else None
+            record["file_fingerprint"] = list(self.file_fingerprint) if self.file_fingerprint else None
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps(record), encoding="utf-8")
+            os.replace(tmp, self.path)
+            self._saved_at = time.monotonic()
+
+    def save_if_due(self, file_path: Optional[Path] = None,
+                    interval: float = PIECE_STATE_INTERVAL):
+        """save() at most once per `interval` seconds (called after each stored chunk)."""
+        if time.monotonic() - self._saved_at >= interval:
+            self.save(file_path)
+
+
+def remove(file_stem: str, state_dir: Path = STATE_DIR):
+    """Forget a file's piece state (finished or deleted downloads)."""
+    (state_dir / f"{file_stem}.json").unlink(missing_ok=True)
@@ -0,0 +1,145 @@
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from shared.config import (
+    SCHED_INITIAL_WINDOW, SCHED_MAX_WINDOW, SCHED_DECREASE, SCHED_EWMA_ALPHA
+)
+
+
+class SchedulerTunables:
+    """
+    Knobs for PeerScheduler; defaults come from shared/config.py.
+
+    initial_window  requests in flight to a peer before anything is known
+    max_window      ceiling on any peer's window
+    decrease        factor a window is multiplied by after a failed request
+    alpha           weight of the newest sample in the moving averages
+    """
+
+    def __init__(self, initial_window: int = SCHED_INITIAL_WINDOW,
+                 max_window: int = SCHED_MAX_WINDOW,
+                 decrease: float = SCHED_DECREASE,
+                 alpha: float = SCHED_EWMA_ALPHA):
+        self.initial_window = initial_window
+        self.max_window = max_window
+        self.decrease = decrease
+        self.alpha = alpha
+
+
+class PeerStats:
+    __slots__ = ("window", "in_flight", "waiting", "requests", "errors", "bytes",
+                 "service_time", "error_rate", "first_at", "last_at", "wakeup")
+
+    def __init__(self, window: float):
+        self.window = window          # allowed requests in flight (AIMD)
+        self.in_flight = 0
+        self.waiting = 0              # requests queued in acquire() for a slot
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.service_time = 0.0       # moving average seconds per good response
+        self.error_rate = 0.0         # moving average of failures (0..1)
+        self.first_at = 0.0
+        self.last_at = 0.0
+        self.wakeup = asyncio.Event()
+
+    def goodput(self) -> float:
+        """Bytes/s actually received from this peer since the first request."""
+        elapsed = self.last_at - self.first_at
+        return self.bytes / elapsed if elapsed > 0 else 0.0
+
+
+class PeerScheduler:
+    """
+    Per-peer request windows for one download, adjusted AIMD-style.
+
+    Every successful response grows a peer's window by 1/window (about +1
+    per window's worth of responses); every failure multiplies it by
+    `decrease`. Peers are ranked by the expected time a new request would
+    take to complete there: the queueing delay behind its in-flight
+    requests plus its average service time, inflated by its error rate.
+    A peer with no completed request yet is assumed to be as fast as the
+    best one seen, so every owner gets tried.
+
+    Must be used from the event loop running the download.
+    """
+
+    def __init__(self, tunables: Optional[SchedulerTunables] = None):
+        self.tunables = tunables or SchedulerTunables()
+        self.peers: Dict[str, PeerStats] = {}
+
+    def stats(self, peer_id: str) -> PeerStats:
+        st = self.peers.get(peer_id)
+        if st is None:
+            st = self.peers[peer_id] = PeerStats(float(self.tunables.initial_window))
+        return st
+
+    def has_room(self, peer_id: str) -> bool:
+        st = self.stats(peer_id)
+        return st.in_flight < int(st.window)
+
+    def expected_completion(self, peer_id: str) -> float:
+        st = self.stats(peer_id)
+        service = st.service_time or self._best_service()
+        window = max(int(st.window), 1)
+        queued = max(st.in_flight + st.waiting + 1 - window, 0)
+        estimate = service * (1 + queued / window)
+        return estimate / max(1.0 - st.error_rate, 0.05)
+
+    def _best_service(self) -> float:
+        known = [st.service_time for st in self.peers.values() if st.service_time]
+        return min(known) if known else 1.0
+
+    def rank(self, peers: List[dict], tiebreak: Optional[Dict[str, float]] = None) -> List[dict]:
+        """Best expected completion first; `tiebreak` (e.g. latency) orders equals."""
+        tiebreak = tiebreak or {}
+        return sorted(peers, key=lambda p: (self.expected_completion(p["peer_id"]),
+                                            tiebreak.get(p["peer_id"], 9999)))
+
+    async def acquire(self, peer_id: str):
+        """Wait for a free slot in the peer's window and take it."""
+        st = self.stats(peer_id)
+        st.waiting += 1
+        try:
+            while st.in_flight >= int(st.window):
+                wakeup = st.wakeup
+                await wakeup.wait()
+        finally:
+            st.waiting -= 1
+        st.in_flight += 1
+        if not st.first_at:
+            st.first_at = time.monotonic()
+
+    def release(self, peer_id: str, nbytes: int = 0, elapsed: float = 0.0,
+                ok: Optional[bool] = None):
+        """Record the outcome of a request taken with acquire(); ok=None: abandoned."""
+        st = self.stats(peer_id)
+        st.in_flight -= 1
+        if ok is not None:
+            self._record(st, nbytes, elapsed, ok)
+        st.wakeup.set()
+        st.wakeup = asyncio.Event()
+
+    def _record(self, st: PeerStats, nbytes: int, elapsed: float, ok: bool):
+        t = self.tunables
+        st.requests += 1
+        st.last_at = time.monotonic()
+        st.error_rate += t.alpha * ((0.0 if ok else 1.0) - st.error_rate)
+        if ok:
+            st.bytes += nbytes
+            st.service_time = st.service_time + t.alpha * (elapsed - st.service_time) \
+                if st.service_time else elapsed
+            st.window = min(st.window + 1.0 / st.window, float(t.max_window))
+        else:
+            st.errors += 1
+            st.window = max(st.window * t.decrease, 1.0)
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Per-peer numbers for logs and dashboards (safe to call from other threads)."""
+        return {pid: {"window": round(st.window, 2), "in_flight": st.in_flight,
+                      "requests": st.requests, "errors": st.errors,
+                      "error_rate": round(st.error_rate, 3), "bytes": st.bytes,
+                      "goodput_bps": round(st.goodput()),
+                      "service_ms": round(st.service_time * 1000, 1)}
+                for pid, st in list(self.peers.items())}
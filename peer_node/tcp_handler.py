@@ -8,6 +8,7 @@ import sys
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 from shared.config import sanitize_stem
+from shared.metrics import CountingSocket, TCP_CONNECTIONS, TCP_RECEIVED_BYTES
 
 # Resolve STORAGE_PATH relative to this script:
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -54,9 +55,10 @@ class TCPServer:
             try:
                 client_sock, addr = self.socket.accept()
                 logger.info(f"Accepted TCP connection from {addr}")
+                TCP_CONNECTIONS.inc()
                 client_thread = threading.Thread(
                     target=self._handle_client,
-                    args=(client_sock,),
+                    args=(CountingSocket(client_sock, TCP_RECEIVED_BYTES),),
                     daemon=True
                 )
                 client_thread.start()
@@ -152,16 +154,18 @@ class TCPServer:
             data += packet
         return data
 
-def send_tcp_packet(target_ip: str, target_port: int, header: dict, file_path: Path):
+def send_tcp_packet(target_ip: str, target_port: int, header: dict, file_path: Path, span=None):
     """
     Generic TCP sender. Header must contain necessary info (packet_type, file_stem, etc.)
+    span=(offset, length) sends only that part of the file (a chunk in a pack file).
     """
     try:
         if not file_path.exists():
             return False, f"File not found: {file_path}"
             
         import os
-        header["payload_size"] = os.path.getsize(file_path)
+        offset, remaining = span or (0, os.path.getsize(file_path))
+        header["payload_size"] = remaining
         
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             s.connect((target_ip, int(target_port)))
@@ -176,11 +180,13 @@ def send_tcp_packet(target_ip: str, target_port: int, header: dict, file_path: P
             
             # Send Data
             with open(file_path, "rb") as f:
-                while True:
-                    data = f.read(4096)
+                f.seek(offset)
+                while remaining:
+                    data = f.read(min(4096, remaining))
                     if not data:
                         break
                     s.sendall(data)
+                    remaining -= len(data)
             
             return True, "Success"
             
@@ -0,0 +1,251 @@
+import base64
+from array import array
+from itertools import compress
+from typing import Dict, Iterable, List, Optional, Set
+
+# '0'/'1' digits -> 0/1 bytes, so itertools.compress can select in C
+_BITS = bytes.maketrans(b"01", b"\x00\x01")
+
+
+def _selectors(bitset: int, width: int = 0) -> bytes:
+    """One 0/1 byte per bit. LSB first, or MSB first when `width` is given."""
+    if width:
+        return format(bitset, f"0{width}b").encode().translate(_BITS)
+    return format(bitset, "b")[::-1].encode().translate(_BITS)
+
+
+class FileAvailability:
+    """
+    Availability of one file's chunks.
+
+    owners[i]  -- int bitset over interned peer numbers holding chunk i
+    held[p]    -- bytearray bitmap over chunk indices held by peer number p
+    seeds      -- int bitset of peers holding the whole file
+    changed[i] -- file version at which chunk i's owner set last changed
+    """
+    __slots__ = ("owners", "held", "seeds", "version", "changed")
+
+    def __init__(self):
+        self.owners: List[int] = []
+        self.held: Dict[int, bytearray] = {}
+        self.seeds = 0
+        self.version = 0
+        self.changed = array("L")
+
+    def _grow(self, size: int):
+        if size > len(self.owners):
+            extra = size - len(self.owners)
+            self.owners.extend([0] * extra)
+            self.changed.extend([0] * extra)
+
+    def bump(self, indices: Iterable[int]):
+        self.version += 1
+        for idx in indices:
+            self.changed[idx] = self.version
+
+
+class ChunkIndex:
+    """
+    Tracker-side chunk availability index.
+
+    Peer ids are interned to small integers, so every (chunk, peer) pair costs
+    one bit in two bitmaps instead of a set entry holding a peer_id string:
+    an int bitset per chunk answers "owners of chunk i", and a bytearray per
+    (file, peer) answers "chunks held by peer p". A peer -> files reverse
+    index lets a departed peer be purged without scanning every file.
+    Not thread-safe and has no lock: only MemoryState (state.py) touches it,
+    from methods that never await, so the tracker's event loop serialises
+    every access.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._names: List[Optional[str]] = []
+        self._free: List[int] = []
+        self._files: Dict[str, FileAvailability] = {}
+        # reverse index: peer number -> files it has any bits in
+        self._peer_files: Dict[int, Set[str]] = {}
+
+    # ── Peer interning ─────────────────────────────────────────
+    def intern(self, peer_id: str) -> int:
+        num = self._ids.get(peer_id)
+        if num is None:
+            if self._free:
+                num = self._free.pop()
+                self._names[num] = peer_id
+            else:
+                num = len(self._names)
+                self._names.append(peer_id)
+            self._ids[peer_id] = num
+        return num
+
+    def _decode(self, bitset: int) -> List[str]:
+        return list(compress(self._names, _selectors(bitset)))
+
+    # ── Updates ────────────────────────────────────────────────
+    def add(self, file_stem: str, peer_id: str, indices: Iterable[int],
+            limit: Optional[int] = None) -> List[int]:
+        """
+        Record that peer holds `indices`; returns the indices that were new.
+        Indices >= `limit` (the file's chunk count) are ignored, so the
+        bitmaps never grow past it.
+        """
+        indices = sorted(i for i in set(indices) if i >= 0 and (limit is None or i < limit))
+        if not indices:
+            return []
+        fa = self._files.setdefault(file_stem, FileAvailability())
+        num = self.intern(peer_id)
+        if fa.seeds >> num & 1:
+            return []
+        fa._grow(indices[-1] + 1)
+        held = fa.held.get(num)
+        if held is None:
+            held = fa.held[num] = bytearray()
+        if len(held) * 8 <= indices[-1]:
+            held.extend(bytes((indices[-1] >> 3) + 1 - len(held)))
+
+        self._peer_files.setdefault(num, set()).add(file_stem)
+        mask = 1 << num
+        added = []
+        for idx in indices:
+            bit = 0x80 >> (idx & 7)
+            if not held[idx >> 3] & bit:
+                held[idx >> 3] |= bit
+                fa.owners[idx] |= mask
+                added.append(idx)
+        if added:
+            fa.bump(added)
+        return added
+
+    def add_seed(self, file_stem: str, peer_id: str) -> bool:
+        """Mark peer as holding the whole file; its per-chunk bits are dropped."""
+        fa = self._files.setdefault(file_stem, FileAvailability())
+        num = self.intern(peer_id)
+        mask = 1 << num
+        if fa.seeds & mask:
+            return False
+        fa.seeds |= mask
+        self._peer_files.setdefault(num, set()).add(file_stem)
+        dropped = self._clear(fa, num)
+        fa.bump(dropped)
+        return True
+
+    def remove_peer(self, peer_id: str) -> List[str]:
+        """
+        Drop every chunk and seed entry for a peer in one pass over the files
+        it touched, and release its interned number. Returns affected files.
+        """
+        num = self._ids.pop(peer_id, None)
+        if num is None:
+            return []
+        files = self._peer_files.pop(num, set())
+        for file_stem in files:
+            fa = self._files.get(file_stem)
+            if not fa:
+                continue
+            was_seed = fa.seeds >> num & 1
+            fa.seeds &= ~(1 << num)
+            dropped = self._clear(fa, num)
+            if dropped or was_seed:
+                fa.bump(dropped)
+        self._names[num] = None
+        self._free.append(num)
+        return sorted(files)
+
+    def reset_file(self, file_stem: str) -> List[int]:
+        """Forget every owner and seed of a file (re-published with new content); returns the chunks dropped."""
+        fa = self._files.get(file_stem)
+        if not fa:
+            return []
+        nums = set(fa.held) | {num for num, bit in enumerate(_selectors(fa.seeds)) if bit}
+        for num in nums:
+            self._peer_files.get(num, set()).discard(file_stem)
+        dropped = [idx for idx, bits in enumerate(fa.owners) if bits]
+        had_seeds = bool(fa.seeds)
+        fa.held.clear()
+        fa.seeds = 0
+        for idx in dropped:
+            fa.owners[idx] = 0
+        if dropped or had_seeds:
+            fa.bump(dropped)
+        return dropped
+
+    def _clear(self, fa: FileAvailability, num: int) -> List[int]:
+        held = fa.held.pop(num, None)
+        if not held:
+            return []
+        mask = ~(1 << num)
+        dropped = self._held_indices(held)
+        for idx in dropped:
+            fa.owners[idx] &= mask
+        return dropped
+
+    @staticmethod
+    def _held_indices(held: bytearray) -> List[int]:
+        width = len(held) * 8
+        bits = _selectors(int.from_bytes(held, "big"), width)
+        return list(compress(range(width), bits))
+
+    # ── Queries ────────────────────────────────────────────────
+    def chunk_owners(self, file_stem: str, chunk_index: int) -> List[str]:
+        """Peers announcing this chunk individually (seeds not included)."""
+        fa = self._files.get(file_stem)
+        if not fa or chunk_index < 0 or chunk_index >= len(fa.owners):
+            return []
+        return self._decode(fa.owners[chunk_index])
+
+    def seeds(self, file_stem: str) -> List[str]:
+        fa = self._files.get(file_stem)
+        return self._decode(fa.seeds) if fa else []
+
+    def chunks_of(self, file_stem: str, peer_id: str) -> List[int]:
+        """Chunk indices peer has announced individually for this file."""
+        fa = self._files.get(file_stem)
+        num = self._ids.get(peer_id)
+        if not fa or num is None:
+            return []
+        held = fa.held.get(num)
+        return self._held_indices(held) if held else []
+
+    def is_seed(self, file_stem: str, peer_id: str) -> bool:
+        fa = self._files.get(file_stem)
+        num = self._ids.get(peer_id)
+        return bool(fa and num is not None and fa.seeds >> num & 1)
+
+    def version(self, file_stem: str) -> int:
+        fa = self._files.get(file_stem)
+        return fa.version if fa else 0
+
+    def owner_map(self, file_stem: str, since: int = 0) -> Dict[int, List[str]]:
+        """
+        chunk_index -> individual owners. With `since`, only chunks whose owner
+        set changed after that version (possibly now empty) are returned.
+        """
+        fa = self._files.get(file_stem)
+        if not fa:
+            return {}
+        if since:
+            return {idx: self._decode(fa.owners[idx])
+                    for idx, v in enumerate(fa.changed) if v > since}
+        return {idx: self._decode(bits) for idx, bits in enumerate(fa.owners) if bits}
+
+    # ── Persistence ────────────────────────────────────────────
+    def export(self) -> Dict[str, dict]:
+        """JSON-ready copy: per file, seed ids and base64 held bitmaps per peer."""
+        return {
+            file_stem: {
+                "seeds": self._decode(fa.seeds),
+                "held": {self._names[num]: base64.b64encode(bytes(held)).decode()
+                         for num, held in fa.held.items() if any(held)},
+            }
+            for file_stem, fa in self._files.items()
+        }
+
+    def restore(self, state: Dict[str, dict]):
+        """Load the output of export() into this (normally empty) index."""
+        for file_stem, entry in state.items():
+            for peer_id in entry.get("seeds", []):
+                self.add_seed(file_stem, peer_id)
+            for peer_id, bitmap in entry.get("held", {}).items():
+                held = bytearray(base64.b64decode(bitmap))
+                self.add(file_stem, peer_id, self._held_indices(held))
@@ -3,7 +3,11 @@ import hashlib
 import mimetypes
 
 # Local import
-from config import STORAGE_DIR, CHUNK_SIZE
+from config import STORAGE_DIR
+from shared.chunker import write_chunks
+from shared.chunk_store import ChunkStore
+from shared.merkle import merkle_root
+from shared.config import normalize_stem, CHUNKING
 
 # Ensure we point to the project root storage if running from subdirectory
 # Resolve STORAGE_PATH relative to this script:
@@ -33,47 +37,34 @@ def detect_mime_type(file_path: Path) -> str:
         pass
     return 'application/octet-stream'
 
-def chunk_file(file_path: str, out_dir: str = None):
-    chunks = []
+def chunk_file(file_path: str, out_dir: str = None, workers: int = None, progress=None,
+               store: ChunkStore = None, chunking: str = None):
+    """
+    Chunk a file for publishing; see shared.chunker.write_chunks for workers/progress/chunking.
+    Chunks go to out_dir if given, else into `store` (default: the tracker's chunk store).
+    """
     file_path = Path(file_path)
     if out_dir:
         out_dir_path = Path(out_dir)
+        out_dir_path.mkdir(parents=True, exist_ok=True)
     else:
-        out_dir_path = STORAGE_PATH / "chunks"
+        out_dir_path = None
+        store = store or ChunkStore(STORAGE_PATH / "chunk_store", holder="tracker")
 
-    out_dir_path.mkdir(parents=True, exist_ok=True)
     mime_type = detect_mime_type(file_path)
+    chunks, file_hash = write_chunks(file_path, out_dir_path, normalize_stem(file_path.name),
+                                     workers=workers, progress=progress, store=store,
+                                     chunking=chunking)
 
-    with open(file_path, "rb") as f:
-        index = 0
-        while True:
-            data = f.read(CHUNK_SIZE)
-            if not data:
-                break
-
-            chunk_hash = sha256(data)
-            from shared.config import normalize_stem
-            safe_stem = normalize_stem(file_path.name)
-            chunk_name = f"{safe_stem}_chunk_{index}"
-            chunk_path = out_dir_path / chunk_name
-
-            with open(chunk_path, "wb") as cf:
-                cf.write(data)
-
-            chunks.append({
-                "index": index,
-                "hash": chunk_hash,
-                "filename": chunk_name,
-                "size": len(data)
-            })
-            index += 1
-
-    from shared.config import normalize_stem
     return {
         "original_name": file_path.name,
         "original_extension": file_path.suffix,
         "file_stem": normalize_stem(file_path.name),
         "mime_type": mime_type,
+        "file_size": sum(c["size"] for c in chunks),
+        "file_hash": file_hash,
+        "merkle_root": merkle_root([c["hash"] for c in chunks]),
+        "chunking": chunking or CHUNKING,
         "chunks": chunks,
         "total_chunks": len(chunks)
     }
\ No newline at end of file
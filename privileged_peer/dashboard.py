@@ -9,6 +9,7 @@ ADMIN_KEY = load_admin_key()
 from chunker import chunk_file
 from metadata import save_metadata
 from tcp_handler import send_tcp_packet, STORAGE_PATH
+from shared.chunk_store import ChunkStore
 import socket
 from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -16,10 +17,12 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 from shared.config import (
     CHUNK_SIZE, DEFAULT_TRACKER_PORT, get_lan_ip,
     find_available_port, sanitize_stem,
-    PeerInfo, ChunkLocation, FileMetadata, ChunkData
+    PeerInfo, ChunkLocation, FileMetadata, ChunkData,
+    CATALOG_PAGE_SIZE, CATALOG_MIME_FILTERS, CATALOG_SORTS, CHUNKING
 )
 
 SERVER_URL = f"http://localhost:{DEFAULT_TRACKER_PORT}"
+chunk_store = ChunkStore(STORAGE_PATH / "chunk_store", holder="tracker")
 
 # Initialize session state
 if 'files' not in st.session_state:
@@ -35,6 +38,10 @@ if page == "Publish New File":
     st.header("Publish & Share File")
     
     uploaded = st.file_uploader("Upload Assignment/File", type=['pdf', 'docx', 'txt', 'zip', 'jpg', 'png', 'mp4'])
+    content_defined = st.checkbox(
+        "Content-defined chunks", value=CHUNKING == "cdc",
+        help="Chunk boundaries follow the content, so re-publishing an edited "
+             "file only sends the chunks that changed (slower to chunk)")
     
     if uploaded:
         # Save uploaded file to project root storage
@@ -51,7 +58,19 @@ if page == "Publish New File":
         
         # Chunk the file
         # chunker.py uses STORAGE_PATH = ../storage
-        chunk_info = chunk_file(str(file_path))
+        progress_bar = st.progress(0)
+        shown = [0.0]
+
+        def _progress(done, total):
+            # Redraw per percent, not per chunk
+            if done == total or done / total - shown[0] >= 0.01:
+                shown[0] = done / total
+                progress_bar.progress(shown[0])
+
+        with st.spinner("Chunking and hashing..."):
+            chunk_info = chunk_file(str(file_path), progress=_progress,
+                                    chunking="cdc" if content_defined else "fixed")
+        progress_bar.empty()
         save_metadata(chunk_info)
         
         st.session_state.files[uploaded.name] = chunk_info
@@ -81,8 +100,22 @@ if page == "Publish New File":
     st.divider()
     st.subheader("Global File Registry (Active Shares)")
 
-    # Search Bar
-    search_query = st.text_input("🔍 Search Files", placeholder="Type to filter...")
+    # Search Bar (filtering, sorting and paging happen on the tracker)
+    c_search, c_type, c_sort = st.columns([3, 2, 2])
+    with c_search:
+        search_query = st.text_input("🔍 Search Files", placeholder="Type to filter...")
+    with c_type:
+        mime_label = st.selectbox("Type", list(CATALOG_MIME_FILTERS))
+    with c_sort:
+        sort_label = st.selectbox("Sort by", list(CATALOG_SORTS))
+    filters = {"q": search_query, "mime": CATALOG_MIME_FILTERS[mime_label],
+               "sort": CATALOG_SORTS[sort_label]}
+
+    # Cursor of every page visited so far; new filters start again at page 1
+    if st.session_state.get("registry_filters") != filters:
+        st.session_state.registry_filters = filters
+        st.session_state.registry_cursors = [""]
+    cursors = st.session_state.registry_cursors
 
     if st.button("Refresh File List"):
         st.rerun()
@@ -98,17 +131,12 @@ if page == "Publish New File":
             st.error(f"Error: {e}")
 
     try:
-        res = requests.get(f"{SERVER_URL}/files")
+        res = requests.get(f"{SERVER_URL}/files", params={
+            "limit": CATALOG_PAGE_SIZE, "cursor": cursors[-1], **filters})
         if res.status_code == 200:
-            files = res.json()
-            if files:
-                # Filter files
-                filtered_files = [f for f in files if search_query.lower() in f['name'].lower()]
-                
-                if not filtered_files:
-                    st.info("No files match your search.")
-                
-                for f in filtered_files:
+            catalog = res.json()
+            if catalog["items"]:
+                for f in catalog["items"]:
                     with st.container(border=True):
                         c1, c2, c3 = st.columns([3, 1, 1])
                         with c1:
@@ -196,12 +224,18 @@ if page == "Publish New File":
                                                 err = False
                                                 for i in range(f['total_chunks']):
                                                      chunk_name = f"{f['stem']}_chunk_{i}"
-                                                     chunk_path = STORAGE_PATH / "chunks" / chunk_name
+                                                     chunk_hash = chunk_store.ref(f['stem'], i)
+                                                     packed = chunk_store.span(chunk_hash) if chunk_hash else None
+                                                     if packed is not None:
+                                                         # Its bytes within a pack file
+                                                         chunk_path, span = packed[0], packed[1:]
+                                                     else:
+                                                         chunk_path, span = STORAGE_PATH / "chunks" / chunk_name, None
                                                      if not chunk_path.exists():
                                                          # Try fallback (received?)
-                                                         chunk_path = STORAGE_PATH / "received_chunks" / chunk_name
+                                                         chunk_path, span = STORAGE_PATH / "received_chunks" / chunk_name, None
                                                      
-                                                     ok, msg = send_tcp_packet(target_ip, target_port, {"packet_type": "chunk", "file_stem": f['stem'], "chunk_index": i}, chunk_path)
+                                                     ok, msg = send_tcp_packet(target_ip, target_port, {"packet_type": "chunk", "file_stem": f['stem'], "chunk_index": i}, chunk_path, span=span)
                                                      if not ok:
                                                          st.error(f"Chunk {i} failed to {peer['peer_id']}")
                                                          err = True
@@ -216,6 +250,20 @@ if page == "Publish New File":
                                             if success_cnt == len(final_targets):
                                                 st.success("Transfer Completed Successfully!")
 
+                p_prev, p_info, p_next = st.columns([1, 2, 1])
+                with p_prev:
+                    if st.button("◀ Previous", key="registry_prev", disabled=len(cursors) == 1):
+                        cursors.pop()
+                        st.rerun()
+                with p_info:
+                    pages = max(1, -(-catalog["total"] // CATALOG_PAGE_SIZE))
+                    st.caption(f"Page {len(cursors)} of {pages} · {catalog['total']} files")
+                with p_next:
+                    if st.button("Next ▶", key="registry_next", disabled=not catalog["next_cursor"]):
+                        cursors.append(catalog["next_cursor"])
+                        st.rerun()
+            elif search_query or filters["mime"]:
+                st.info("No files match your search.")
             else:
                 st.info("No files currently registered.")
         else:
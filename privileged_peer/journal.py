@@ -0,0 +1,129 @@
+import json
+import os
+import queue
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Callable, Optional
+
+# Resolve STORAGE_PATH relative to this script:
+BASE_DIR = Path(__file__).resolve().parent.parent
+STORAGE_PATH = BASE_DIR / "storage"
+
+JOURNAL_FLUSH_INTERVAL = 0.2   # seconds between write-behind flushes
+
+
+class StateJournal:
+    """
+    Write-behind journal plus periodic snapshot for tracker state.
+
+    Mutations are appended as JSON lines (`{"op": ..., ...}`) to journal.log by
+    a background thread, so request handlers only pay for a queue put. A
+    snapshot is queued behind the records that preceded it; once written
+    atomically it replaces the journal, so replay is snapshot + short tail.
+
+    Records are flushed to the OS every JOURNAL_FLUSH_INTERVAL seconds but not
+    fsync'ed: a power cut can lose the last fraction of a second of
+    announcements, which peers re-send on their next join anyway.
+    """
+
+    def __init__(self, state_dir: Path = STORAGE_PATH / "tracker_state"):
+        self.state_dir = state_dir
+        self.journal_path = state_dir / "journal.log"
+        self.snapshot_path = state_dir / "snapshot.json"
+        self.records_since_snapshot = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    def has_state(self) -> bool:
+        return self.snapshot_path.exists() or self.journal_path.exists()
+
+    # ── Producer side (event loop) ─────────────────────────────
+    def append(self, record: dict):
+        self.records_since_snapshot += 1
+        self._queue.put(("record", record))
+
+    def snapshot(self, state: dict):
+        """`state` must already be a private copy; it is serialized off-loop."""
+        self.records_since_snapshot = 0
+        self._queue.put(("snapshot", state))
+
+    def close(self, timeout: float = 5.0):
+        """Flush everything queued so far and stop the writer."""
+        if self._thread:
+            self._queue.put(("stop", None))
+            self._thread.join(timeout)
+            self._thread = None
+
+    # ── Replay ────────────────────────────────────────────────
+    def replay(self, apply_snapshot: Callable[[dict], None],
+               apply_record: Callable[[dict], None]) -> int:
+        """Feed the snapshot, then every journal record, to the callbacks."""
+        if self.snapshot_path.exists():
+            try:
+                apply_snapshot(json.loads(self.snapshot_path.read_text(encoding="utf-8")))
+            except Exception as e:
+                logging.warning(f"[JOURNAL] Ignoring unreadable snapshot: {e}")
+        count = 0
+        if self.journal_path.exists():
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn final line from a crash mid-write
+                        break
+                    apply_record(record)
+                    count += 1
+        self.records_since_snapshot = count
+        return count
+
+    # ── Writer thread ─────────────────────────────────────────
+    def _writer(self):
+        journal = open(self.journal_path, "a", encoding="utf-8")
+        try:
+            while True:
+                # Block for the first item, then take everything queued behind it
+                batch = [self._queue.get()]
+                try:
+                    while True:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    pass
+
+                lines = []
+                for kind, payload in batch:
+                    if kind == "record":
+                        lines.append(json.dumps(payload, separators=(",", ":")) + "\n")
+                        continue
+                    journal.write("".join(lines))
+                    lines = []
+                    if kind == "snapshot":
+                        journal = self._write_snapshot(journal, payload)
+                    elif kind == "stop":
+                        journal.flush()
+                        return
+                journal.write("".join(lines))
+                journal.flush()
+                time.sleep(JOURNAL_FLUSH_INTERVAL)
+        except Exception as e:
+            logging.error(f"[JOURNAL] Writer stopped: {e}")
+        finally:
+            journal.close()
+
+    def _write_snapshot(self, journal, state: dict):
+        tmp = self.snapshot_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        # Everything before the snapshot is now redundant
+        journal.close()
+        return open(self.journal_path, "w", encoding="utf-8")
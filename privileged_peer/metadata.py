@@ -1,7 +1,12 @@
 import json
+import logging
 from pathlib import Path
+from typing import Dict, Optional, Tuple
 import mimetypes
 
+from shared.metrics import TimedLock
+from shared.merkle import MerkleTree
+
 # Resolve STORAGE_PATH relative to this script:
 BASE_DIR = Path(__file__).resolve().parent.parent
 STORAGE_PATH = BASE_DIR / "storage"
@@ -18,6 +23,9 @@ def save_metadata(chunk_info: dict):
             - chunks: List of chunk dictionaries
             - total_chunks: Total number of chunks
             - mime_type: MIME type of the file
+            - file_size, file_hash, merkle_root: whole-file size and SHA-256,
+              and the Merkle root over the chunk hashes (optional)
+            - chunking: "fixed" or "cdc" (content-defined chunk sizes; optional)
     """
     meta = {
         "original_name": chunk_info["original_name"],
@@ -27,6 +35,9 @@ def save_metadata(chunk_info: dict):
         "total_chunks": chunk_info["total_chunks"],
         "chunks": chunk_info["chunks"]
     }
+    for key in ("file_size", "file_hash", "merkle_root", "chunking"):
+        if key in chunk_info:
+            meta[key] = chunk_info[key]
     
     STORAGE_PATH.joinpath("metadata").mkdir(parents=True, exist_ok=True)
     
@@ -141,4 +152,117 @@ def get_file_metadata_by_stem(file_stem: str):
         except:
             continue
     
-    return None
\ No newline at end of file
+    return None
+
+class MetadataIndex:
+    """
+    In-memory copy of storage/metadata for the tracker.
+
+    Each entry holds the parsed metadata plus its compact pre-serialized JSON
+    and ETag, so GET /metadata is a dict lookup instead of filesystem probing.
+    Loaded once at startup and refreshed by register/unregister/flush and TCP
+    metadata pushes. Thread-safe: TCP pushes arrive on handler threads.
+
+    With `check_disk`, get() stats the file and reloads it when its mtime
+    changed, for trackers whose other workers may rewrite storage/metadata.
+    """
+
+    def __init__(self, metadata_dir: Path = STORAGE_PATH / "metadata", check_disk: bool = False):
+        self.metadata_dir = metadata_dir
+        self.check_disk = check_disk
+        self._entries: Dict[str, Tuple[dict, bytes, str]] = {}
+        self._mtimes: Dict[str, int] = {}
+        self._trees: Dict[str, Tuple[str, MerkleTree]] = {}   # stem -> (etag, tree)
+        self._lock = TimedLock("metadata_index")
+
+    def load_all(self) -> int:
+        """(Re)build the index from every *.json in the metadata directory."""
+        entries, mtimes = {}, {}
+        if self.metadata_dir.exists():
+            for meta_file in self.metadata_dir.glob("*.json"):
+                mtime = self._mtime(meta_file)
+                entry = self._read(meta_file)
+                if entry:
+                    entries[meta_file.stem] = entry
+                    mtimes[meta_file.stem] = mtime
+        with self._lock:
+            self._entries = entries
+            self._mtimes = mtimes
+        return len(entries)
+
+    def load(self, file_stem: str) -> Optional[dict]:
+        """Re-read one file's metadata from disk; drops the entry if it is gone."""
+        meta_path = self.metadata_dir / f"{file_stem}.json"
+        mtime = self._mtime(meta_path)
+        entry = self._read(meta_path)
+        with self._lock:
+            if entry:
+                self._entries[file_stem] = entry
+                self._mtimes[file_stem] = mtime
+            else:
+                self._entries.pop(file_stem, None)
+                self._mtimes.pop(file_stem, None)
+        return entry[0] if entry else None
+
+    def remove(self, file_stem: str):
+        with self._lock:
+            self._entries.pop(file_stem, None)
+            self._mtimes.pop(file_stem, None)
+            self._trees.pop(file_stem, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._mtimes.clear()
+            self._trees.clear()
+
+    def get(self, file_stem: str) -> Optional[Tuple[dict, bytes, str]]:
+        """(metadata, serialized bytes, etag) or None."""
+        if self.check_disk and Path(file_stem).name == file_stem:
+            mtime = self._mtime(self.metadata_dir / f"{file_stem}.json")
+            with self._lock:
+                fresh = self._mtimes.get(file_stem) == mtime
+            if not fresh:
+                self.load(file_stem)
+        with self._lock:
+            return self._entries.get(file_stem)
+
+    def merkle_tree(self, file_stem: str) -> Optional[MerkleTree]:
+        """Merkle tree over a file's chunk hashes, built on first use per metadata version."""
+        entry = self.get(file_stem)
+        if entry is None:
+            return None
+        meta, _, etag = entry
+        with self._lock:
+            cached = self._trees.get(file_stem)
+        if cached and cached[0] == etag:
+            return cached[1]
+        tree = MerkleTree([c["hash"] for c in meta.get("chunks", [])])
+        with self._lock:
+            self._trees[file_stem] = (etag, tree)
+        return tree
+
+    def items(self):
+        with self._lock:
+            return [(stem, entry[0]) for stem, entry in self._entries.items()]
+
+    @staticmethod
+    def _mtime(meta_path: Path) -> int:
+        try:
+            return meta_path.stat().st_mtime_ns
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _read(meta_path: Path) -> Optional[Tuple[dict, bytes, str]]:
+        from shared.metadata import metadata_etag
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Failed to load metadata {meta_path}: {e}")
+            return None
+        raw = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        return data, raw, metadata_etag(raw)
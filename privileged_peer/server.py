@@ -1,9 +1,10 @@
 from fastapi import FastAPI, HTTPException, Request, Depends
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.security import APIKeyHeader
 from pathlib import Path
-import json, time, asyncio, secrets
-from typing import Dict, List, Set, Optional
+import json, time, asyncio, secrets, base64
+from typing import Callable, Dict, List, Set, Optional, Tuple
+from functools import partial
 from pydantic import BaseModel
 
 import os
@@ -11,14 +12,24 @@ import socket, logging, sys
 BASE_DIR = Path(__file__).resolve().parent.parent
 sys.path.append(str(BASE_DIR))
 
-from security.auth import issue_token, validate_token, revoke_token
+from security.auth import issue_token, validate_token
 from security.hashing import sha256
 from security.crypto import load_or_generate_keys
 from tcp_handler import TCPServer
+from metadata import MetadataIndex
+from state import make_state
 from shared.config import (
-    DEFAULT_TRACKER_PORT, STORAGE_DIR, get_lan_ip,
+    DEFAULT_TRACKER_PORT, STORAGE_DIR, HTTP_KEEPALIVE_TIMEOUT, get_lan_ip,
     sanitize_stem, PeerInfo, FileMetadata, ChunkLocation, ChunkData
 )
+from shared.bitfield import ranges_to_indices, decode_bitfield
+from shared.byte_range import (
+    RangeNotSatisfiable, parse_range, content_range, unsatisfied_range, read_span
+)
+from shared.chunk_store import ChunkStore
+from shared.metrics import (
+    Counter, MetricsMiddleware, CHUNKS_SERVED, CHUNK_BYTES_SERVED, CONTENT_TYPE, render
+)
 
 # Configuration Constants
 CHUNK_SIZE = 1024 * 512  # 512 KB
@@ -91,96 +102,110 @@ async def require_admin(key: str = Depends(_admin_header)):
         raise HTTPException(status_code=403, detail="Invalid admin key")
 
 app = FastAPI(title="Privileged Peer Tracker")
-
-# Store approved peers: peer_id -> PeerInfo
-approved_peers: Dict[str, PeerInfo] = {}
-approved_peers_lock = asyncio.Lock()
-
-PEERS_PERSIST_PATH = STORAGE_PATH / "peers.json"
-
-def save_peers():
-    """Persist approved_peers to disk."""
-    try:
-        data = {
-            pid: {
-                "peer_id": p.peer_id,
-                "host": p.host,
-                "port": p.port,
-                "tcp_port": p.tcp_port,
-                "status": p.status,
-                "public_key": p.public_key,
-                "last_seen": p.last_seen
-            }
-            for pid, p in approved_peers.items()
-        }
-        PEERS_PERSIST_PATH.write_text(json.dumps(data, indent=2))
-    except Exception as e:
-        logging.warning(f"Failed to persist peers: {e}")
-
-def load_peers():
-    """Load approved_peers from disk on startup."""
-    if not PEERS_PERSIST_PATH.exists():
-        return
+app.add_middleware(MetricsMiddleware)
+
+# Served on /metrics. With TRACKER_WORKERS > 1 each worker counts its own
+# requests, so scrape every worker (or sum what the load balancer returns).
+ANNOUNCES = Counter("tracker_announces_total", "Announce requests by kind", ["kind"])
+ANNOUNCED_CHUNKS = Counter("tracker_announced_chunks_total", "Chunks newly recorded by announces")
+LOOKUPS = Counter("tracker_lookups_total", "Owner, availability and metadata lookups", ["kind"])
+
+# Approved peers, the file registry and chunk availability live in a state
+# backend (see state.py): in-process dicts + journal by default, or a shared
+# SQLite database so several uvicorn workers can serve one tracker.
+state = make_state()
+TRACKER_WORKERS = int(os.environ.get("TRACKER_WORKERS", "1"))
+REVOCATION_SYNC_INTERVAL = 2   # seconds; shared backends only
+
+# Peers reported unreachable are probed by the tracker; a failed probe purges
+# their availability until a heartbeat proves they are reachable again.
+UNREACHABLE_PROBE_TIMEOUT = 2.0
+_probing: Set[str] = set()
+
+# full metadata documents, pre-serialized with ETags (see metadata.py).
+# Other workers may change storage/metadata, so shared state re-checks disk.
+metadata_index = MetadataIndex(STORAGE_PATH / "metadata", check_disk=state.shared)
+
+# Published chunks, stored once per distinct hash (files chunked before the
+# store existed are still served from storage/chunks)
+chunk_store = ChunkStore(STORAGE_PATH / "chunk_store", holder="tracker")
+
+# One worker runs the TCP server, UDP broadcast and cleanup loop
+_leader_lock = None
+
+def _claim_leader() -> bool:
+    global _leader_lock
+    if not state.shared:
+        return True
+    lock_path = STORAGE_PATH / "tracker_state" / "leader.lock"
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    f = open(lock_path, "a+")
     try:
-        data = json.loads(PEERS_PERSIST_PATH.read_text())
-        for pid, p in data.items():
-            approved_peers[pid] = PeerInfo(**p)
-            # Re-issue tokens for previously known peers
-            issue_token(pid)
-        logging.info(f"Restored {len(approved_peers)} peers from disk.")
-    except Exception as e:
-        logging.warning(f"Failed to load peers: {e}")
-
-# track chunk locations: file_hash -> chunk_index -> Set[peer_id]
-chunk_locations: Dict[str, Dict[int, Set[str]]] = {}
-chunk_locations_lock = asyncio.Lock()
-
-# file metadata cache: file_stem -> FileMetadata
-file_registry: Dict[str, FileMetadata] = {}
-file_registry_lock = asyncio.Lock()
+        if os.name == "nt":
+            import msvcrt
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    # Held (and released by the OS) for the life of the process
+    _leader_lock = f
+    return True
+
+IS_LEADER = False
 
 def generate_token():
     return secrets.token_urlsafe(32)
 
 @app.on_event("startup")
 async def startup_event():
-    load_peers()
-    # Load existing metadata into registry
-    metadata_dir = STORAGE_PATH / "metadata"
-    if metadata_dir.exists():
-        for meta_file in metadata_dir.glob("*.json"):
-            try:
-                with open(meta_file, "r") as f:
-                    data = json.load(f)
-                    # Support legacy format by checking keys
-                    if "file_stem" in data:
-                        stem = data["file_stem"]
-                        # Assume hash is stem for now if not present (legacy compat)
-                        file_hash = data.get("file_hash", stem) 
-                        file_registry[stem] = FileMetadata(
-                            file_name=data.get("original_name", stem),
-                            file_hash=file_hash,
-                            total_chunks=data.get("total_chunks", 0),
-                            file_size=0, # Legacy might not have this
-                            mime_type=data.get("mime_type", "application/octet-stream")
-                        )
-            except Exception as e:
-                print(f"Failed to load metadata {meta_file}: {e}")
+    global IS_LEADER
+    IS_LEADER = _claim_leader()
+    await state.open()
+    # Load existing metadata into the index and the registry
+    count = metadata_index.load_all()
+    for stem, data in metadata_index.items():
+        meta = _registry_entry(stem, data)
+        if meta and await state.get_file(stem) != meta:
+            await _put_file(stem, meta)
+    logging.info(f"Indexed metadata for {count} file(s).")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await state.close()
+
+async def _put_file(stem: str, meta: FileMetadata):
+    """Register a file; if this replaces different content, who held the old chunks no longer counts."""
+    old = await state.get_file(stem)
+    if old is not None and (old.file_hash, old.merkle_root) != (meta.file_hash, meta.merkle_root):
+        await state.reset_file(stem)
+    await state.put_file(stem, meta)
+
+def _registry_entry(stem: str, data: dict) -> Optional[FileMetadata]:
+    """Registry entry for a metadata document (legacy formats included)."""
+    if "file_stem" not in data:
+        return None
+    return FileMetadata(
+        file_name=data.get("original_name", stem),
+        # Assume hash is stem for now if not present (legacy compat)
+        file_hash=data.get("file_hash", stem),
+        total_chunks=data.get("total_chunks", 0),
+        file_size=data.get("file_size", sum(c.get("size", 0) for c in data.get("chunks", []))),
+        mime_type=data.get("mime_type", "application/octet-stream"),
+        merkle_root=data.get("merkle_root", "")
+    )
 
 @app.post("/join")
 async def join(peer: PeerInfo):
     peer.last_seen = time.time()
-    async with approved_peers_lock:
-        if peer.peer_id in approved_peers:
-            approved_peers[peer.peer_id] = peer
-            save_peers()
-            # Re-issue token so the peer gets a fresh one
-            token = issue_token(peer.peer_id)
-            return {"status": "rejoined", "token": token}
-
+    if await state.put_peer(peer):
+        # Re-issue token so the peer gets a fresh one
         token = issue_token(peer.peer_id)
-        approved_peers[peer.peer_id] = peer
-        save_peers()
+        return {"status": "rejoined", "token": token}
+
+    token = issue_token(peer.peer_id)
     return {
         "status": "approved",
         "token": token,
@@ -188,6 +213,41 @@ async def join(peer: PeerInfo):
         "tracker_ip": get_lan_ip()
     }
 
+async def _purge_peer_availability(peer_id: str):
+    """Drop every chunk/seed entry for a peer via the reverse index."""
+    files = await state.purge_peer(peer_id)
+    if files:
+        logging.info(f"[AVAILABILITY] Purged {peer_id} from {len(files)} file(s)")
+
+async def _probe_peer(host: str, port: int) -> bool:
+    """TCP connect check, same idea as the peers' cluster latency probe."""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port),
+                                           timeout=UNREACHABLE_PROBE_TIMEOUT)
+        writer.close()
+        return True
+    except Exception:
+        return False
+
+def _tracker_descriptor() -> dict:
+    return {"peer_id": "privileged_peer", "host": get_lan_ip(),
+            "port": DEFAULT_TRACKER_PORT, "type": "tracker"}
+
+def _tracker_has_chunk(file_stem: str, chunk_index: int) -> bool:
+    return (chunk_store.ref(file_stem, chunk_index) is not None
+            or (STORAGE_PATH / "chunks" / f"{file_stem}_chunk_{chunk_index}").exists())
+
+def _tracker_chunk(file_stem: str, chunk_index: int) -> Optional[Tuple[int, Callable[[int, int], bytes]]]:
+    """Size and a read(start, stop) of a chunk in the chunk store's packs, else a legacy chunk file."""
+    chunk_hash = chunk_store.ref(file_stem, chunk_index)
+    size = chunk_store.size(chunk_hash) if chunk_hash is not None else None
+    if size is not None:
+        return size, partial(chunk_store.read, chunk_hash)
+    path = STORAGE_PATH / "chunks" / f"{file_stem}_chunk_{chunk_index}"
+    if path.exists():
+        return path.stat().st_size, partial(read_span, path)
+    return None
+
 class Announcement(BaseModel):
     file_stem: str
     chunk_index: int
@@ -199,17 +259,65 @@ async def announce_chunk_endpoint(announcement: Announcement,
         raise HTTPException(status_code=403, detail="Unauthorized")
     
     # Update last_seen
-    async with approved_peers_lock:
-        if peer_id in approved_peers:
-            approved_peers[peer_id].last_seen = time.time()
+    await state.touch(peer_id)
 
     file_id = sanitize_stem(announcement.file_stem)   # ← sanitize here
-    async with chunk_locations_lock:
-        if file_id not in chunk_locations:
-            chunk_locations[file_id] = {}
-        chunk_locations[file_id].setdefault(announcement.chunk_index, set()).add(peer_id)
+    meta = await state.get_file(file_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not 0 <= announcement.chunk_index < meta.total_chunks:
+        raise HTTPException(status_code=400, detail="Chunk index out of range")
+    added = await state.add_chunks(file_id, peer_id, [announcement.chunk_index],
+                                   meta.total_chunks)
+    ANNOUNCES.labels("single").inc()
+    ANNOUNCED_CHUNKS.inc(len(added))
     return {"status": "acknowledged"}
 
+class BatchAnnouncement(BaseModel):
+    file_stem: str
+    indices: List[int] = []
+    ranges: List[List[int]] = []    # half-open [start, end)
+    bitfield: Optional[str] = None  # base64, bit i => chunk i
+    complete: bool = False          # peer holds the whole file
+
+@app.post("/announce_chunks")
+async def announce_chunks_endpoint(batch: BatchAnnouncement,
+                                   peer_id: str, token: str):
+    """Announce many chunks (or the whole file) in one request."""
+    if not validate_token(peer_id, token):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+
+    await state.touch(peer_id)
+
+    file_id = sanitize_stem(batch.file_stem)
+    meta = await state.get_file(file_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    limit = meta.total_chunks
+
+    if batch.complete:
+        await state.add_seed(file_id, peer_id)
+        ANNOUNCES.labels("seed").inc()
+        return {"status": "acknowledged", "seed": True}
+
+    if limit <= 0:
+        return {"status": "acknowledged", "count": 0}
+    indices = {i for i in batch.indices if 0 <= i < limit}
+    try:
+        indices |= ranges_to_indices(batch.ranges, limit)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid ranges")
+    if batch.bitfield:
+        try:
+            indices |= decode_bitfield(batch.bitfield, limit)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid bitfield")
+
+    added = await state.add_chunks(file_id, peer_id, indices, limit)
+    ANNOUNCES.labels("batch").inc()
+    ANNOUNCED_CHUNKS.inc(len(added))
+    return {"status": "acknowledged", "count": len(added)}
+
 @app.get("/peers/{file_stem:path}/{chunk_index}")
 async def get_chunk_owners(file_stem: str, chunk_index: int,
                             peer_id: str, token: str):
@@ -217,84 +325,185 @@ async def get_chunk_owners(file_stem: str, chunk_index: int,
         raise HTTPException(status_code=403, detail="Unauthorized")
 
     file_stem = sanitize_stem(file_stem)   # ← sanitize here
+    LOOKUPS.labels("owners").inc()
     owners, result = set(), []
 
-    tracker_path = STORAGE_PATH / "chunks" / f"{file_stem}_chunk_{chunk_index}"
-    if tracker_path.exists():
+    if _tracker_has_chunk(file_stem, chunk_index):
         owners.add("privileged_peer")
 
-    async with chunk_locations_lock:
-        if file_stem in chunk_locations and chunk_index in chunk_locations[file_stem]:
-            owners.update(chunk_locations[file_stem][chunk_index])
+    owners.update(await state.chunk_owners(file_stem, chunk_index))
 
     if "privileged_peer" in owners:
-        result.append({"peer_id": "privileged_peer", "host": get_lan_ip(),
-                        "port": DEFAULT_TRACKER_PORT, "type": "tracker"})
+        result.append(_tracker_descriptor())
         owners.discard("privileged_peer")
 
-    async with approved_peers_lock:
-        for oid in owners:
-            if oid in approved_peers:
-                result.append(approved_peers[oid].model_dump())
+    for p in (await state.get_peers(owners)).values():
+        if p.status != "unreachable":
+            result.append(p.model_dump())
 
     return {"owners": result}
 
+@app.get("/availability/{file_stem:path}")
+async def get_availability(file_stem: str, peer_id: str, token: str,
+                           since: int = 0, epoch: str = ""):
+    """
+    Whole-file owner map in one response.
+
+    Returns chunk_index -> [peer_id] for every chunk, the peers seeding the
+    whole file (always sent in full) and each referenced peer's descriptor
+    exactly once; peers count replicas from these for rarest-first
+    scheduling. With `since` set to a previously returned `version` (and the
+    matching `epoch`), only chunks whose owner set changed after that
+    version are sent.
+    """
+    if not validate_token(peer_id, token):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+
+    file_stem = sanitize_stem(file_stem)
+    LOOKUPS.labels("availability_delta" if since else "availability").inc()
+
+    meta = await state.get_file(file_stem)
+    total_chunks = meta.total_chunks if meta else 0
+
+    if epoch != state.epoch:
+        since = 0
+    version, chunks, seed_ids = await state.availability(file_stem, since)
+    full = not since or since > version
+
+    # Chunks held by the tracker itself never change, so a delta only needs
+    # them for the chunks it already mentions.
+    indices = set(chunks) | (set(range(total_chunks)) if full else set())
+    for idx in indices:
+        if _tracker_has_chunk(file_stem, idx):
+            chunks.setdefault(idx, []).insert(0, "privileged_peer")
+
+    referenced = set(seed_ids).union(*chunks.values())
+    live_peers = {pid: p for pid, p in (await state.get_peers(referenced)).items()
+                  if p.status != "unreachable"}
+    peers: Dict[str, dict] = {
+        pid: {"peer_id": p.peer_id, "host": p.host, "port": p.port, "tcp_port": p.tcp_port}
+        for pid, p in live_peers.items()
+    }
+    seeds = [sid for sid in seed_ids if sid in live_peers]
+    for idx, owners in chunks.items():
+        chunks[idx] = [oid for oid in owners
+                       if oid == "privileged_peer" or oid in live_peers]
+    if any("privileged_peer" in owners for owners in chunks.values()):
+        peers["privileged_peer"] = _tracker_descriptor()
+
+    return {
+        "file_stem": file_stem,
+        "epoch": state.epoch,
+        "version": version,
+        "full": full,
+        "total_chunks": total_chunks,
+        "chunks": {str(idx): owners for idx, owners in sorted(chunks.items())},
+        "seeds": seeds,
+        "peers": peers,
+    }
+
 @app.get("/metadata/{file_stem:path}")
-async def get_metadata(file_stem: str, peer_id: str, token: str):
+async def get_metadata(file_stem: str, peer_id: str, token: str, request: Request,
+                       chunks: bool = True):
+    """The metadata document; chunks=false leaves out the chunk list (see /proofs)."""
     if not validate_token(peer_id, token):
         raise HTTPException(status_code=403, detail="Unauthorized")
-        
-    print(f"[DEBUG] Request for metadata: {file_stem}")
-    meta_path = STORAGE_PATH / "metadata" / f"{file_stem}.json"
-    print(f"[DEBUG] Checking: {meta_path}")
-    
-    # Try direct match
-    if not meta_path.exists():
-        # Try urllib decoded
+
+    LOOKUPS.labels("metadata").inc()
+    entry = metadata_index.get(file_stem)
+    if entry is None:
         from urllib.parse import unquote
-        decoded_stem = unquote(file_stem)
-        meta_path = STORAGE_PATH / "metadata" / f"{decoded_stem}.json"
-        print(f"[DEBUG] Checking decoded: {meta_path}")
-        
-        if not meta_path.exists():
-            # Try to match stem in dir directly
-            found = False
-            metadata_dir = STORAGE_PATH / "metadata"
-            if metadata_dir.exists():
-                for f in metadata_dir.glob("*.json"):
-                    if f.stem == file_stem or f.stem == decoded_stem:
-                        meta_path = f
-                        found = True
-                        print(f"[DEBUG] Found via glob: {meta_path}")
-                        break
-            if not found:
-                print(f"[ERROR] Metadata not found for {file_stem} in {metadata_dir}")
-                raise HTTPException(status_code=404, detail=f"Metadata not found for {file_stem}")
-        
-    with open(meta_path, "r", encoding='utf-8') as f: # Added 'encoding' just in case
-        return json.load(f)
+        entry = metadata_index.get(unquote(file_stem))
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Metadata not found for {file_stem}")
+
+    meta, raw, etag = entry
+    if not chunks:
+        return {k: v for k, v in meta.items() if k != "chunks"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=raw, media_type="application/json", headers={"ETag": etag})
+
+# Chunk hashes per /proofs response
+PROOFS_PAGE_MAX = 4096
+
+@app.get("/proofs/{file_stem:path}")
+async def get_proofs(file_stem: str, peer_id: str, token: str,
+                     start: int = 0, stop: Optional[int] = None):
+    """
+    Hashes and sizes of chunks [start, stop) with one Merkle proof for the
+    run (see shared/merkle.py), for peers that trust only the metadata's
+    merkle_root. At most PROOFS_PAGE_MAX chunks per call.
+    """
+    if not validate_token(peer_id, token):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+
+    LOOKUPS.labels("proofs").inc()
+    entry = metadata_index.get(file_stem)
+    if entry is None:
+        from urllib.parse import unquote
+        file_stem = unquote(file_stem)
+        entry = metadata_index.get(file_stem)
+    tree = metadata_index.merkle_tree(file_stem) if entry else None
+    if tree is None:
+        raise HTTPException(status_code=404, detail=f"Metadata not found for {file_stem}")
+
+    total = len(tree)
+    stop = min(total if stop is None else stop, start + PROOFS_PAGE_MAX, total)
+    if not 0 <= start < stop:
+        raise HTTPException(status_code=416, detail=f"File has {total} chunks")
+    chunks = entry[0]["chunks"][start:stop]
+    return {
+        "file_stem": file_stem,
+        "merkle_root": tree.root,
+        "total_chunks": total,
+        "start": start,
+        "chunks": [{"index": c["index"], "hash": c["hash"], "size": c["size"],
+                    "filename": c.get("filename", f"{file_stem}_chunk_{c['index']}")}
+                   for c in chunks],
+        "proof": tree.proof(start, stop),
+    }
 
 @app.get("/chunk/{file_stem:path}/{chunk_index}")
-async def download_chunk(file_stem: str, chunk_index: int, peer_id: str, token: str):
+async def download_chunk(file_stem: str, chunk_index: int, peer_id: str, token: str,
+                         request: Request):
     if not validate_token(peer_id, token):
         raise HTTPException(status_code=403, detail="Unauthorized")
         
-    chunk_name = f"{file_stem}_chunk_{chunk_index}"
-    chunk_name = f"{file_stem}_chunk_{chunk_index}"
-    chunk_path = STORAGE_PATH / "chunks" / chunk_name
+    chunk = _tracker_chunk(file_stem, chunk_index)
     
-    if not chunk_path.exists():
+    if chunk is None:
          # Try decoded
          from urllib.parse import unquote
          decoded_stem = unquote(file_stem)
-         chunk_name = f"{decoded_stem}_chunk_{chunk_index}"
-         chunk_path = STORAGE_PATH / "chunks" / chunk_name
+         chunk = _tracker_chunk(decoded_stem, chunk_index)
          
-         if not chunk_path.exists():
-             print(f"[ERROR] Chunk not found: {chunk_path}")
+         if chunk is None:
+             print(f"[ERROR] Chunk not found: {decoded_stem}_chunk_{chunk_index}")
              raise HTTPException(status_code=404, detail="Chunk not found")
-         
-    return FileResponse(chunk_path)
+
+    # Peers fetch blocks of a chunk from several sources with Range requests
+    size, read = chunk
+    try:
+        span = parse_range(request.headers.get("range"), size)
+    except RangeNotSatisfiable:
+        raise HTTPException(status_code=416, headers={"Content-Range": unsatisfied_range(size)})
+    start, stop = span or (0, size)
+    CHUNKS_SERVED.labels("range" if span else "whole").inc()
+    CHUNK_BYTES_SERVED.observe(stop - start)
+    data = await asyncio.to_thread(read, start, stop)
+    if data is None:
+        # Compacted or released since the lookup
+        raise HTTPException(status_code=404, detail="Chunk not found")
+    if span is None:
+        return Response(content=data, media_type="application/octet-stream")
+    return Response(content=data, status_code=206, media_type="application/octet-stream",
+                    headers={"Content-Range": content_range(start, stop, size)})
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of this worker's counters."""
+    return Response(content=render(), media_type=CONTENT_TYPE)
 
 @app.get("/tracker_pubkey")
 async def tracker_pubkey():
@@ -304,20 +513,98 @@ async def tracker_pubkey():
         raise HTTPException(status_code=404, detail="Key not generated yet")
     return {"public_key": key_path.read_text()}
 
+# Catalog paging. The cursor is the sort key of the last item returned.
+FILES_PAGE_MAX = 500
+_FILE_SORT_KEYS = {
+    "name": lambda stem, v, m: m.file_name.lower(),
+    "size": lambda stem, v, m: m.file_size,
+    "chunks": lambda stem, v, m: m.total_chunks,
+    "updated": lambda stem, v, m: v,
+}
+
+def _file_entry(stem: str, meta: FileMetadata) -> dict:
+    return {
+        "stem": stem,
+        "name": meta.file_name,
+        "size": meta.file_size, # Might be 0 if legacy
+        "total_chunks": meta.total_chunks,
+        "mime_type": meta.mime_type
+    }
+
+def _encode_cursor(sort: str, key: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort] + key).encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str, sort: str) -> list:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(key, list) or len(key) != 3 or key[0] != sort:
+            raise ValueError
+        return key[1:]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @app.get("/files")
-async def list_files():
-    """List all files available on the network"""
-    async with file_registry_lock:
-        return [
-            {
-                "stem": stem,
-                "name": meta.file_name,
-                "size": meta.file_size, # Might be 0 if legacy
-                "total_chunks": meta.total_chunks,
-                "mime_type": meta.mime_type
-            }
-            for stem, meta in file_registry.items()
-        ]
+async def list_files(limit: Optional[int] = None, cursor: str = "",
+                     q: str = "", prefix: str = "", mime: str = "",
+                     sort: str = "name", since_version: int = 0, epoch: str = ""):
+    """
+    List all files available on the network.
+
+    Without `limit` this is the legacy plain list of every file. With it, one
+    page of the catalog: filtered by name substring `q`, name/stem `prefix`
+    and `mime` ("application/pdf" or "image/*"), sorted by name, size,
+    chunks or updated ("-" prefix for descending), continued with the
+    returned `next_cursor`. Passing the `version` and `epoch` of an earlier
+    sync as `since_version`/`epoch` returns only files changed since then,
+    plus the stems deleted since then in `deleted`.
+    """
+    if limit is None:
+        return [_file_entry(stem, meta) for stem, meta in (await state.list_files()).items()]
+
+    limit = max(1, min(limit, FILES_PAGE_MAX))
+    descending = sort.startswith("-")
+    sort_key = _FILE_SORT_KEYS.get(sort.lstrip("-"))
+    if sort_key is None:
+        raise HTTPException(status_code=400, detail=f"Unknown sort {sort!r}")
+
+    version, entries, full = await state.file_catalog(
+        since_version if epoch == state.epoch else 0)
+
+    q, prefix = q.lower(), prefix.lower()
+    if mime.endswith("/*"):
+        mime_match = lambda m: m.startswith(mime[:-1])
+    else:
+        mime_match = lambda m: not mime or m == mime
+    matched, deleted = [], []
+    for stem, (v, meta) in entries.items():
+        if meta is None:
+            deleted.append(stem)
+        elif ((not q or q in meta.file_name.lower())
+              and (not prefix or meta.file_name.lower().startswith(prefix)
+                   or stem.lower().startswith(prefix))
+              and mime_match(meta.mime_type)):
+            matched.append(([sort_key(stem, v, meta), stem], v, stem, meta))
+    matched.sort(key=lambda item: item[0], reverse=descending)
+
+    start = 0
+    if cursor:
+        after = _decode_cursor(cursor, sort)
+        # First item strictly past the cursor in sort order
+        start = next((i for i, item in enumerate(matched)
+                      if (item[0] < after if descending else item[0] > after)), len(matched))
+    page = matched[start:start + limit]
+    more = start + limit < len(matched)
+
+    return {
+        "epoch": state.epoch,
+        "version": version,
+        "full": full,
+        "total": len(matched),
+        "items": [dict(_file_entry(stem, meta), version=v) for _, v, stem, meta in page],
+        # Deletions ignore filters and paging; sent once, with the first page
+        "deleted": sorted(deleted) if not cursor else [],
+        "next_cursor": _encode_cursor(sort, page[-1][0]) if more else None,
+    }
 
 class FileRegistration(BaseModel):
     file_stem: str
@@ -328,29 +615,31 @@ class FileRegistration(BaseModel):
 @app.post("/register_file")
 async def register_file(file_info: FileRegistration):
     """Manually register a file (called by Admin Dashboard)"""
-    async with file_registry_lock:
-        file_registry[file_info.file_stem] = FileMetadata(
-            file_name=file_info.original_name,
-            file_hash=file_info.file_stem, # fallback
-            total_chunks=file_info.total_chunks,
-            file_size=0,
-            mime_type=file_info.mime_type
-        )
+    # The dashboard has just written the metadata file; pick it up
+    data = metadata_index.load(file_info.file_stem)
+    meta = _registry_entry(file_info.file_stem, data) if data else None
+    await _put_file(file_info.file_stem, meta or FileMetadata(
+        file_name=file_info.original_name,
+        file_hash=file_info.file_stem, # fallback
+        total_chunks=file_info.total_chunks,
+        file_size=0,
+        mime_type=file_info.mime_type
+    ))
     return {"status": "registered", "file_stem": file_info.file_stem}
 
 @app.delete("/flush_registry")
 async def flush_registry():
     """Admin: Clear all files from registry"""
-    async with file_registry_lock:
-        count = len(file_registry)
-        file_registry.clear()
+    count = await state.clear_files()
+    metadata_index.clear()
     
-    # Delete all metadata files
+    # Delete all metadata files, and the chunks only they referenced
     try:
         meta_dir = STORAGE_PATH / "metadata"
         if meta_dir.exists():
             for f in meta_dir.glob("*.json"):
                 f.unlink()
+                await asyncio.to_thread(chunk_store.release, f.stem)
     except Exception as e:
         print(f"Error flushing metadata: {e}")
         
@@ -363,36 +652,37 @@ class FileUnregistration(BaseModel):
 @app.post("/unregister_file")
 async def unregister_file(info: FileUnregistration):
     """Admin: Remove file from registry"""
-    async with file_registry_lock:
-        if info.file_stem in file_registry:
-            del file_registry[info.file_stem]
-            
-            # Also delete the metadata file from disk so it doesn't reappear on restart
-        meta_path = STORAGE_PATH / "metadata" / f"{info.file_stem}.json"
-        try:
-            if meta_path.exists():
-                meta_path.unlink()
-        except Exception as e:
-            print(f"Error deleting metadata {meta_path}: {e}")
-            
+    removed = await state.remove_file(info.file_stem)
+
+    # Also delete the metadata file from disk so it doesn't reappear on restart
+    meta_path = STORAGE_PATH / "metadata" / f"{info.file_stem}.json"
+    try:
+        if meta_path.exists():
+            meta_path.unlink()
+    except Exception as e:
+        print(f"Error deleting metadata {meta_path}: {e}")
+    metadata_index.remove(info.file_stem)
+    freed = await asyncio.to_thread(chunk_store.release, info.file_stem)
+    if freed:
+        print(f"[ADMIN] Freed {freed} chunks no other file uses")
+
+    if removed:
         return {"status": "unregistered"}
     return {"status": "not_found", "message": "File not in registry"}
 
 @app.get("/admin/peers")
 async def get_all_peers(_: None = Depends(require_admin)):
-    async with approved_peers_lock:
-        return [p.model_dump() for p in approved_peers.values()]
+    return [p.model_dump() for p in await state.list_peers()]
 
 @app.get("/peers")
 async def list_peers(peer_id: str, token: str):
     """Public (token-authenticated) peer list for peer nodes."""
     if not validate_token(peer_id, token):
         raise HTTPException(status_code=403, detail="Unauthorized")
-    async with approved_peers_lock:
-        return [
-            {"peer_id": p.peer_id, "host": p.host, "port": p.port}
-            for p in approved_peers.values()
-        ]
+    return [
+        {"peer_id": p.peer_id, "host": p.host, "port": p.port}
+        for p in await state.list_peers()
+    ]
 
 def broadcast_presence():
     import time
@@ -429,19 +719,20 @@ def broadcast_presence():
 
 @app.on_event("startup")
 async def start_tcp_server():
+    if not IS_LEADER:
+        return
     try:
         def get_peer_pk(peer_id):
-            p = approved_peers.get(peer_id)
-            print(f"[DEBUG] TCP get_peer_pk: peer_id={peer_id}, found={p is not None}, total_peers={len(approved_peers)}")
-            if p:
-                print(f"[DEBUG] TCP get_peer_pk: public_key={p.public_key[:20] if p.public_key else None}")
-            return p.public_key if p else None
+            public_key = state.public_key(peer_id)
+            print(f"[DEBUG] TCP get_peer_pk: peer_id={peer_id}, public_key={public_key[:20] if public_key else None}")
+            return public_key
 
         tcp_port = DEFAULT_TRACKER_PORT + 1
         tcp_server = TCPServer(
             host="0.0.0.0", 
             start_port=tcp_port,
-            get_public_key_cb=get_peer_pk
+            get_public_key_cb=get_peer_pk,
+            on_metadata_cb=metadata_index.load
         )
         actual_port = tcp_server.start()
         print(f"[TCP] Server started on port {actual_port}")
@@ -450,6 +741,8 @@ async def start_tcp_server():
 
 @app.on_event("startup")
 async def start_broadcaster():
+    if not IS_LEADER:
+        return
     import threading
     t = threading.Thread(target=broadcast_presence, daemon=True)
     t.start()
@@ -460,26 +753,87 @@ async def start_peer_cleanup():
         while True:
             await asyncio.sleep(60)
             cutoff = time.time() - 300   # 5 minutes — gives peers time to start up and send heartbeats
-            async with approved_peers_lock:
-                stale = [pid for pid, p in approved_peers.items()
-                         if p.last_seen > 0 and p.last_seen < cutoff]
-                for pid in stale:
-                    logging.info(f"[CLEANUP] Removing stale peer: {pid}")
-                    del approved_peers[pid]
-                    revoke_token(pid)
-                if stale:
-                    save_peers()
-    asyncio.create_task(_cleanup())
+            stale = await state.stale_peers(cutoff)
+            for pid in stale:
+                logging.info(f"[CLEANUP] Removing stale peer: {pid}")
+            if stale:
+                await state.remove_peers(stale)
+    if IS_LEADER:
+        asyncio.create_task(_cleanup())
+
+@app.on_event("startup")
+async def start_revocation_sync():
+    """Workers sharing state pick up each other's /leave and cleanup revocations."""
+    async def _sync():
+        while True:
+            await asyncio.sleep(REVOCATION_SYNC_INTERVAL)
+            try:
+                await state.sync_revocations()
+            except Exception as e:
+                logging.warning(f"Revocation sync failed: {e}")
+    if state.shared:
+        asyncio.create_task(_sync())
 
 @app.post("/heartbeat")
 async def heartbeat(peer_id: str, token: str):
     if not validate_token(peer_id, token):
         raise HTTPException(status_code=403, detail="Unauthorized")
-    async with approved_peers_lock:
-        if peer_id in approved_peers:
-            approved_peers[peer_id].last_seen = time.time()
+    await state.touch(peer_id)
+    peer = await state.get_peer(peer_id)
+    if peer and peer.status == "unreachable" and await _probe_peer(peer.host, peer.port):
+        # Reachable again: its availability was purged, so ask it to re-announce
+        await state.set_status(peer_id, "active")
+        return {"status": "ok", "reannounce": True}
     return {"status": "ok"}
 
+@app.post("/leave")
+async def leave(peer_id: str, token: str):
+    """Explicit departure: forget the peer, its token and all its chunks at once."""
+    if not validate_token(peer_id, token):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    await state.remove_peers([peer_id])
+    return {"status": "left"}
+
+class UnreachableReport(BaseModel):
+    peer_id: str
+
+@app.post("/report_unreachable")
+async def report_unreachable(report: UnreachableReport, peer_id: str, token: str):
+    """
+    A peer failed to reach `report.peer_id`. The tracker probes it itself so a
+    single client's network trouble cannot evict a healthy peer.
+    """
+    if not validate_token(peer_id, token):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    target = report.peer_id
+    peer = await state.get_peer(target)
+    if not peer or peer.status == "unreachable" or target in _probing:
+        return {"status": "ignored"}
+
+    async def _check():
+        _probing.add(target)
+        try:
+            if not await _probe_peer(peer.host, peer.port):
+                logging.info(f"[AVAILABILITY] {target} unreachable (reported by {peer_id})")
+                await state.set_status(target, "unreachable")
+                await _purge_peer_availability(target)
+        finally:
+            _probing.discard(target)
+
+    asyncio.create_task(_check())
+    return {"status": "probing"}
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=DEFAULT_TRACKER_PORT)
+    if TRACKER_WORKERS > 1 and not state.shared:
+        logging.warning("TRACKER_WORKERS > 1 needs TRACKER_STATE_BACKEND=sqlite; running one worker")
+        TRACKER_WORKERS = 1
+    if TRACKER_WORKERS > 1:
+        # Workers import the app by name, from this directory
+        uvicorn.run("server:app", host="0.0.0.0", port=DEFAULT_TRACKER_PORT,
+                    workers=TRACKER_WORKERS, app_dir=str(Path(__file__).resolve().parent),
+                    timeout_keep_alive=HTTP_KEEPALIVE_TIMEOUT)
+    else:
+        # Keep idle connections longer than peers' pools do (see peer_node/http_pool.py)
+        uvicorn.run(app, host="0.0.0.0", port=DEFAULT_TRACKER_PORT,
+                    timeout_keep_alive=HTTP_KEEPALIVE_TIMEOUT)
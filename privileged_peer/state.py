@@ -0,0 +1,720 @@
+import asyncio
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+from chunk_index import ChunkIndex
+from journal import StateJournal
+from security.auth import revoke_token, revocations
+from shared.config import PeerInfo, FileMetadata
+from shared.bitfield import ranges_to_indices, indices_to_ranges
+from shared.metrics import LOCK_WAIT, LOCK_HOLD
+
+STORAGE_PATH = BASE_DIR / "storage"
+
+SNAPSHOT_INTERVAL = 60        # seconds; memory backend, only when records were appended
+TOUCH_INTERVAL = 30           # seconds; sqlite backend, min gap between last_seen writes
+MAX_FILE_TOMBSTONES = 1000    # memory backend; older deletions force a full catalog sync
+
+# (version, chunk_index -> individual owners, seed ids)
+Availability = Tuple[int, Dict[int, List[str]], List[str]]
+# (catalog version, stem -> (version it last changed, metadata or None if deleted), full)
+Catalog = Tuple[int, Dict[str, Tuple[int, Optional[FileMetadata]]], bool]
+
+
+class TrackerState:
+    """
+    Tracker state backend: approved peers, file registry and chunk availability.
+
+    Every method is a coroutine so a backend may do blocking I/O off the
+    event loop. `public_key` is the one synchronous call, for the TCP
+    handler threads. `epoch` changes whenever availability versions restart.
+    """
+    epoch: str = ""
+    shared = False   # True if several worker processes may use the same state
+
+    async def open(self): ...
+    async def close(self): ...
+
+    # ── Peers ─────────────────────────────────────────────────
+    async def get_peer(self, peer_id: str) -> Optional[PeerInfo]: ...
+    async def get_peers(self, peer_ids: Iterable[str]) -> Dict[str, PeerInfo]: ...
+    async def list_peers(self) -> List[PeerInfo]: ...
+    async def put_peer(self, peer: PeerInfo) -> bool:
+        """Insert or replace; True if the peer was already known."""
+    async def remove_peers(self, peer_ids: List[str]):
+        """Forget peers, revoke their tokens and drop their availability."""
+    async def touch(self, peer_id: str): ...
+    async def set_status(self, peer_id: str, status: str): ...
+    async def stale_peers(self, cutoff: float) -> List[str]: ...
+    async def sync_revocations(self):
+        """Pull token revocations made by other workers into security.auth."""
+    def public_key(self, peer_id: str) -> Optional[str]: ...
+
+    # ── File registry ─────────────────────────────────────────
+    async def get_file(self, file_stem: str) -> Optional[FileMetadata]: ...
+    async def list_files(self) -> Dict[str, FileMetadata]: ...
+    async def put_file(self, file_stem: str, meta: FileMetadata): ...
+    async def remove_file(self, file_stem: str) -> bool: ...
+    async def clear_files(self) -> int: ...
+    async def file_catalog(self, since: int = 0) -> Catalog:
+        """
+        Every registered file, or with `since` only files added, changed or
+        deleted after that catalog version. `full` is True when `since` could
+        not be honoured and the whole catalog was returned instead.
+        """
+
+    # ── Chunk availability ────────────────────────────────────
+    async def add_chunks(self, file_stem: str, peer_id: str, indices: Iterable[int],
+                         limit: int) -> List[int]:
+        """Returns the indices that were new for this peer; indices >= limit are ignored."""
+    async def add_seed(self, file_stem: str, peer_id: str) -> bool: ...
+    async def purge_peer(self, peer_id: str) -> List[str]:
+        """Drop a peer's chunks and seeds; returns the affected files."""
+    async def reset_file(self, file_stem: str):
+        """Drop every owner and seed of a file, whose chunks have changed."""
+    async def chunk_owners(self, file_stem: str, chunk_index: int) -> List[str]:
+        """Individual owners plus seeds."""
+    async def availability(self, file_stem: str, since: int = 0) -> Availability: ...
+
+
+class MemoryState(TrackerState):
+    """
+    Single-process state in dicts and a ChunkIndex, persisted through a
+    write-behind StateJournal. No method awaits, so each one runs atomically
+    on the event loop and its journal record lands in mutation order.
+    """
+
+    def __init__(self, state_dir: Path = STORAGE_PATH / "tracker_state",
+                 legacy_peers_path: Path = STORAGE_PATH / "peers.json"):
+        self.peers: Dict[str, PeerInfo] = {}
+        self.files: Dict[str, FileMetadata] = {}
+        # catalog versions: stem -> version it last changed; deleted stems kept as tombstones
+        self.files_version = 0
+        self.file_versions: Dict[str, int] = {}
+        self.tombstones: Dict[str, int] = {}
+        self.tombstone_floor = 0
+        self.chunks = ChunkIndex()
+        self.journal = StateJournal(state_dir)
+        self.legacy_peers_path = legacy_peers_path
+        # Versions restart with the process; the epoch tells peers their `since` is stale.
+        self.epoch = secrets.token_hex(4)
+        self._snapshotter: Optional[asyncio.Task] = None
+
+    async def open(self):
+        """Replay snapshot + journal (or migrate peers.json), then compact."""
+        start = time.perf_counter()
+        if self.journal.has_state():
+            count = self.journal.replay(self._apply_snapshot, self._apply_record)
+            # Signed tokens stay valid across restarts, so peers need not rejoin
+            for peer in self.peers.values():
+                # Restart grace: don't let cleanup drop peers before they reconnect
+                peer.last_seen = time.time()
+            logging.info(f"Restored {len(self.peers)} peers, {len(self.files)} files "
+                         f"and {count} journal records in {(time.perf_counter() - start) * 1000:.0f} ms.")
+        else:
+            self._load_legacy_peers()
+        self.journal.start()
+        self.journal.snapshot(self._snapshot_state())
+        self._snapshotter = asyncio.create_task(self._snapshots())
+
+    async def close(self):
+        if self._snapshotter:
+            self._snapshotter.cancel()
+        self.journal.snapshot(self._snapshot_state())
+        self.journal.close()
+
+    async def _snapshots(self):
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            if self.journal.records_since_snapshot:
+                self.journal.snapshot(self._snapshot_state())
+
+    def _load_legacy_peers(self):
+        """Load approved peers from the peers.json written by older trackers."""
+        if not self.legacy_peers_path.exists():
+            return
+        try:
+            data = json.loads(self.legacy_peers_path.read_text())
+            for pid, p in data.items():
+                self.peers[pid] = PeerInfo(**p)
+            logging.info(f"Restored {len(self.peers)} peers from disk.")
+        except Exception as e:
+            logging.warning(f"Failed to load peers: {e}")
+
+    # ── Journal ───────────────────────────────────────────────
+    def _snapshot_state(self) -> dict:
+        return {
+            "peers": {pid: p.model_dump() for pid, p in self.peers.items()},
+            "files": {stem: m.model_dump() for stem, m in self.files.items()},
+            "chunks": self.chunks.export(),
+            "revoked": revocations(),
+        }
+
+    def _apply_snapshot(self, state: dict):
+        for pid, p in state.get("peers", {}).items():
+            self.peers[pid] = PeerInfo(**p)
+        for stem, m in state.get("files", {}).items():
+            self._set_file(stem, FileMetadata(**m))
+        self.chunks.restore(state.get("chunks", {}))
+        for pid, at in state.get("revoked", {}).items():
+            revoke_token(pid, at)
+
+    def _apply_record(self, record: dict):
+        op = record.get("op")
+        if op == "peer":
+            self.peers[record["peer"]["peer_id"]] = PeerInfo(**record["peer"])
+        elif op == "peer_gone":
+            self.peers.pop(record["peer_id"], None)
+            self.chunks.remove_peer(record["peer_id"])
+            if "at" in record:
+                revoke_token(record["peer_id"], record["at"])
+        elif op == "purge":
+            self.chunks.remove_peer(record["peer_id"])
+        elif op == "file":
+            self._set_file(record["stem"], FileMetadata(**record["meta"]))
+        elif op == "file_gone":
+            self._drop_file(record["stem"])
+        elif op == "files_cleared":
+            for stem in list(self.files):
+                self._drop_file(stem)
+        elif op == "chunks":
+            meta = self.files.get(record["stem"])
+            if meta is not None and meta.total_chunks > 0:
+                self.chunks.add(record["stem"], record["peer_id"],
+                                ranges_to_indices(record["ranges"], meta.total_chunks),
+                                meta.total_chunks)
+        elif op == "seed":
+            self.chunks.add_seed(record["stem"], record["peer_id"])
+        elif op == "file_reset":
+            self.chunks.reset_file(record["stem"])
+
+    # ── Peers ─────────────────────────────────────────────────
+    async def get_peer(self, peer_id):
+        return self.peers.get(peer_id)
+
+    async def get_peers(self, peer_ids):
+        return {pid: self.peers[pid] for pid in peer_ids if pid in self.peers}
+
+    async def list_peers(self):
+        return list(self.peers.values())
+
+    async def put_peer(self, peer):
+        existed = peer.peer_id in self.peers
+        self.peers[peer.peer_id] = peer
+        self.journal.append({"op": "peer", "peer": peer.model_dump()})
+        return existed
+
+    async def remove_peers(self, peer_ids):
+        now = time.time() * 1000
+        for pid in peer_ids:
+            self.peers.pop(pid, None)
+            revoke_token(pid, now)
+            self.chunks.remove_peer(pid)
+            self.journal.append({"op": "peer_gone", "peer_id": pid, "at": now})
+
+    async def touch(self, peer_id):
+        peer = self.peers.get(peer_id)
+        if peer:
+            peer.last_seen = time.time()
+
+    async def set_status(self, peer_id, status):
+        peer = self.peers.get(peer_id)
+        if peer:
+            peer.status = status
+
+    async def stale_peers(self, cutoff):
+        return [pid for pid, p in self.peers.items()
+                if p.last_seen > 0 and p.last_seen < cutoff]
+
+    async def sync_revocations(self):
+        pass   # revocations are made in this process
+
+    def public_key(self, peer_id):
+        p = self.peers.get(peer_id)
+        return p.public_key if p else None
+
+    # ── File registry ─────────────────────────────────────────
+    async def get_file(self, file_stem):
+        return self.files.get(file_stem)
+
+    async def list_files(self):
+        return dict(self.files)
+
+    def _set_file(self, file_stem: str, meta: FileMetadata):
+        self.files_version += 1
+        self.files[file_stem] = meta
+        self.file_versions[file_stem] = self.files_version
+        self.tombstones.pop(file_stem, None)
+
+    def _drop_file(self, file_stem: str) -> bool:
+        if self.files.pop(file_stem, None) is None:
+            return False
+        self.files_version += 1
+        del self.file_versions[file_stem]
+        self.tombstones[file_stem] = self.files_version
+        if len(self.tombstones) > MAX_FILE_TOMBSTONES:
+            # Dicts keep insertion order, so the first tombstone is the oldest
+            oldest = next(iter(self.tombstones))
+            self.tombstone_floor = self.tombstones.pop(oldest)
+        return True
+
+    async def put_file(self, file_stem, meta):
+        self._set_file(file_stem, meta)
+        self.journal.append({"op": "file", "stem": file_stem, "meta": meta.model_dump()})
+
+    async def remove_file(self, file_stem):
+        if not self._drop_file(file_stem):
+            return False
+        self.journal.append({"op": "file_gone", "stem": file_stem})
+        return True
+
+    async def clear_files(self):
+        count = len(self.files)
+        for stem in list(self.files):
+            self._drop_file(stem)
+        self.journal.append({"op": "files_cleared"})
+        return count
+
+    async def file_catalog(self, since=0):
+        if not since or since > self.files_version or since < self.tombstone_floor:
+            return (self.files_version,
+                    {stem: (self.file_versions[stem], meta) for stem, meta in self.files.items()},
+                    True)
+        changed = {stem: (v, self.files[stem])
+                   for stem, v in self.file_versions.items() if v > since}
+        changed.update((stem, (v, None)) for stem, v in self.tombstones.items() if v > since)
+        return self.files_version, changed, False
+
+    # ── Chunk availability ────────────────────────────────────
+    async def add_chunks(self, file_stem, peer_id, indices, limit):
+        added = self.chunks.add(file_stem, peer_id, indices, limit)
+        if added:
+            self.journal.append({"op": "chunks", "stem": file_stem, "peer_id": peer_id,
+                                 "ranges": indices_to_ranges(added)})
+        return added
+
+    async def add_seed(self, file_stem, peer_id):
+        if not self.chunks.add_seed(file_stem, peer_id):
+            return False
+        self.journal.append({"op": "seed", "stem": file_stem, "peer_id": peer_id})
+        return True
+
+    async def purge_peer(self, peer_id):
+        files = self.chunks.remove_peer(peer_id)
+        if files:
+            self.journal.append({"op": "purge", "peer_id": peer_id})
+        return files
+
+    async def reset_file(self, file_stem):
+        self.chunks.reset_file(file_stem)
+        self.journal.append({"op": "file_reset", "stem": file_stem})
+
+    async def chunk_owners(self, file_stem, chunk_index):
+        return (self.chunks.chunk_owners(file_stem, chunk_index)
+                + self.chunks.seeds(file_stem))
+
+    async def availability(self, file_stem, since=0):
+        version = self.chunks.version(file_stem)
+        if since > version:
+            since = 0
+        return (version, self.chunks.owner_map(file_stem, since),
+                self.chunks.seeds(file_stem))
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS peers (
+    peer_id TEXT PRIMARY KEY, info TEXT NOT NULL,
+    status TEXT NOT NULL, last_seen REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS revoked (peer_id TEXT PRIMARY KEY, at REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS revoked_at ON revoked (at);
+CREATE TABLE IF NOT EXISTS files (stem TEXT PRIMARY KEY, meta TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS file_changes (
+    stem TEXT PRIMARY KEY, version INTEGER NOT NULL, deleted INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS file_changes_by_version ON file_changes (version);
+CREATE TABLE IF NOT EXISTS file_versions (stem TEXT PRIMARY KEY, version INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS chunks (
+    stem TEXT NOT NULL, chunk INTEGER NOT NULL, peer TEXT NOT NULL,
+    PRIMARY KEY (stem, chunk, peer)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS chunks_by_peer ON chunks (peer, stem);
+CREATE TABLE IF NOT EXISTS chunk_changes (
+    stem TEXT NOT NULL, chunk INTEGER NOT NULL, version INTEGER NOT NULL,
+    PRIMARY KEY (stem, chunk)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS chunk_changes_by_version ON chunk_changes (stem, version);
+CREATE TABLE IF NOT EXISTS seeds (
+    stem TEXT NOT NULL, peer TEXT NOT NULL,
+    PRIMARY KEY (stem, peer)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS seeds_by_peer ON seeds (peer);
+"""
+
+
+class SQLiteState(TrackerState):
+    """
+    State in one SQLite database in WAL mode, shared by every tracker worker.
+
+    WAL lets readers (owner lookups, availability) run alongside the single
+    writer; writes use BEGIN IMMEDIATE so concurrent workers queue on the
+    busy timeout instead of failing. Queries run in the default thread pool,
+    one connection per thread. Versions and the epoch live in the database,
+    so they survive restarts and agree across workers.
+    """
+    shared = True
+
+    def __init__(self, db_path: Path = STORAGE_PATH / "tracker_state" / "tracker.db"):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._touched: Dict[str, float] = {}
+        self._revoked_seen = 0.0
+        # The database write lock, as seen by this worker
+        self._write_wait = LOCK_WAIT.labels("sqlite_write")
+        self._write_hold = LOCK_HOLD.labels("sqlite_write")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, fn, *args):
+        """Run fn(conn, *args) in one write transaction."""
+        conn = self._conn()
+        start = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        locked = time.perf_counter()
+        self._write_wait.observe(locked - start)
+        try:
+            result = fn(conn, *args)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            self._write_hold.observe(time.perf_counter() - locked)
+            raise
+        conn.execute("COMMIT")
+        self._write_hold.observe(time.perf_counter() - locked)
+        return result
+
+    async def _run(self, fn, *args):
+        return await asyncio.to_thread(fn, *args)
+
+    async def open(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        def _open():
+            conn = self._conn()
+            conn.executescript(_SCHEMA)
+            # Workers race to create the epoch; the first insert wins
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('epoch', ?)", (secrets.token_hex(4),))
+            return conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+
+        self.epoch = await self._run(_open)
+        await self.sync_revocations()
+
+    async def close(self):
+        pass
+
+    # ── Peers ─────────────────────────────────────────────────
+    @staticmethod
+    def _peer(row) -> PeerInfo:
+        info, status, last_seen = row
+        return PeerInfo(**json.loads(info), status=status, last_seen=last_seen)
+
+    async def get_peer(self, peer_id):
+        def _get():
+            row = self._conn().execute(
+                "SELECT info, status, last_seen FROM peers WHERE peer_id = ?", (peer_id,)).fetchone()
+            return self._peer(row) if row else None
+        return await self._run(_get)
+
+    async def get_peers(self, peer_ids):
+        peer_ids = list(peer_ids)
+        if not peer_ids:
+            return {}
+
+        def _get():
+            marks = ",".join("?" * len(peer_ids))
+            rows = self._conn().execute(
+                f"SELECT info, status, last_seen FROM peers WHERE peer_id IN ({marks})",
+                peer_ids).fetchall()
+            return {p.peer_id: p for p in map(self._peer, rows)}
+        return await self._run(_get)
+
+    async def list_peers(self):
+        def _list():
+            rows = self._conn().execute("SELECT info, status, last_seen FROM peers").fetchall()
+            return [self._peer(row) for row in rows]
+        return await self._run(_list)
+
+    async def put_peer(self, peer):
+        info = json.dumps(peer.model_dump(exclude={"status", "last_seen"}))
+
+        def _put(conn):
+            existed = conn.execute("SELECT 1 FROM peers WHERE peer_id = ?",
+                                   (peer.peer_id,)).fetchone() is not None
+            conn.execute("INSERT OR REPLACE INTO peers VALUES (?, ?, ?, ?)",
+                         (peer.peer_id, info, peer.status, peer.last_seen))
+            return existed
+        self._touched[peer.peer_id] = peer.last_seen
+        return await self._run(self._write, _put)
+
+    async def remove_peers(self, peer_ids):
+        now = time.time() * 1000
+
+        def _remove(conn):
+            for pid in peer_ids:
+                conn.execute("DELETE FROM peers WHERE peer_id = ?", (pid,))
+                conn.execute("INSERT OR REPLACE INTO revoked VALUES (?, ?)", (pid, now))
+                self._purge(conn, pid)
+        for pid in peer_ids:
+            revoke_token(pid, now)
+            self._touched.pop(pid, None)
+        await self._run(self._write, _remove)
+
+    async def touch(self, peer_id):
+        # last_seen only feeds the 5-minute cleanup; don't take the write lock
+        # for every announce
+        now = time.time()
+        if now - self._touched.get(peer_id, 0) < TOUCH_INTERVAL:
+            return
+        self._touched[peer_id] = now
+
+        def _touch(conn):
+            conn.execute("UPDATE peers SET last_seen = ? WHERE peer_id = ?", (now, peer_id))
+        await self._run(self._write, _touch)
+
+    async def set_status(self, peer_id, status):
+        def _set(conn):
+            conn.execute("UPDATE peers SET status = ? WHERE peer_id = ?", (status, peer_id))
+        await self._run(self._write, _set)
+
+    async def stale_peers(self, cutoff):
+        def _stale():
+            rows = self._conn().execute(
+                "SELECT peer_id FROM peers WHERE last_seen > 0 AND last_seen < ?",
+                (cutoff,)).fetchall()
+            return [row[0] for row in rows]
+        return await self._run(_stale)
+
+    async def sync_revocations(self):
+        def _since(seen):
+            return self._conn().execute(
+                "SELECT peer_id, at FROM revoked WHERE at > ? ORDER BY at", (seen,)).fetchall()
+        for pid, at in await self._run(_since, self._revoked_seen):
+            revoke_token(pid, at)
+            self._revoked_seen = at
+
+    def public_key(self, peer_id):
+        row = self._conn().execute("SELECT info FROM peers WHERE peer_id = ?",
+                                   (peer_id,)).fetchone()
+        return json.loads(row[0]).get("public_key") if row else None
+
+    # ── File registry ─────────────────────────────────────────
+    async def get_file(self, file_stem):
+        def _get():
+            row = self._conn().execute("SELECT meta FROM files WHERE stem = ?",
+                                       (file_stem,)).fetchone()
+            return FileMetadata(**json.loads(row[0])) if row else None
+        return await self._run(_get)
+
+    async def list_files(self):
+        def _list():
+            rows = self._conn().execute("SELECT stem, meta FROM files").fetchall()
+            return {stem: FileMetadata(**json.loads(meta)) for stem, meta in rows}
+        return await self._run(_list)
+
+    @staticmethod
+    def _file_changed(conn, stems: List[str], deleted: bool):
+        conn.execute("INSERT OR IGNORE INTO meta VALUES ('files_version', '0')")
+        conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 "
+                     "WHERE key = 'files_version'")
+        version = int(conn.execute(
+            "SELECT value FROM meta WHERE key = 'files_version'").fetchone()[0])
+        conn.executemany("INSERT OR REPLACE INTO file_changes VALUES (?, ?, ?)",
+                         [(stem, version, int(deleted)) for stem in stems])
+
+    async def put_file(self, file_stem, meta):
+        def _put(conn):
+            conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?)",
+                         (file_stem, json.dumps(meta.model_dump())))
+            self._file_changed(conn, [file_stem], False)
+        await self._run(self._write, _put)
+
+    async def remove_file(self, file_stem):
+        def _remove(conn):
+            if not conn.execute("DELETE FROM files WHERE stem = ?", (file_stem,)).rowcount:
+                return False
+            self._file_changed(conn, [file_stem], True)
+            return True
+        return await self._run(self._write, _remove)
+
+    async def clear_files(self):
+        def _clear(conn):
+            stems = [row[0] for row in conn.execute("SELECT stem FROM files")]
+            conn.execute("DELETE FROM files")
+            if stems:
+                self._file_changed(conn, stems, True)
+            return len(stems)
+        return await self._run(self._write, _clear)
+
+    async def file_catalog(self, since=0):
+        def _read():
+            conn = self._conn()
+            conn.execute("BEGIN")
+            try:
+                row = conn.execute(
+                    "SELECT value FROM meta WHERE key = 'files_version'").fetchone()
+                version = int(row[0]) if row else 0
+                full = not since or since > version
+                rows = conn.execute(
+                    "SELECT x.stem, x.version, f.meta FROM file_changes x "
+                    "LEFT JOIN files f ON f.stem = x.stem "
+                    "WHERE x.version > ? AND (f.meta IS NOT NULL OR ?)",
+                    (0 if full else since, not full)).fetchall()
+                if full:
+                    # Files registered before the catalog was versioned have no change row
+                    rows += [(stem, 0, meta) for stem, meta in conn.execute(
+                        "SELECT stem, meta FROM files WHERE stem NOT IN "
+                        "(SELECT stem FROM file_changes)")]
+            finally:
+                conn.execute("COMMIT")
+            entries = {stem: (v, FileMetadata(**json.loads(meta)) if meta else None)
+                       for stem, v, meta in rows}
+            return version, entries, full
+        return await self._run(_read)
+
+    # ── Chunk availability ────────────────────────────────────
+    @staticmethod
+    def _bump(conn, file_stem: str, indices: List[int]) -> int:
+        conn.execute("INSERT INTO file_versions VALUES (?, 1) "
+                     "ON CONFLICT (stem) DO UPDATE SET version = version + 1", (file_stem,))
+        version = conn.execute("SELECT version FROM file_versions WHERE stem = ?",
+                               (file_stem,)).fetchone()[0]
+        conn.executemany("INSERT OR REPLACE INTO chunk_changes VALUES (?, ?, ?)",
+                         [(file_stem, idx, version) for idx in indices])
+        return version
+
+    @classmethod
+    def _purge(cls, conn, peer_id: str) -> List[str]:
+        files = set()
+        for (stem,) in conn.execute("SELECT stem FROM seeds WHERE peer = ?", (peer_id,)).fetchall():
+            conn.execute("DELETE FROM seeds WHERE stem = ? AND peer = ?", (stem, peer_id))
+            cls._bump(conn, stem, [])
+            files.add(stem)
+        rows = conn.execute("SELECT stem, chunk FROM chunks WHERE peer = ?", (peer_id,)).fetchall()
+        dropped: Dict[str, List[int]] = {}
+        for stem, idx in rows:
+            dropped.setdefault(stem, []).append(idx)
+        for stem, indices in dropped.items():
+            conn.execute("DELETE FROM chunks WHERE peer = ? AND stem = ?", (peer_id, stem))
+            cls._bump(conn, stem, indices)
+            files.add(stem)
+        return sorted(files)
+
+    async def add_chunks(self, file_stem, peer_id, indices, limit):
+        indices = {i for i in indices if 0 <= i < limit}
+        if not indices:
+            return []
+
+        def _add(conn):
+            if conn.execute("SELECT 1 FROM seeds WHERE stem = ? AND peer = ?",
+                            (file_stem, peer_id)).fetchone():
+                return []
+            held = {row[0] for row in conn.execute(
+                "SELECT chunk FROM chunks WHERE peer = ? AND stem = ?", (peer_id, file_stem))}
+            added = sorted(indices - held)
+            if added:
+                conn.executemany("INSERT INTO chunks VALUES (?, ?, ?)",
+                                 [(file_stem, idx, peer_id) for idx in added])
+                self._bump(conn, file_stem, added)
+            return added
+        return await self._run(self._write, _add)
+
+    async def add_seed(self, file_stem, peer_id):
+        def _seed(conn):
+            if conn.execute("SELECT 1 FROM seeds WHERE stem = ? AND peer = ?",
+                            (file_stem, peer_id)).fetchone():
+                return False
+            conn.execute("INSERT INTO seeds VALUES (?, ?)", (file_stem, peer_id))
+            dropped = [row[0] for row in conn.execute(
+                "SELECT chunk FROM chunks WHERE peer = ? AND stem = ?", (peer_id, file_stem))]
+            conn.execute("DELETE FROM chunks WHERE peer = ? AND stem = ?", (peer_id, file_stem))
+            self._bump(conn, file_stem, dropped)
+            return True
+        return await self._run(self._write, _seed)
+
+    async def purge_peer(self, peer_id):
+        return await self._run(self._write, self._purge, peer_id)
+
+    async def reset_file(self, file_stem):
+        def _reset(conn):
+            dropped = [row[0] for row in conn.execute(
+                "SELECT DISTINCT chunk FROM chunks WHERE stem = ?", (file_stem,))]
+            conn.execute("DELETE FROM chunks WHERE stem = ?", (file_stem,))
+            conn.execute("DELETE FROM seeds WHERE stem = ?", (file_stem,))
+            self._bump(conn, file_stem, dropped)
+        await self._run(self._write, _reset)
+
+    async def chunk_owners(self, file_stem, chunk_index):
+        def _owners():
+            rows = self._conn().execute(
+                "SELECT peer FROM chunks WHERE stem = ? AND chunk = ? "
+                "UNION SELECT peer FROM seeds WHERE stem = ?",
+                (file_stem, chunk_index, file_stem)).fetchall()
+            return [row[0] for row in rows]
+        return await self._run(_owners)
+
+    async def availability(self, file_stem, since=0):
+        def _read():
+            conn = self._conn()
+            # One read transaction, so version, owners and seeds agree
+            conn.execute("BEGIN")
+            try:
+                row = conn.execute("SELECT version FROM file_versions WHERE stem = ?",
+                                   (file_stem,)).fetchone()
+                version = row[0] if row else 0
+                start = since if since <= version else 0
+                chunks: Dict[int, List[str]] = {}
+                if start:
+                    for (idx,) in conn.execute(
+                            "SELECT chunk FROM chunk_changes WHERE stem = ? AND version > ?",
+                            (file_stem, start)):
+                        chunks[idx] = []
+                    rows = conn.execute(
+                        "SELECT c.chunk, c.peer FROM chunks c JOIN chunk_changes x "
+                        "ON x.stem = c.stem AND x.chunk = c.chunk "
+                        "WHERE c.stem = ? AND x.version > ?", (file_stem, start))
+                else:
+                    rows = conn.execute("SELECT chunk, peer FROM chunks WHERE stem = ?",
+                                        (file_stem,))
+                for idx, peer in rows:
+                    chunks.setdefault(idx, []).append(peer)
+                seeds = [row[0] for row in conn.execute(
+                    "SELECT peer FROM seeds WHERE stem = ?", (file_stem,))]
+            finally:
+                conn.execute("COMMIT")
+            return version, chunks, seeds
+        return await self._run(_read)
+
+
+def make_state() -> TrackerState:
+    """Backend chosen by TRACKER_STATE_BACKEND: "memory" (default) or "sqlite"."""
+    backend = os.environ.get("TRACKER_STATE_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        db = os.environ.get("TRACKER_STATE_DB")
+        return SQLiteState(Path(db)) if db else SQLiteState()
+    if backend != "memory":
+        logging.warning(f"Unknown TRACKER_STATE_BACKEND {backend!r}; using memory")
+    return MemoryState()
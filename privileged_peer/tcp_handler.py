@@ -5,6 +5,7 @@ import struct
 import logging
 from pathlib import Path
 from shared.config import sanitize_stem, MAX_ASSIGNMENT_SIZE
+from shared.metrics import CountingSocket, TCP_CONNECTIONS, TCP_RECEIVED_BYTES
 import sys
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
@@ -17,13 +18,15 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger("TCP_Handler")
 
 class TCPServer:
-    def __init__(self, host: str, start_port: int, get_public_key_cb=None):
+    def __init__(self, host: str, start_port: int, get_public_key_cb=None, on_metadata_cb=None):
         self.host = host
         self.port = start_port
         self.socket = None
         self.running = False
         self.thread = None
         self.get_public_key_cb = get_public_key_cb
+        # Called with the file_stem after pushed metadata is written to disk
+        self.on_metadata_cb = on_metadata_cb
 
     def start(self):
         """Start the TCP server on an available port"""
@@ -54,9 +57,10 @@ class TCPServer:
             try:
                 client_sock, addr = self.socket.accept()
                 logger.info(f"Accepted TCP connection from {addr}")
+                TCP_CONNECTIONS.inc()
                 client_thread = threading.Thread(
                     target=self._handle_client,
-                    args=(client_sock,),
+                    args=(CountingSocket(client_sock, TCP_RECEIVED_BYTES),),
                     daemon=True
                 )
                 client_thread.start()
@@ -112,6 +116,8 @@ class TCPServer:
                             if not data: break
                             f.write(data)
                 print(f"[TCP] Saved Metadata: {save_path}")
+                if self.on_metadata_cb:
+                    self.on_metadata_cb(file_stem)
 
             elif packet_type == "assignment":
                 peer_id = header.get("peer_id")
@@ -219,16 +225,18 @@ class TCPServer:
             data += packet
         return data
 
-def send_tcp_packet(target_ip: str, target_port: int, header: dict, file_path: Path):
+def send_tcp_packet(target_ip: str, target_port: int, header: dict, file_path: Path, span=None):
     """
     Generic TCP sender. Header must contain necessary info (packet_type, file_stem, etc.)
+    span=(offset, length) sends only that part of the file (a chunk in a pack file).
     """
     try:
         if not file_path.exists():
             return False, f"File not found: {file_path}"
             
         import os
-        header["payload_size"] = os.path.getsize(file_path)
+        offset, remaining = span or (0, os.path.getsize(file_path))
+        header["payload_size"] = remaining
         
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             s.connect((target_ip, int(target_port)))
@@ -243,11 +251,13 @@ def send_tcp_packet(target_ip: str, target_port: int, header: dict, file_path: P
             
             # Send Data
             with open(file_path, "rb") as f:
-                while True:
-                    data = f.read(4096)
+                f.seek(offset)
+                while remaining:
+                    data = f.read(min(4096, remaining))
                     if not data:
                         break
                     s.sendall(data)
+                    remaining -= len(data)
             
             return True, "Success"
             
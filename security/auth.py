@@ -1,29 +1,103 @@
+import base64
+import hashlib
+import hmac
+import os
 import secrets
 import time
-from typing import Dict
+from pathlib import Path
+from typing import Dict, Optional
 
-_token_store: Dict[str, tuple] = {}
-TOKEN_TTL_SECONDS = 3600 
+# Tokens are "<key_id>.<issued_at>.<expires_at>.<signature>", where the
+# signature is HMAC-SHA256 over the peer id and the three fields. Any tracker
+# worker holding the same secret can validate one without shared state.
+TOKEN_TTL_SECONDS = 3600
+# A new signing key is derived from the secret every rotation period; keys
+# from earlier periods keep validating until the tokens they signed expire.
+TOKEN_KEY_ROTATION_SECONDS = 6 * 3600
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+TOKEN_SECRET_PATH = BASE_DIR / "storage" / "tracker_keys" / "token_secret"
+
+_secret: Optional[bytes] = None
+_keys: Dict[int, bytes] = {}
+# peer_id -> time before which its tokens are rejected (per process)
+_revoked_before: Dict[str, float] = {}
+
+
+def _load_secret() -> bytes:
+    """TRACKER_TOKEN_SECRET, else a random secret created once on disk."""
+    global _secret
+    if _secret is None:
+        env = os.environ.get("TRACKER_TOKEN_SECRET")
+        if env:
+            _secret = env.encode()
+        else:
+            TOKEN_SECRET_PATH.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                # O_EXCL: when several workers start together, exactly one creates it
+                fd = os.open(TOKEN_SECRET_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, "w") as f:
+                    f.write(secrets.token_hex(32))
+            except FileExistsError:
+                pass
+            for _ in range(50):
+                _secret = TOKEN_SECRET_PATH.read_text().strip().encode()
+                if _secret:
+                    break
+                time.sleep(0.01)  # another worker is still writing it
+    return _secret
+
+
+def _signing_key(key_id: int) -> bytes:
+    key = _keys.get(key_id)
+    if key is None:
+        key = hmac.new(_load_secret(), b"token-key:%d" % key_id, hashlib.sha256).digest()
+        _keys[key_id] = key
+        # Forget keys that can no longer have unexpired tokens
+        oldest = key_id - TOKEN_TTL_SECONDS // TOKEN_KEY_ROTATION_SECONDS - 1
+        for old in [k for k in _keys if k < oldest]:
+            del _keys[old]
+    return key
+
+
+def _sign(peer_id: str, key_id: int, issued_at: int, expires_at: int) -> str:
+    msg = f"{peer_id}|{key_id}|{issued_at}|{expires_at}".encode()
+    digest = hmac.new(_signing_key(key_id), msg, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
 
 
 def issue_token(peer_id: str) -> str:
     """Called by the TRACKER only when a peer joins."""
-    token = secrets.token_urlsafe(32)
-    _token_store[peer_id] = (token, time.time())
-    return token
+    now = time.time()
+    key_id = int(now // TOKEN_KEY_ROTATION_SECONDS)
+    issued_at = int(now * 1000)
+    expires_at = int(now + TOKEN_TTL_SECONDS)
+    _revoked_before.pop(peer_id, None)
+    return f"{key_id}.{issued_at}.{expires_at}.{_sign(peer_id, key_id, issued_at, expires_at)}"
 
 
 def validate_token(peer_id: str, token: str) -> bool:
-    """Returns True only if the token matches and hasn't expired."""
-    entry = _token_store.get(peer_id)
-    if not entry:
+    """Returns True only if the token was signed for this peer and hasn't expired."""
+    try:
+        key_id, issued_at, expires_at, signature = token.split(".")
+        key_id, issued_at, expires_at = int(key_id), int(issued_at), int(expires_at)
+    except (AttributeError, ValueError):
+        return False
+    now = time.time()
+    if expires_at < now or key_id > now // TOKEN_KEY_ROTATION_SECONDS:
         return False
-    stored_token, issued_at = entry
-    if time.time() - issued_at > TOKEN_TTL_SECONDS:
-        del _token_store[peer_id]
+    revoked = _revoked_before.get(peer_id)
+    if revoked is not None and issued_at <= revoked:
         return False
-    return secrets.compare_digest(stored_token, token)
+    return hmac.compare_digest(_sign(peer_id, key_id, issued_at, expires_at), signature)
+
+
+def revoke_token(peer_id: str, at: Optional[float] = None):
+    """Reject every token issued to this peer before `at` (ms; default now)."""
+    _revoked_before[peer_id] = at if at is not None else time.time() * 1000
 
 
-def revoke_token(peer_id: str):
-    _token_store.pop(peer_id, None)
\ No newline at end of file
+def revocations() -> Dict[str, float]:
+    """Revocations that still matter, i.e. younger than the token TTL."""
+    cutoff = (time.time() - TOKEN_TTL_SECONDS) * 1000
+    return {pid: at for pid, at in _revoked_before.items() if at > cutoff}
@@ -12,8 +12,24 @@ from .config import (
     ChunkData,
     load_admin_key,
 )
-from .metadata import save_metadata, load_metadata, get_file_metadata_by_stem
+from .metadata import save_metadata, load_metadata, get_file_metadata_by_stem, metadata_etag
 from .chunker import chunk_file, sha256
+from .bitfield import (
+    indices_to_ranges,
+    ranges_to_indices,
+    encode_bitfield,
+    decode_bitfield,
+)
+from .byte_range import (
+    RangeNotSatisfiable,
+    parse_range,
+    content_range,
+    unsatisfied_range,
+)
+from .metrics import Counter, Gauge, Histogram, TimedLock, MetricsMiddleware
+from .merkle import MerkleTree, merkle_root, verify_proof
+from .chunk_store import ChunkStore
+from .pack_store import PackStore
 
 __all__ = [
     "CHUNK_SIZE",
@@ -30,6 +46,25 @@ __all__ = [
     "save_metadata",
     "load_metadata",
     "get_file_metadata_by_stem",
+    "metadata_etag",
     "chunk_file",
     "sha256",
+    "indices_to_ranges",
+    "ranges_to_indices",
+    "encode_bitfield",
+    "decode_bitfield",
+    "RangeNotSatisfiable",
+    "parse_range",
+    "content_range",
+    "unsatisfied_range",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "TimedLock",
+    "MetricsMiddleware",
+    "MerkleTree",
+    "merkle_root",
+    "verify_proof",
+    "ChunkStore",
+    "PackStore",
 ]
\ No newline at end of file
@@ -0,0 +1,67 @@
+# shared/bitfield.py
+"""
+Compact encodings for sets of chunk indices, shared by the tracker and peers.
+
+- ranges:   [[start, end), ...] half-open intervals, sorted and merged
+- bitfield: base64 of a big-endian bit string, bit i set => chunk i held
+"""
+import base64
+from typing import Iterable, List, Set
+
+
+def indices_to_ranges(indices: Iterable[int]) -> List[List[int]]:
+    """Collapse indices into sorted, merged half-open [start, end) ranges."""
+    ranges: List[List[int]] = []
+    for idx in sorted(set(indices)):
+        if ranges and ranges[-1][1] == idx:
+            ranges[-1][1] = idx + 1
+        else:
+            ranges.append([idx, idx + 1])
+    return ranges
+
+
+def ranges_to_indices(ranges: Iterable[Iterable[int]], limit: int) -> Set[int]:
+    """
+    Expand [start, end) ranges, dropping indices >= limit (the file's chunk
+    count), so a range from an untrusted peer cannot grow the set past it.
+    """
+    if limit <= 0:
+        raise ValueError(f"limit must be positive, not {limit}")
+    out: Set[int] = set()
+    for start, end in ranges:
+        start, end = max(int(start), 0), min(int(end), limit)
+        out.update(range(start, end))
+    return out
+
+
+def encode_bitfield(indices: Iterable[int], total: int) -> str:
+    """Encode indices < total as a base64 bitfield."""
+    bits = bytearray((total + 7) // 8)
+    for idx in indices:
+        if 0 <= idx < total:
+            bits[idx >> 3] |= 0x80 >> (idx & 7)
+    return base64.b64encode(bytes(bits)).decode("ascii")
+
+
+def decode_bitfield(data: str, limit: int) -> Set[int]:
+    """
+    Decode a base64 bitfield of `limit` (the file's chunk count) bits. One
+    longer than that raises ValueError before anything is expanded, as
+    ranges_to_indices bounds ranges.
+    """
+    if limit <= 0:
+        raise ValueError(f"limit must be positive, not {limit}")
+    size = (limit + 7) // 8
+    if len(data) > 4 * ((size + 2) // 3):
+        raise ValueError(f"bitfield longer than {limit} bits")
+    raw = base64.b64decode(data)
+    if len(raw) > size:
+        raise ValueError(f"bitfield longer than {limit} bits")
+    out: Set[int] = set()
+    for byte_idx, byte in enumerate(raw):
+        if not byte:
+            continue
+        for bit in range(8):
+            if byte & (0x80 >> bit):
+                out.add(byte_idx * 8 + bit)
+    return {i for i in out if i < limit}
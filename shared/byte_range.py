@@ -0,0 +1,49 @@
+# shared/byte_range.py
+"""
+Single-range HTTP `Range: bytes=...` handling for the chunk endpoints.
+
+Ranges are half-open (start, stop) pairs, like shared.bitfield's. Anything
+but one byte range (other units, several ranges, garbage) is ignored, which
+RFC 9110 allows: the whole chunk is sent with 200 instead.
+"""
+from typing import Optional, Tuple
+
+
+class RangeNotSatisfiable(ValueError):
+    """The range starts past the end; answer 416 with unsatisfied_range()."""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """The (start, stop) a Range header asks for in `size` bytes, or None for all of it."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    if not (first or last) or not all(p.isdigit() for p in (first, last) if p):
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        n = int(last)
+        if n <= 0 or size <= 0:
+            raise RangeNotSatisfiable(header)
+        return max(size - n, 0), size
+    start = int(first)
+    stop = int(last) + 1 if last else size
+    if last and stop <= start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    return start, min(stop, size)
+
+
+def content_range(start: int, stop: int, size: int) -> str:
+    return f"bytes {start}-{stop - 1}/{size}"
+
+
+def unsatisfied_range(size: int) -> str:
+    return f"bytes */{size}"
+
+
+def read_span(path, start: int, stop: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(stop - start)
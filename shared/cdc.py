@@ -0,0 +1,76 @@
+# shared/cdc.py
+"""
+Content-defined chunking (FastCDC).
+
+Fixed-size chunks shift with every insertion: add one slide near the start
+of a deck and every chunk after it gets a new hash. Here a chunk ends where
+a rolling "gear" hash of the last 64 bytes hits a mask, so boundaries move
+with the content and an edit only changes the chunks around it.
+
+As in FastCDC, the first `min_size` bytes of a chunk are skipped without
+hashing, a stricter mask is used until `avg_size` and a looser one after
+(normalized chunking, which keeps sizes close to the average), and a chunk
+is cut at `max_size` regardless.
+
+The gear table and masks define where boundaries fall; changing them makes
+every file published afterwards share no chunks with earlier versions.
+
+The scan is pure Python, roughly 10 MB/s per core, which is fine for the
+lecture decks and handouts this mode is meant for; fixed-size chunking
+stays the default for large media.
+"""
+import hashlib
+from typing import Iterator, Tuple
+
+from shared.config import CDC_MIN_SIZE, CDC_AVG_SIZE, CDC_MAX_SIZE
+
+NORMALIZATION = 1   # mask bits added before avg_size and removed after it
+
+# 256 fixed pseudo-random 64-bit values, one per byte value
+GEAR = tuple(int.from_bytes(hashlib.sha256(b"gear" + bytes([b])).digest()[:8], "big")
+             for b in range(256))
+_M64 = (1 << 64) - 1
+
+
+def _mask(bits: int) -> int:
+    # High bits: with fp = (fp << 1) + GEAR[b], bit k depends on the last k + 1 bytes
+    return ((1 << bits) - 1) << (64 - bits)
+
+
+def cut_points(data, min_size: int = CDC_MIN_SIZE, avg_size: int = CDC_AVG_SIZE,
+               max_size: int = CDC_MAX_SIZE) -> Iterator[Tuple[int, int]]:
+    """(offset, size) of each chunk of `data` (bytes or an mmap), in order."""
+    if not 0 < min_size <= avg_size <= max_size or avg_size & (avg_size - 1):
+        raise ValueError(f"bad chunk sizes {min_size}/{avg_size}/{max_size}")
+    bits = avg_size.bit_length() - 1
+    mask_s = _mask(bits + NORMALIZATION)
+    mask_l = _mask(bits - NORMALIZATION)
+    total = len(data)
+    offset = 0
+    while offset < total:
+        size = _cut(data, offset, min(total - offset, max_size),
+                    min_size, avg_size, mask_s, mask_l)
+        yield offset, size
+        offset += size
+
+
+def _cut(data, start: int, n: int, min_size: int, avg_size: int,
+         mask_s: int, mask_l: int) -> int:
+    """Length of the chunk starting at `start`, at most n bytes."""
+    if n <= min_size:
+        return n
+    gear = GEAR
+    fp = 0
+    pos = min_size
+    normal = min(avg_size, n)
+    for b in data[start + min_size:start + normal]:
+        fp = ((fp << 1) + gear[b]) & _M64
+        pos += 1
+        if not fp & mask_s:
+            return pos
+    for b in data[start + normal:start + n]:
+        fp = ((fp << 1) + gear[b]) & _M64
+        pos += 1
+        if not fp & mask_l:
+            return pos
+    return n
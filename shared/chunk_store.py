@@ -0,0 +1,252 @@
+# shared/chunk_store.py
+"""
+Content-addressed chunk storage: each distinct chunk is kept once, under its
+SHA-256, however many files (or positions within one file) contain it.
+
+    <root>/packs/                    chunk bytes, appended to pack files (shared/pack_store.py)
+    <root>/refs/<holder>/<stem>      "index hash" lines: chunk `index` of `stem` is h
+
+A holder is one user of the store ("tracker", "peer"). Processes sharing a
+storage directory share the objects but keep their own refs. A chunk's
+refcount is the number of refs naming it across holders; release() drops a
+file's refs, and set_refs() replaces them with a new version's, deleting
+the objects nothing references any more, and compacts packs that deletes
+left mostly dead. Refcounts are recounted from the refs files when needed
+rather than kept in a counter, so a crash cannot leave them wrong. Writers
+add a chunk's ref before its bytes: put_*() skips an object already stored,
+so one freed in between is stored again.
+
+A ref need not have an object: peers that write downloads in place record
+their chunks' hashes too, so locate() finds them in the finished file.
+
+Chunk files from before the packs (storage/chunks, storage/received_chunks,
+<root>/objects) are moved in by shared/migrate_chunks.py.
+"""
+import os
+import tempfile
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from shared.pack_store import PackStore
+
+TMP_SUFFIX = ".tmp"
+
+
+def _stamp(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+def _read_lines(path: Path) -> List[Tuple[int, str]]:
+    lines = []
+    try:
+        with open(path, "r", encoding="ascii") as f:
+            for line in f:
+                index, _, chunk_hash = line.strip().partition(" ")
+                if index.isdigit() and len(chunk_hash) == 64:
+                    lines.append((int(index), chunk_hash))
+    except FileNotFoundError:
+        pass
+    return lines
+
+
+def _read_refs(path: Path) -> Dict[int, str]:
+    return dict(_read_lines(path))   # later lines win
+
+
+class ChunkStore:
+    """One holder's view of a content-addressed store (see module docstring). Thread-safe."""
+
+    def __init__(self, root: Path, holder: str):
+        self.root = Path(root)
+        self.packs = PackStore(self.root / "packs")
+        self.incoming = self.root / "incoming"     # temp files of chunks being downloaded
+        self.refs_dir = self.root / "refs" / holder
+        self._lock = threading.Lock()
+        self._refs: Dict[str, Dict[int, str]] = {}
+        self._stamps: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._by_hash: Optional[Dict[str, Set[Tuple[str, int]]]] = None
+
+    # ── Objects ───────────────────────────────────────────────
+    def has(self, chunk_hash: str) -> bool:
+        return self.packs.has(chunk_hash)
+
+    def size(self, chunk_hash: str) -> Optional[int]:
+        loc = self.packs.locate(chunk_hash)
+        return None if loc is None else loc[2]
+
+    def read(self, chunk_hash: str, start: int = 0, stop: Optional[int] = None) -> Optional[bytes]:
+        """Bytes [start, stop) of an object (all of it by default), None if not stored."""
+        return self.packs.read(chunk_hash, start, stop)
+
+    def span(self, chunk_hash: str) -> Optional[Tuple[Path, int, int]]:
+        """(pack file, offset, length) of an object, for readers that copy it themselves."""
+        loc = self.packs.locate(chunk_hash)
+        return None if loc is None else (self.packs.pack_path(loc[0]), loc[1], loc[2])
+
+    def put_file(self, chunk_hash: str, src: Path):
+        """Store a verified chunk file as its hash's object, unless already stored; src is removed."""
+        src = Path(src)
+        if not self.packs.has(chunk_hash):
+            self.packs.put(chunk_hash, src.read_bytes())
+        src.unlink(missing_ok=True)
+
+    def put_bytes(self, chunk_hash: str, data):
+        """Store chunk bytes under their (already computed) hash, unless already stored."""
+        self.packs.put(chunk_hash, data)
+
+    def discard(self, chunk_hash: str):
+        """Delete an object found damaged, whatever references it."""
+        self.packs.delete((chunk_hash,))
+
+    def compact(self, **kwargs) -> int:
+        """See PackStore.compact."""
+        return self.packs.compact(**kwargs)
+
+    # ── Refs ──────────────────────────────────────────────────
+    def add_ref(self, file_stem: str, index: int, chunk_hash: str):
+        """Record that chunk `index` of `file_stem` is `chunk_hash`."""
+        with self._lock:
+            self._add_ref(file_stem, index, chunk_hash)
+
+    def adopt(self, file_stem: str, index: int, chunk_hash: str) -> bool:
+        """add_ref() for an object already stored; False, and no ref, if it isn't."""
+        with self._lock:
+            # Under the lock: release() can't free it between the check and the ref
+            if not self.has(chunk_hash):
+                return False
+            self._add_ref(file_stem, index, chunk_hash)
+            return True
+
+    def ref(self, file_stem: str, index: int) -> Optional[str]:
+        """The hash recorded for chunk `index` of `file_stem`, if any."""
+        with self._lock:
+            return self._load(file_stem).get(index)
+
+    def refs(self, file_stem: str) -> Dict[int, str]:
+        with self._lock:
+            return dict(self._load(file_stem))
+
+    def lookup(self, file_stem: str, index: int) -> Optional[str]:
+        """The hash of chunk `index` of `file_stem`, if its object is stored."""
+        chunk_hash = self.ref(file_stem, index)
+        return chunk_hash if chunk_hash is not None and self.has(chunk_hash) else None
+
+    def stems(self) -> List[str]:
+        """Files this holder has refs for."""
+        if not self.refs_dir.exists():
+            return []
+        return sorted(p.name for p in self.refs_dir.iterdir() if not p.name.endswith(TMP_SUFFIX))
+
+    def locate(self, chunk_hash: str) -> List[Tuple[str, int]]:
+        """(file_stem, index) of every chunk this holder has recorded with this hash."""
+        with self._lock:
+            if self._by_hash is None:
+                self._by_hash = {}
+                for stem in self.stems():
+                    self._load(stem)
+                for stem, refs in self._refs.items():
+                    for index, h in refs.items():
+                        self._by_hash.setdefault(h, set()).add((stem, index))
+            return sorted(self._by_hash.get(chunk_hash, ()))
+
+    def set_refs(self, file_stem: str, refs: Dict[int, str]) -> int:
+        """
+        Make `refs` all of a file's refs (after a new version of it, say),
+        deleting the objects only its old refs used. Returns how many.
+        """
+        with self._lock:
+            old = self._named(file_stem)
+            self.refs_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.refs_dir, suffix=TMP_SUFFIX)
+            with os.fdopen(fd, "w", encoding="ascii") as f:
+                f.writelines(f"{i} {h}\n" for i, h in sorted(refs.items()))
+            os.replace(tmp, self.refs_dir / file_stem)
+            self._forget(file_stem)
+            self._load(file_stem)
+            freed = self._free(old - set(refs.values()))
+        if freed:
+            self.packs.compact()
+        return freed
+
+    def release(self, file_stem: str) -> int:
+        """Forget a file's refs and delete the objects no holder references any more."""
+        with self._lock:
+            hashes = self._named(file_stem)
+            (self.refs_dir / file_stem).unlink(missing_ok=True)
+            self._forget(file_stem)
+            freed = self._free(hashes)
+        if freed:
+            self.packs.compact()
+        return freed
+
+    def refcounts(self, hashes: Optional[Iterable[str]] = None) -> Counter:
+        """Refs naming each hash across every holder (only `hashes`, if given)."""
+        wanted = set(hashes) if hashes is not None else None
+        counts: Counter = Counter()
+        refs_root = self.root / "refs"
+        if not refs_root.exists():
+            return counts
+        for holder_dir in refs_root.iterdir():
+            for p in holder_dir.iterdir():
+                if p.name.endswith(TMP_SUFFIX):
+                    continue
+                for chunk_hash in _read_refs(p).values():
+                    if wanted is None or chunk_hash in wanted:
+                        counts[chunk_hash] += 1
+        return counts
+
+    # ── Internals (lock held) ─────────────────────────────────
+    def _add_ref(self, file_stem: str, index: int, chunk_hash: str):
+        refs = self._load(file_stem)
+        old = refs.get(index)
+        if old == chunk_hash:
+            return
+        self.refs_dir.mkdir(parents=True, exist_ok=True)
+        path = self.refs_dir / file_stem
+        with open(path, "a", encoding="ascii") as f:
+            f.write(f"{index} {chunk_hash}\n")
+        refs[index] = chunk_hash
+        self._stamps[file_stem] = _stamp(path)
+        if self._by_hash is not None:
+            if old is not None:
+                self._by_hash.get(old, set()).discard((file_stem, index))
+            self._by_hash.setdefault(chunk_hash, set()).add((file_stem, index))
+
+    def _free(self, hashes: Set[str]) -> int:
+        """
+        Delete the objects among `hashes` that no refs name any more. Under
+        the lock, so an add_ref can't land between the recount and the delete.
+        """
+        still = self.refcounts(hashes)
+        return self.packs.delete(h for h in hashes if not still[h])
+
+    def _named(self, file_stem: str) -> Set[str]:
+        """Every hash a file's refs name, including ones later lines replaced."""
+        return {h for _, h in _read_lines(self.refs_dir / file_stem)}
+
+    def _load(self, file_stem: str) -> Dict[int, str]:
+        """A file's refs, re-read if another process appended to them."""
+        path = self.refs_dir / file_stem
+        stamp = _stamp(path)
+        if file_stem not in self._refs or stamp != self._stamps.get(file_stem):
+            refs = _read_refs(path) if stamp else {}
+            if self._by_hash is not None:
+                self._forget(file_stem)
+                for index, h in refs.items():
+                    self._by_hash.setdefault(h, set()).add((file_stem, index))
+            self._refs[file_stem] = refs
+            self._stamps[file_stem] = stamp
+        return self._refs[file_stem]
+
+    def _forget(self, file_stem: str):
+        old = self._refs.pop(file_stem, {})
+        self._stamps.pop(file_stem, None)
+        if self._by_hash is not None:
+            for index, h in old.items():
+                self._by_hash.get(h, set()).discard((file_stem, index))
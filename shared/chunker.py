@@ -1,7 +1,14 @@
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
 import hashlib
 import mimetypes
-from shared.config import CHUNK_SIZE, normalize_stem
+import mmap
+import os
+from shared.config import CHUNK_SIZE, CHUNKER_WORKERS, CHUNKING, normalize_stem
+from shared.merkle import merkle_root
+from shared.cdc import cut_points
 
 ADMIN_PORT = 8000
 CHUNK_PORT = 9000
@@ -54,18 +61,106 @@ def detect_mime_type(file_path: Path) -> str:
     
     return 'application/octet-stream'
 
-def chunk_file(file_path: str, out_dir: str):
+def write_chunks(file_path: Path, out_dir: Path, chunk_stem: str,
+                 workers: Optional[int] = None,
+                 progress: Optional[Callable[[int, int], None]] = None,
+                 store=None, chunking: Optional[str] = None) -> Tuple[List[dict], str]:
+    """
+    Split a file into chunk files named <chunk_stem>_chunk_<i>, or, given a
+    shared.chunk_store.ChunkStore, into its objects: a chunk whose hash is
+    already stored is not written again, only referenced.
+
+    chunking (default CHUNKING) is "fixed" for CHUNK_SIZE chunks or "cdc"
+    for content-defined ones of varying size (see shared/cdc.py).
+
+    The file is memory-mapped and its chunks are hashed on a thread pool
+    (hashlib releases the GIL), a bounded number ahead of this thread,
+    which writes them out in order and feeds them to the whole-file hash.
+    progress(bytes_done, total_bytes) is called from this thread after
+    each chunk is written.
+
+    Returns the chunk list for the metadata (index, hash, filename, size)
+    and the file's SHA-256.
+    """
+    workers = workers or CHUNKER_WORKERS or os.cpu_count() or 1
+    chunking = chunking or CHUNKING
+    if chunking not in ("fixed", "cdc"):
+        raise ValueError(f"unknown chunking {chunking!r}")
+    total = os.path.getsize(file_path)
+    chunks = []
+    whole = hashlib.sha256()
+    if total == 0:
+        return chunks, whole.hexdigest()
+
+    def _hash(offset: int, size: int) -> str:
+        with view[offset:offset + size] as data:
+            return hashlib.sha256(data).hexdigest()
+
+    with open(file_path, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            memoryview(mm) as view, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        if chunking == "cdc":
+            # Boundaries are found here, lazily, while the pool hashes ahead
+            spans = cut_points(mm)
+        else:
+            spans = ((offset, min(CHUNK_SIZE, total - offset))
+                     for offset in range(0, total, CHUNK_SIZE))
+        pending = deque()
+        # Enough hashes queued to keep every worker busy while we write
+        for offset, size in spans:
+            pending.append((offset, size, pool.submit(_hash, offset, size)))
+            if len(pending) >= 2 * workers:
+                break
+        done = 0
+        index = 0
+        while pending:
+            offset, size, future = pending.popleft()
+            chunk_name = f"{chunk_stem}_chunk_{index}"
+            chunk_hash = future.result()
+            with view[offset:offset + size] as data:
+                if store is None:
+                    with open(out_dir / chunk_name, "wb") as cf:
+                        cf.write(data)
+                else:
+                    store.add_ref(chunk_stem, index, chunk_hash)
+                    store.put_bytes(chunk_hash, data)
+                whole.update(data)
+            chunks.append({
+                "index": index,
+                "hash": chunk_hash,
+                "filename": chunk_name,
+                "size": size
+            })
+            done += size
+            if progress:
+                progress(done, total)
+            index += 1
+            nxt = next(spans, None)
+            if nxt is not None:
+                pending.append(nxt + (pool.submit(_hash, *nxt),))
+    if store is not None:
+        # Re-published: drop what the previous version referenced
+        store.set_refs(chunk_stem, {c["index"]: c["hash"] for c in chunks})
+    return chunks, whole.hexdigest()
+
+def chunk_file(file_path: str, out_dir: str, workers: Optional[int] = None,
+               progress: Optional[Callable[[int, int], None]] = None, store=None,
+               chunking: Optional[str] = None):
     """
     Chunk a file into smaller pieces with automatic file type detection
     
     Args:
         file_path: Path to the file to chunk
         out_dir: Directory to save chunks
+        workers: Hashing threads (default CHUNKER_WORKERS, else one per CPU)
+        progress: Called with (bytes_done, total_bytes) after each chunk
+        store: ChunkStore to put the chunks in instead of out_dir
+        chunking: "fixed" or "cdc" (content-defined sizes); default CHUNKING
     
     Returns:
         dict: Dictionary containing chunks list and file metadata
     """
-    chunks = []
     file_path = Path(file_path)
     
     # Create output directory if it doesn't exist
@@ -75,31 +170,10 @@ def chunk_file(file_path: str, out_dir: str):
     # Detect MIME type
     mime_type = detect_mime_type(file_path)
 
-    with open(file_path, "rb") as f:
-        index = 0
-        while True:
-            data = f.read(CHUNK_SIZE)
-            if not data:
-                break
-
-            chunk_hash = sha256(data)
-            
-            # Create chunk filename without extension for easier handling
-            # Format: originalname_chunk_0, originalname_chunk_1, etc.
-            safe_stem = normalize_stem(file_path.name)
-            chunk_name = f"{safe_stem}_chunk_{index}"
-            chunk_path = out_dir_path / chunk_name
-
-            with open(chunk_path, "wb") as cf:
-                cf.write(data)
-
-            chunks.append({
-                "index": index,
-                "hash": chunk_hash,
-                "filename": chunk_name,
-                "size": len(data)
-            })
-            index += 1
+    # Chunk files are named originalname_chunk_0, originalname_chunk_1, etc.
+    chunks, file_hash = write_chunks(file_path, out_dir_path, normalize_stem(file_path.name),
+                                     workers=workers, progress=progress, store=store,
+                                     chunking=chunking)
 
     # Return both chunks and original file info with MIME type
     return {
@@ -107,20 +181,40 @@ def chunk_file(file_path: str, out_dir: str):
         "original_extension": file_path.suffix,
         "file_stem": file_path.stem,
         "mime_type": mime_type,
+        "file_size": sum(c["size"] for c in chunks),
+        "file_hash": file_hash,
+        "merkle_root": merkle_root([c["hash"] for c in chunks]),
+        "chunking": chunking or CHUNKING,
         "chunks": chunks,
         "total_chunks": len(chunks)
     }
 
-def get_chunk_info(chunk_dir: str = "storage/chunks"):
+def get_chunk_info(chunk_dir: str = "storage/chunks", store=None):
     """
     Get information about all chunks in a directory
     
     Args:
         chunk_dir: Directory containing chunks
+        store: ChunkStore to list instead, from its refs and pack index
+            (no chunk is read)
     
     Returns:
         dict: Dictionary mapping file names to their chunks
     """
+    if store is not None:
+        file_chunks = {}
+        for file_base in store.stems():
+            for chunk_idx, chunk_hash in sorted(store.refs(file_base).items()):
+                size = store.size(chunk_hash) if store.has(chunk_hash) else None
+                if size is not None:
+                    file_chunks.setdefault(file_base, []).append({
+                        'index': chunk_idx,
+                        'filename': f"{file_base}_chunk_{chunk_idx}",
+                        'hash': chunk_hash,
+                        'size': size
+                    })
+        return file_chunks
+
     chunk_dir_path = Path(chunk_dir)
     
     if not chunk_dir_path.exists():
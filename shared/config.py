@@ -13,6 +13,48 @@ MAX_CLUSTER_SIZE = 20
 PEER_SAMPLE_SIZE = 5
 MAX_ASSIGNMENT_SIZE = 50 * 1024 * 1024  
 BOOTSTRAP_PEERS: List[str] = []          
+AVAILABILITY_TTL = 10.0          # seconds a cached chunk-owner map stays fresh
+ANNOUNCE_WINDOW = 0.5            # seconds chunk announcements are coalesced for
+ANNOUNCE_BACKOFF_MAX = 30.0      # seconds; cap on the retry delay while the tracker fails them
+DOWNLOAD_CONCURRENCY = 128       # chunk requests in flight per download
+PER_PEER_CONNECTIONS = 8         # of those, at most this many to one peer
+ENDGAME_CHUNKS = 16              # chunks left in flight when duplicate requests start
+ENDGAME_FANOUT = 3               # at most this many owners asked at once for one chunk
+# Per-peer request windows (peer_node/scheduler.py): start small, +1 per
+# window of good responses, scaled by SCHED_DECREASE on each failure
+SCHED_INITIAL_WINDOW = 2
+SCHED_MAX_WINDOW = PER_PEER_CONNECTIONS
+SCHED_DECREASE = 0.5
+SCHED_EWMA_ALPHA = 0.2           # weight of the newest sample in per-peer averages
+CHUNK_CONNECT_TIMEOUT = 3.0      # seconds; a peer that can't be reached is dropped
+CHUNK_READ_TIMEOUT = 10.0        # seconds per chunk response
+CHUNK_STREAM_BUFFER = 64 * 1024  # bytes of a chunk response held in memory at a time
+CHUNK_BLOCK_SIZE = 128 * 1024    # Range requests a chunk is split into across owners (0: whole chunks)
+DIRECT_DOWNLOADS = True          # write chunks in place in storage/downloads, not one file each
+PIECE_STATE_INTERVAL = 5.0       # seconds between saves of a download's verified-chunk state
+HTTP_KEEPALIVE_TIMEOUT = 65      # seconds our HTTP servers hold an idle connection open
+POOL_IDLE_TIMEOUT = 55.0         # seconds a pooled client connection may idle (below the above)
+POOL_MAX_HOSTS = 64              # hosts with pooled connections; least recently used are closed
+CHUNKER_WORKERS = 0              # threads hashing chunks of a file being published (0: one per CPU)
+# How published files are split: "fixed" CHUNK_SIZE chunks, or "cdc" for
+# content-defined ones (shared/cdc.py) of CDC_MIN_SIZE..CDC_MAX_SIZE bytes
+# averaging about CDC_AVG_SIZE, so an edit only changes the chunks around it
+CHUNKING = "fixed"
+CDC_MIN_SIZE = CHUNK_SIZE // 4
+CDC_AVG_SIZE = CHUNK_SIZE        # a power of two
+CDC_MAX_SIZE = CHUNK_SIZE * 4
+# Chunk objects are appended to pack files (shared/pack_store.py)
+PACK_SIZE = 256 * 1024 * 1024    # bytes; a fuller pack is sealed and a new one started
+PACK_COMPACT_GARBAGE = 0.5       # share of a pack's bytes deleted before compaction rewrites it
+PACK_IDLE = 3600.0               # seconds after which an unsealed pack counts as abandoned
+CATALOG_PAGE_SIZE = 25           # files per dashboard library page
+# Library filter/sort choices shared by both dashboards -> /files parameters
+CATALOG_MIME_FILTERS = {
+    "All types": "", "PDF": "application/pdf", "Documents": "application/*",
+    "Video": "video/*", "Audio": "audio/*", "Images": "image/*", "Text": "text/*",
+}
+CATALOG_SORTS = {"Name": "name", "Recently added": "-updated",
+                 "Most chunks": "-chunks", "Fewest chunks": "chunks"}
 
 logging.basicConfig(
     level=logging.INFO,
@@ -101,6 +143,7 @@ class FileMetadata(BaseModel):
     total_chunks: int
     file_size: int
     mime_type: str = "application/octet-stream"
+    merkle_root: str = ""            # over the chunk hashes; "" for legacy metadata
 
 
 class ChunkData(BaseModel):
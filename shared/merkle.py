@@ -0,0 +1,106 @@
+# shared/merkle.py
+"""
+Merkle tree over a file's chunk hashes.
+
+Metadata carries the root ("merkle_root"); the tracker serves runs of chunk
+hashes with an inclusion proof for the run, so a peer holding only the root
+can trust chunk hashes fetched piecemeal.
+
+Leaves are SHA-256(0x00 || chunk digest) and inner nodes SHA-256(0x01 ||
+left || right), so a leaf can never pass for an inner node. A node left
+without a sibling at the end of a level moves up unchanged. The root is
+SHA-256(0x02 || leaf count as 8 bytes || top node), so it also fixes the
+number of chunks.
+
+The proof for the contiguous leaves [start, stop) is the sibling digests
+just outside the run on each level, at most two per level: about
+2 * log2(total_chunks) digests however long the run is. The verifier knows
+from start, stop and the total which levels need which sibling.
+"""
+import hashlib
+from typing import List, Optional, Sequence
+
+_LEAF = b"\x00"
+_NODE = b"\x01"
+_ROOT = b"\x02"
+
+
+def _leaf(chunk_hash: str) -> bytes:
+    return hashlib.sha256(_LEAF + bytes.fromhex(chunk_hash)).digest()
+
+
+def _node(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(_NODE + left + right).digest()
+
+
+def _root(total: int, top: bytes) -> str:
+    return hashlib.sha256(_ROOT + total.to_bytes(8, "big") + top).hexdigest()
+
+
+def _parents(nodes: List[bytes]) -> List[bytes]:
+    return [_node(nodes[i], nodes[i + 1]) if i + 1 < len(nodes) else nodes[i]
+            for i in range(0, len(nodes), 2)]
+
+
+class MerkleTree:
+    """Every level of the tree, leaves first; built once, then proofs are lookups."""
+
+    def __init__(self, chunk_hashes: Sequence[str]):
+        level = [_leaf(h) for h in chunk_hashes]
+        self.levels: List[List[bytes]] = [level]
+        while len(level) > 1:
+            level = _parents(level)
+            self.levels.append(level)
+
+    def __len__(self) -> int:
+        return len(self.levels[0])
+
+    @property
+    def root(self) -> str:
+        top = self.levels[-1]
+        return _root(len(self), top[0] if top else b"")
+
+    def proof(self, start: int, stop: Optional[int] = None) -> List[str]:
+        """Sibling digests (hex) proving leaves [start, stop); stop defaults to start + 1."""
+        stop = start + 1 if stop is None else stop
+        if not 0 <= start < stop <= len(self):
+            raise IndexError((start, stop))
+        path = []
+        for level in self.levels[:-1]:
+            if start % 2:
+                path.append(level[start - 1].hex())
+            if stop % 2 and stop < len(level):
+                path.append(level[stop].hex())
+            start //= 2
+            stop = (stop + 1) // 2
+        return path
+
+
+def merkle_root(chunk_hashes: Sequence[str]) -> str:
+    return MerkleTree(chunk_hashes).root
+
+
+def verify_proof(chunk_hashes: Sequence[str], start: int, total: int,
+                 proof: Sequence[str], root: str) -> bool:
+    """Whether `chunk_hashes` are leaves start.. of the `total`-leaf tree with this root."""
+    stop = start + len(chunk_hashes)
+    if not 0 <= start < stop <= total:
+        return False
+    try:
+        nodes = [_leaf(h) for h in chunk_hashes]
+        siblings = iter(proof)
+        width = total
+        while width > 1:
+            if start % 2:
+                nodes.insert(0, bytes.fromhex(next(siblings)))
+                start -= 1
+            if stop % 2 and stop < width:
+                nodes.append(bytes.fromhex(next(siblings)))
+                stop += 1
+            nodes = _parents(nodes)
+            start //= 2
+            stop = (stop + 1) // 2
+            width = (width + 1) // 2
+    except (StopIteration, ValueError, TypeError):
+        return False
+    return next(siblings, None) is None and _root(total, nodes[0]) == root
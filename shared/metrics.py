@@ -0,0 +1,305 @@
+# shared/metrics.py
+"""
+In-process counters, gauges and histograms with Prometheus text exposition.
+
+Each process (tracker, peer) has one registry; its /metrics endpoint serves
+render(). Updating a metric is a dict lookup plus a short critical section,
+so hot paths can afford it. Labelled metrics are used as
+
+    CHUNKS_SERVED.labels("range").inc()
+
+and label children are cached, so keep label values low-cardinality (route
+templates, not raw paths).
+"""
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Seconds: sub-millisecond lock holds up to slow requests
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bytes: 4 KB .. 16 MB
+SIZE_BUCKETS = tuple(4096 * 4 ** n for n in range(7))
+# Bytes per second: 100 KB/s .. 1 GB/s
+RATE_BUCKETS = (1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7, 5e7, 1e8, 2.5e8, 5e8, 1e9)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # last one is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self) -> "_Timer":
+        """Context manager observing the seconds spent inside it."""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("_buckets", "_start")
+
+    def __init__(self, buckets: _Buckets):
+        self._buckets = buckets
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._buckets.observe(time.perf_counter() - self._start)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (),
+                 registry: Optional["Registry"] = None):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._unlabelled = self.labels()
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _label_str(self, key: tuple, extra: str = "") -> str:
+        pairs = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._unlabelled.inc(amount)
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{self._label_str(key)} {_num(child.value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0):
+        self._unlabelled.dec(amount)
+
+    def set(self, value: float):
+        self._unlabelled.set(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS,
+                 registry: Optional["Registry"] = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, doc, labelnames, registry)
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float):
+        self._unlabelled.observe(value)
+
+    def time(self) -> _Timer:
+        return self._unlabelled.time()
+
+    def _render_child(self, key, child):
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else _num(bound)
+            labels = self._label_str(key, 'le="%s"' % le)
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_str(key)} {_num(total)}")
+        lines.append(f"{self.name}_count{self._label_str(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if any(m.name == metric.name for m in self._metrics):
+                raise ValueError(f"metric {metric.name} already registered")
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# ── Instrumentation helpers ───────────────────────────────────
+class TimedLock:
+    """
+    A threading.Lock that records how long callers waited for it and how
+    long they held it, in the LOCK_WAIT / LOCK_HOLD histograms under `name`.
+    """
+
+    def __init__(self, name: str):
+        self._lock = threading.Lock()
+        self._wait = LOCK_WAIT.labels(name)
+        self._hold = LOCK_HOLD.labels(name)
+        self._acquired_at = 0.0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        start = time.perf_counter()
+        got = self._lock.acquire(blocking, timeout)
+        if got:
+            self._acquired_at = time.perf_counter()
+            self._wait.observe(self._acquired_at - start)
+        return got
+
+    def release(self):
+        held = time.perf_counter() - self._acquired_at
+        self._lock.release()
+        self._hold.observe(held)
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class CountingSocket:
+    """Wraps a connected socket so every recv() adds to a counter."""
+
+    def __init__(self, sock, counter: Counter):
+        self._sock = sock
+        self._counter = counter
+
+    def recv(self, bufsize: int, *args) -> bytes:
+        data = self._sock.recv(bufsize, *args)
+        self._counter.inc(len(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request into HTTP_LATENCY, labelled
+    by method, route template and status. Plain ASGI rather than
+    BaseHTTPMiddleware, so streamed and file responses pass through as is.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_LATENCY.labels(scope["method"], route, status).observe(
+                time.perf_counter() - start)
+
+
+# ── Metrics shared by the tracker and peers ───────────────────
+HTTP_LATENCY = Histogram("http_request_duration_seconds",
+                         "HTTP request latency by method, route and status",
+                         ["method", "route", "status"])
+LOCK_WAIT = Histogram("lock_wait_seconds", "Time spent waiting to acquire a lock", ["lock"])
+LOCK_HOLD = Histogram("lock_hold_seconds", "Time a lock was held", ["lock"])
+CHUNKS_SERVED = Counter("chunks_served_total", "Chunk responses sent (whole or ranges)", ["kind"])
+CHUNK_BYTES_SERVED = Histogram("chunk_served_bytes", "Bytes sent per chunk response",
+                               buckets=SIZE_BUCKETS)
+TCP_RECEIVED_BYTES = Counter("tcp_received_bytes_total", "Bytes received by the TCP server")
+TCP_CONNECTIONS = Counter("tcp_connections_total", "Connections accepted by the TCP server")
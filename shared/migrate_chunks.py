@@ -0,0 +1,125 @@
+# shared/migrate_chunks.py
+"""
+Move chunk files kept one per file into the chunk store's pack files
+(shared/pack_store.py), then compact the packs.
+
+    storage/chunks/<stem>_chunk_<i>            published by the tracker -> refs/tracker
+    storage/received_chunks/<stem>_chunk_<i>   received by a peer       -> refs/peer
+    storage/chunk_store/objects/<h[:2]>/<h>    objects of the chunk store before packs
+
+Every chunk is hashed on the way in; a chunk file whose hash disagrees with
+its file's metadata is left where it is. Moved files are deleted unless
+--keep is given. Stop the tracker, the dashboards and any peer using the
+storage directory first.
+
+    python shared/migrate_chunks.py
+    python shared/migrate_chunks.py --storage /srv/p2p/storage --keep
+    python shared/migrate_chunks.py --compact
+"""
+import argparse
+import hashlib
+import json
+import sys
+from pathlib import Path
+from typing import Dict, Optional
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+from shared.chunk_store import ChunkStore, TMP_SUFFIX
+
+
+def _known_hashes(metadata_dir: Path, file_stem: str, cache: Dict[str, Optional[dict]]) -> Optional[dict]:
+    """Chunk index -> hash from a file's metadata, None without one."""
+    if file_stem not in cache:
+        try:
+            meta = json.loads((metadata_dir / f"{file_stem}.json").read_text())
+            cache[file_stem] = {c["index"]: c["hash"] for c in meta.get("chunks", [])}
+        except (OSError, ValueError, KeyError, TypeError):
+            cache[file_stem] = None
+    return cache[file_stem]
+
+
+def migrate_dir(chunk_dir: Path, store: ChunkStore, holder: ChunkStore,
+                metadata_dir: Path, keep: bool) -> dict:
+    """Chunk files named <stem>_chunk_<i> into the store, referenced by `holder`."""
+    counts = {"moved": 0, "mismatched": 0}
+    if not chunk_dir.exists():
+        return counts
+    cache: Dict[str, Optional[dict]] = {}
+    for path in sorted(chunk_dir.iterdir()):
+        file_stem, sep, index = path.name.rpartition("_chunk_")
+        if not sep or not index.isdigit() or not path.is_file():
+            continue
+        data = path.read_bytes()
+        chunk_hash = hashlib.sha256(data).hexdigest()
+        known = _known_hashes(metadata_dir, file_stem, cache)
+        if known is not None and known.get(int(index)) != chunk_hash:
+            counts["mismatched"] += 1
+            continue
+        holder.add_ref(file_stem, int(index), chunk_hash)
+        store.put_bytes(chunk_hash, data)
+        if not keep:
+            path.unlink()
+        counts["moved"] += 1
+    return counts
+
+
+def migrate_objects(objects_dir: Path, store: ChunkStore, keep: bool) -> dict:
+    """Loose <h[:2]>/<h> objects into the store; their refs are already in place."""
+    counts = {"moved": 0, "mismatched": 0}
+    if not objects_dir.exists():
+        return counts
+    for path in sorted(objects_dir.glob("??/*")):
+        if path.name.endswith(TMP_SUFFIX) or len(path.name) != 64:
+            continue
+        data = path.read_bytes()
+        if hashlib.sha256(data).hexdigest() != path.name:
+            counts["mismatched"] += 1
+            continue
+        store.put_bytes(path.name, data)
+        if not keep:
+            path.unlink()
+        counts["moved"] += 1
+    if not keep:
+        for d in objects_dir.glob("??"):
+            if d.is_dir() and not any(d.iterdir()):
+                d.rmdir()
+    return counts
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--storage", default=str(BASE_DIR / "storage"))
+    ap.add_argument("--keep", action="store_true", help="leave the chunk files in place")
+    ap.add_argument("--compact", action="store_true", help="only compact the packs")
+    args = ap.parse_args()
+
+    storage = Path(args.storage)
+    # One writer for both holders' chunks: the refs are all a holder adds
+    tracker = ChunkStore(storage / "chunk_store", holder="tracker")
+    peer = ChunkStore(storage / "chunk_store", holder="peer")
+    try:
+        if not args.compact:
+            sources = [
+                ("storage/chunks", migrate_dir(storage / "chunks", tracker, tracker,
+                                               storage / "metadata", args.keep)),
+                ("storage/received_chunks", migrate_dir(storage / "received_chunks", tracker, peer,
+                                                        storage / "metadata", args.keep)),
+                ("chunk_store/objects", migrate_objects(storage / "chunk_store" / "objects",
+                                                        tracker, args.keep)),
+            ]
+            for name, counts in sources:
+                note = f", {counts['mismatched']} left (hash mismatch)" if counts["mismatched"] else ""
+                print(f"{name}: {counts['moved']} chunks moved{note}")
+        reclaimed = tracker.compact(idle=0)
+        print(f"Compaction reclaimed {reclaimed / 1024 ** 2:.1f} MB")
+    finally:
+        tracker.packs.close()
+    stats = tracker.packs.stats()
+    print(f"{stats['objects']} chunks in {stats['packs']} pack file(s), "
+          f"{stats['live_bytes'] / 1024 ** 2:.1f} of {stats['total_bytes'] / 1024 ** 2:.1f} MB live")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+# shared/pack_store.py
+"""
+Chunk objects appended to a few large pack files, found through an offset
+index, instead of one file each: a 20 GB library would otherwise be ~40,000
+files to open, stat and close one at a time.
+
+    <root>/<id>.idx     "hash offset length" per object, appended after its bytes
+    <root>/<id>.pack    object bytes, back to back
+    <root>/<id>.dead    "hash offset" per object deleted from the pack
+
+A process only appends to packs it created (the id carries its pid), and
+starts a new one at PACK_SIZE, ending the full one's index with a "sealed"
+line; it also starts a new one rather than go back to a pack idle for half
+of PACK_IDLE. Other processes read new index and dead lines from where they
+left off when a lookup misses (has() at most once a second, locate() every
+time). Reads copy out of a read-only mapping of the pack.
+
+Deleting only records the object as dead. compact() rewrites packs that are
+sealed, or unsealed and idle for PACK_IDLE, once PACK_COMPACT_GARBAGE of
+their bytes are dead or copies of objects stored elsewhere: the live
+objects are appended to this process's pack, then the old index, dead list
+and pack are removed, in that order. One process compacts at a time
+(compact.lock). Packs are never modified in place, so a process still
+mapping a removed pack reads valid bytes; one that finds it gone re-reads
+the indexes and retries.
+"""
+import mmap
+import os
+import secrets
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from shared.config import PACK_SIZE, PACK_COMPACT_GARBAGE, PACK_IDLE
+
+SEALED = "sealed"
+LOCK_NAME = "compact.lock"
+LOCK_STALE = 3600.0       # seconds after which a compaction lock is taken over
+REFRESH_INTERVAL = 1.0    # seconds has() trusts a negative answer for
+
+Location = Tuple[str, int, int]   # pack id, offset, length
+
+_BINARY = getattr(os, "O_BINARY", 0)
+
+
+def _write_all(fd: int, data) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+class _Pack:
+    """What has been read so far of one pack's index and dead list."""
+
+    def __init__(self, pack_id: str):
+        self.id = pack_id
+        self.entries: Dict[str, Tuple[int, int]] = {}   # live objects: hash -> (offset, length)
+        self.sealed = False
+        self.idx_pos = 0
+        self.dead_pos = 0
+
+
+class PackStore:
+    """Objects by hash in append-only packs (see module docstring). Thread-safe."""
+
+    def __init__(self, root: Path, pack_size: int = PACK_SIZE):
+        self.root = Path(root)
+        self.pack_size = pack_size
+        self._lock = threading.RLock()
+        self._packs: Dict[str, _Pack] = {}
+        self._index: Dict[str, Location] = {}
+        self._maps: Dict[str, mmap.mmap] = {}
+        self._writer: Optional[Tuple[str, int, int]] = None   # pack id, pack fd, index fd
+        self._written = 0           # bytes in the writer's pack
+        self._last_write = 0.0
+        self._refreshed = 0.0
+
+    # ── Reads ─────────────────────────────────────────────────
+    def has(self, chunk_hash: str) -> bool:
+        with self._lock:
+            if chunk_hash not in self._index and \
+                    time.monotonic() - self._refreshed >= REFRESH_INTERVAL:
+                self._refresh()
+            return chunk_hash in self._index
+
+    def locate(self, chunk_hash: str) -> Optional[Location]:
+        """(pack id, offset, length) of an object, re-reading the indexes on a miss."""
+        with self._lock:
+            if chunk_hash not in self._index:
+                self._refresh()
+            return self._index.get(chunk_hash)
+
+    def pack_path(self, pack_id: str) -> Path:
+        return self.root / f"{pack_id}.pack"
+
+    def read(self, chunk_hash: str, start: int = 0, stop: Optional[int] = None) -> Optional[bytes]:
+        """Bytes [start, stop) of an object, None if it is not stored."""
+        with self._lock:
+            for _ in range(2):
+                loc = self.locate(chunk_hash)
+                if loc is None:
+                    return None
+                pack_id, offset, length = loc
+                stop = length if stop is None else min(stop, length)
+                if stop <= start:
+                    return b""
+                try:
+                    mm = self._map(pack_id, offset + length)
+                except FileNotFoundError:
+                    # Compacted away by another process: find where it went
+                    self._drop(pack_id)
+                    continue
+                return mm[offset + start:offset + stop]
+        return None
+
+    def stats(self) -> dict:
+        """Packs, live objects, and live and total bytes, as this process sees them."""
+        with self._lock:
+            self._refresh()
+            total = 0
+            for pack_id in self._packs:
+                try:
+                    total += os.path.getsize(self.pack_path(pack_id))
+                except OSError:
+                    pass
+            return {"packs": len(self._packs), "objects": len(self._index),
+                    "live_bytes": sum(n for _, _, n in self._index.values()),
+                    "total_bytes": total}
+
+    # ── Writes ────────────────────────────────────────────────
+    def put(self, chunk_hash: str, data) -> bool:
+        """Append an object unless it is already stored; True if it was written."""
+        with self._lock:
+            if self.has(chunk_hash):
+                return False
+            self._append(chunk_hash, data)
+            return True
+
+    def delete(self, hashes: Iterable[str]) -> int:
+        """Mark every stored copy of these objects dead; returns how many objects that was."""
+        with self._lock:
+            self._refresh()
+            deleted = 0
+            for chunk_hash in set(hashes):
+                found = False
+                for pack in self._packs.values():
+                    loc = pack.entries.pop(chunk_hash, None)
+                    if loc is None:
+                        continue
+                    found = True
+                    with open(self.root / f"{pack.id}.dead", "a", encoding="ascii") as f:
+                        f.write(f"{chunk_hash} {loc[0]}\n")
+                if self._index.pop(chunk_hash, None) is not None or found:
+                    deleted += 1
+            return deleted
+
+    def compact(self, garbage: float = PACK_COMPACT_GARBAGE, idle: float = PACK_IDLE) -> int:
+        """
+        Rewrite the packs at least `garbage` dead (see module docstring);
+        garbage=0 and idle=0 rewrite every pack but this process's own,
+        which only makes sense with no other process running. Returns the
+        bytes reclaimed; 0 if another process is compacting.
+        """
+        lock = self.root / LOCK_NAME
+        if not self._take_lock(lock):
+            return 0
+        try:
+            with self._lock:
+                self._refresh()
+                reclaimed = 0
+                now = time.time()
+                for pack_id in sorted(self._packs):
+                    if self._writer is not None and pack_id == self._writer[0]:
+                        continue
+                    pack = self._packs[pack_id]
+                    try:
+                        size = os.path.getsize(self.pack_path(pack_id))
+                        touched = os.path.getmtime(self.root / f"{pack_id}.idx")
+                    except OSError:
+                        continue
+                    if not pack.sealed and now - touched < idle:
+                        continue
+                    live = sorted((off, n, h) for h, (off, n) in pack.entries.items()
+                                  if self._index.get(h) == (pack_id, off, n))
+                    dead = size - sum(n for _, n, _ in live)
+                    if size and dead < garbage * size:
+                        continue
+                    for off, n, h in live:
+                        data = self._map(pack_id, off + n)[off:off + n]
+                        del self._index[h]
+                        self._append(h, data)
+                    self._remove(pack_id)
+                    reclaimed += dead
+                self._remove_orphans()
+                return reclaimed
+        finally:
+            lock.unlink(missing_ok=True)
+
+    def close(self):
+        """Seal this process's pack and drop every mapping."""
+        with self._lock:
+            self._seal()
+            for mm in self._maps.values():
+                mm.close()
+            self._maps.clear()
+
+    # ── Internals (lock held) ─────────────────────────────────
+    def _append(self, chunk_hash: str, data):
+        length = len(data)
+        if self._writer is None or (self._written and self._written + length > self.pack_size) \
+                or time.monotonic() - self._last_write > PACK_IDLE / 2:
+            self._seal()
+            self._open_writer()
+        pack_id, pack_fd, idx_fd = self._writer
+        offset = self._written
+        _write_all(pack_fd, data)
+        line = f"{chunk_hash} {offset} {length}\n".encode("ascii")
+        _write_all(idx_fd, line)
+        self._written += length
+        self._last_write = time.monotonic()
+        pack = self._packs[pack_id]
+        pack.entries[chunk_hash] = (offset, length)
+        pack.idx_pos += len(line)
+        self._index.setdefault(chunk_hash, (pack_id, offset, length))
+
+    def _open_writer(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        pack_id = f"{time.time_ns():016x}-{os.getpid()}-{secrets.token_hex(2)}"
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND | _BINARY
+        # The index first: a pack without one is a leftover compaction may remove
+        idx_fd = os.open(self.root / f"{pack_id}.idx", flags, 0o644)
+        pack_fd = os.open(self.pack_path(pack_id), flags, 0o644)
+        self._writer = (pack_id, pack_fd, idx_fd)
+        self._packs[pack_id] = _Pack(pack_id)
+        self._written = 0
+        self._last_write = time.monotonic()
+
+    def _seal(self):
+        if self._writer is None:
+            return
+        pack_id, pack_fd, idx_fd = self._writer
+        line = f"{SEALED}\n".encode("ascii")
+        _write_all(idx_fd, line)
+        os.close(pack_fd)
+        os.close(idx_fd)
+        pack = self._packs.get(pack_id)
+        if pack is not None:
+            pack.sealed = True
+            pack.idx_pos += len(line)
+        self._writer = None
+
+    def _map(self, pack_id: str, needed: int) -> mmap.mmap:
+        """A read-only mapping of a pack covering its first `needed` bytes."""
+        mm = self._maps.get(pack_id)
+        if mm is None or len(mm) < needed:
+            if mm is not None:
+                mm.close()
+                del self._maps[pack_id]
+            with open(self.pack_path(pack_id), "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(mm) < needed:
+                mm.close()
+                raise OSError(f"pack {pack_id} is shorter than its index")
+            self._maps[pack_id] = mm
+        return mm
+
+    def _refresh(self):
+        """Pick up packs, index lines and dead lines other processes wrote; forget removed packs."""
+        self._refreshed = time.monotonic()
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            names = []
+        present = {n[:-4] for n in names if n.endswith(".idx")}
+        for pack_id in [p for p in self._packs if p not in present]:
+            self._drop(pack_id)
+        for pack_id in sorted(present):
+            pack = self._packs.get(pack_id)
+            if pack is None:
+                pack = self._packs[pack_id] = _Pack(pack_id)
+            for line in self._new_lines(pack, "idx"):
+                parts = line.split()
+                if parts == [SEALED]:
+                    pack.sealed = True
+                elif len(parts) == 3 and len(parts[0]) == 64 and parts[1].isdigit() and parts[2].isdigit():
+                    off, n = int(parts[1]), int(parts[2])
+                    pack.entries[parts[0]] = (off, n)
+                    self._index.setdefault(parts[0], (pack_id, off, n))
+            for line in self._new_lines(pack, "dead"):
+                parts = line.split()
+                if len(parts) == 2 and parts[1].isdigit() and \
+                        pack.entries.get(parts[0], (None,))[0] == int(parts[1]):
+                    del pack.entries[parts[0]]
+                    self._relocate(parts[0], pack_id)
+
+    def _new_lines(self, pack: _Pack, kind: str) -> List[str]:
+        """Complete lines appended to a pack's index or dead list since the last call."""
+        attr = "idx_pos" if kind == "idx" else "dead_pos"
+        path = self.root / f"{pack.id}.{kind}"
+        try:
+            if os.path.getsize(path) <= getattr(pack, attr):
+                return []
+            with open(path, "rb") as f:
+                f.seek(getattr(pack, attr))
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        end = data.rfind(b"\n") + 1
+        setattr(pack, attr, getattr(pack, attr) + end)
+        return data[:end].decode("ascii", "replace").splitlines()
+
+    def _relocate(self, chunk_hash: str, pack_id: str):
+        """The index entry for a hash pointed into pack_id: point it at another copy, if any."""
+        loc = self._index.get(chunk_hash)
+        if loc is None or loc[0] != pack_id:
+            return
+        del self._index[chunk_hash]
+        for other in sorted(self._packs):
+            entry = self._packs[other].entries.get(chunk_hash)
+            if other != pack_id and entry is not None:
+                self._index[chunk_hash] = (other,) + entry
+                return
+
+    def _drop(self, pack_id: str):
+        """Forget a pack that is gone."""
+        pack = self._packs.pop(pack_id, None)
+        mm = self._maps.pop(pack_id, None)
+        if mm is not None:
+            mm.close()
+        if pack is not None:
+            for chunk_hash in pack.entries:
+                self._relocate(chunk_hash, pack_id)
+
+    def _remove(self, pack_id: str):
+        self._drop(pack_id)
+        for suffix in ("idx", "dead", "pack"):
+            try:
+                (self.root / f"{pack_id}.{suffix}").unlink(missing_ok=True)
+            except OSError:
+                pass    # mapped elsewhere on Windows; removed as an orphan later
+
+    def _remove_orphans(self):
+        for name in os.listdir(self.root):
+            stem, dot, suffix = name.rpartition(".")
+            if dot and suffix in ("pack", "dead") and not (self.root / f"{stem}.idx").exists():
+                try:
+                    (self.root / name).unlink()
+                except OSError:
+                    pass
+
+    def _take_lock(self, lock: Path) -> bool:
+        self.root.mkdir(parents=True, exist_ok=True)
+        for _ in range(2):
+            try:
+                os.close(os.open(lock, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock) < LOCK_STALE:
+                        return False
+                    lock.unlink()
+                except FileNotFoundError:
+                    pass
+        return False